@@ -0,0 +1,212 @@
+"""
+Just enough of bpy, bmesh, mathutils and bpy_extras to import the repo modules in plain CPython and
+run their NumPy paths on synthetic meshes. Anything that would need real Blender (operators, baking,
+KD-trees) is a no-op or raises NotImplementedError.
+"""
+import sys
+import types
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class FakeMatrix:
+    # 4x4 matrix with the bits of mathutils.Matrix the repo uses
+    def __init__(self, values=None):
+        self.values = np.eye(4) if values is None else np.asarray(values, dtype=np.float64)
+
+    def inverted(self):
+        return FakeMatrix(np.linalg.inv(self.values))
+
+    def __array__(self, dtype=None, copy=None):
+        return self.values if dtype is None else self.values.astype(dtype)
+
+
+class FakeCollection:
+    """
+    bpy_prop_collection stand-in over NumPy arrays, e.g. mesh.vertices or mesh.loops.
+
+    :param length: Number of elements.
+    :param arrays: {attribute name: array with length rows}, read and written by foreach_get/foreach_set.
+    """
+
+    def __init__(self, length, **arrays):
+        self.length = length
+        self.arrays = arrays
+
+    def __len__(self):
+        return self.length
+
+    def foreach_get(self, attribute, out):
+        np.copyto(out, self.arrays[attribute].reshape(-1), casting='unsafe')
+
+    def foreach_set(self, attribute, values):
+        values = np.asarray(values)
+        if attribute not in self.arrays:
+            self.arrays[attribute] = values.copy()
+        else:
+            self.arrays[attribute][...] = values.reshape(self.arrays[attribute].shape)
+
+
+class FakeVertices(FakeCollection):
+    # iterating yields vertices with .index and .groups, read from the current weights of the object's groups
+    def __init__(self, co, vertex_groups):
+        super().__init__(len(co), co=co, select=np.zeros(len(co), dtype=bool))
+        self.vertex_groups = vertex_groups
+
+    def __iter__(self):
+        if self.vertex_groups:
+            members = np.stack([~np.isnan(vertex_group.weights) for vertex_group in self.vertex_groups], axis=1)
+            vertex_ids, group_ids = np.nonzero(members)
+            weights = np.stack([vertex_group.weights for vertex_group in self.vertex_groups], axis=1)[vertex_ids, group_ids]
+        else:
+            vertex_ids = group_ids = weights = np.zeros(0)
+        offsets = np.searchsorted(vertex_ids, np.arange(self.length + 1)).tolist()
+        group_ids = group_ids.tolist()
+        weights = weights.tolist()
+        for index in range(self.length):
+            start, end = offsets[index], offsets[index + 1]
+            groups = [SimpleNamespace(group=g, weight=w) for g, w in zip(group_ids[start:end], weights[start:end])]
+            yield SimpleNamespace(index=index, groups=groups)
+
+
+class FakeVertexGroup:
+    """
+    Vertex group holding one weight per vertex, NaN for vertices outside of the group. add_calls counts the
+    vertex_group.add() calls, each of which is one RNA call in Blender.
+    """
+
+    def __init__(self, name, index, vertex_count):
+        self.name = name
+        self.index = index
+        self.weights = np.full(vertex_count, np.nan, dtype=np.float32)
+        self.add_calls = 0
+
+    def add(self, index, weight, type):
+        self.add_calls += 1
+        index = np.asarray(index, dtype=np.int64)
+        current = np.nan_to_num(self.weights[index])
+        if type == 'ADD':
+            weight = current + weight
+        elif type == 'SUBTRACT':
+            weight = current - weight
+        self.weights[index] = np.clip(weight, 0.0, 1.0)
+
+    def remove(self, index):
+        self.weights[np.asarray(index, dtype=np.int64)] = np.nan
+
+
+class FakeVertexGroups(list):
+    def __init__(self, names, vertex_count):
+        super().__init__(FakeVertexGroup(name, index, vertex_count) for index, name in enumerate(names))
+        self.vertex_count = vertex_count
+        self.active = self[0] if self else None
+
+    def get(self, name):
+        return next((vertex_group for vertex_group in self if vertex_group.name == name), None)
+
+    def new(self, name="Group"):
+        vertex_group = FakeVertexGroup(name, len(self), self.vertex_count)
+        self.append(vertex_group)
+        return vertex_group
+
+
+def make_mesh_object(name, mesh_data, group_names=(), vertex_groups=None):
+    """
+    Builds a mesh object from synthetic_meshes arrays and registers it in bpy.data.objects.
+
+    :param mesh_data: Dict with "co", "edges", "loop_starts", "loop_totals", "loop_vertices" and "loop_uvs".
+    :param vertex_groups: Per vertex CSR weights ("offsets", "groups", "weights"), empty when omitted.
+    """
+    vertex_count = len(mesh_data["co"])
+    if vertex_groups is None:
+        vertex_groups = {
+            "offsets": np.zeros(vertex_count + 1, dtype=np.int64),
+            "groups": np.zeros(0, dtype=np.int32),
+            "weights": np.zeros(0, dtype=np.float32),
+        }
+    vertex_group_list = FakeVertexGroups(group_names, vertex_count)
+    vertex_ids = np.repeat(np.arange(vertex_count), np.diff(vertex_groups["offsets"]))
+    for group_index, vertex_group in enumerate(vertex_group_list):
+        in_group = vertex_groups["groups"] == group_index
+        vertex_group.weights[vertex_ids[in_group]] = vertex_groups["weights"][in_group]
+    loop_count = len(mesh_data["loop_vertices"])
+    uv_layer = SimpleNamespace(name="UVMap", data=FakeCollection(loop_count, uv=mesh_data["loop_uvs"]))
+    mesh = SimpleNamespace(
+        name=name,
+        vertices=FakeVertices(mesh_data["co"], vertex_group_list),
+        edges=FakeCollection(len(mesh_data["edges"]), vertices=mesh_data["edges"]),
+        loops=FakeCollection(loop_count, vertex_index=mesh_data["loop_vertices"]),
+        polygons=FakeCollection(
+            len(mesh_data["loop_starts"]), loop_start=mesh_data["loop_starts"], loop_total=mesh_data["loop_totals"]
+        ),
+        uv_layers=SimpleNamespace(active=uv_layer),
+    )
+    obj = SimpleNamespace(
+        name=name, type='MESH', mode='OBJECT', data=mesh, matrix_world=FakeMatrix(),
+        vertex_groups=vertex_group_list,
+    )
+    sys.modules["bpy"].data.objects[name] = obj
+    return obj
+
+
+class _Operators:
+    # bpy.ops.<module>.<operator>(...) does nothing and reports success
+    def __getattr__(self, name):
+        return _OperatorModule()
+
+
+class _OperatorModule:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: {'FINISHED'}
+
+
+def _not_available(name):
+    def raise_not_available(*args, **kwargs):
+        raise NotImplementedError(f"{name} needs Blender, the benchmark stand-in does not provide it.")
+    return raise_not_available
+
+
+def install():
+    """
+    Registers the stand-in modules in sys.modules. Must run before the repo modules are imported.
+    """
+    if "bpy" in sys.modules:
+        return sys.modules["bpy"]
+
+    bpy = types.ModuleType("bpy")
+    bpy.data = SimpleNamespace(objects={}, materials=[], images=[], meshes=[])
+    bpy.context = SimpleNamespace(
+        object=None, scene=None, view_layer=SimpleNamespace(objects=SimpleNamespace(active=None))
+    )
+    bpy.ops = _Operators()
+    bpy.types = SimpleNamespace()
+    bpy.path = SimpleNamespace(abspath=lambda path: path)
+
+    mathutils = types.ModuleType("mathutils")
+    mathutils.Vector = lambda values=(0.0, 0.0, 0.0): np.array(values, dtype=np.float64)
+    mathutils.Euler = _not_available("mathutils.Euler")
+    mathutils.Matrix = FakeMatrix
+    kdtree = types.ModuleType("mathutils.kdtree")
+    kdtree.KDTree = _not_available("mathutils.kdtree.KDTree")
+    bvhtree = types.ModuleType("mathutils.bvhtree")
+    bvhtree.BVHTree = SimpleNamespace(FromPolygons=_not_available("mathutils.bvhtree.BVHTree"))
+    mathutils.kdtree = kdtree
+    mathutils.bvhtree = bvhtree
+
+    bmesh = types.ModuleType("bmesh")
+    bpy_extras = types.ModuleType("bpy_extras")
+    mesh_utils = types.ModuleType("bpy_extras.mesh_utils")
+    mesh_utils.mesh_linked_uv_islands = _not_available("bpy_extras.mesh_utils.mesh_linked_uv_islands")
+    bpy_extras.mesh_utils = mesh_utils
+
+    sys.modules.update({
+        "bpy": bpy,
+        "bmesh": bmesh,
+        "mathutils": mathutils,
+        "mathutils.kdtree": kdtree,
+        "mathutils.bvhtree": bvhtree,
+        "bpy_extras": bpy_extras,
+        "bpy_extras.mesh_utils": mesh_utils,
+    })
+    return bpy
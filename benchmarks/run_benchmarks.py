@@ -0,0 +1,438 @@
+"""
+Times the hot paths of the sticker pipeline on synthetic meshes, in plain CPython without Blender.
+
+python benchmarks/run_benchmarks.py --vertices 250000 --groups 64 --output results.json
+python benchmarks/run_benchmarks.py --output new.json --compare results.json
+
+Every stage reports its best time over --repeat runs, throughput in items per second, the peak
+memory traced by tracemalloc during one extra run and, where there is a ground truth, the error.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCHMARK_DIR.parent
+sys.path.append(str(BENCHMARK_DIR))
+sys.path.append(str(REPO_DIR / "blender"))
+sys.path.append(str(REPO_DIR / "preprocess_textures"))
+sys.path.append(str(REPO_DIR))
+
+import fake_blender
+
+fake_blender.install()
+
+import synthetic_meshes
+import weight_core
+import create_sticker
+import image_io
+import sticker_reader
+import mesh_io
+import hair
+
+
+def measure(stage, repeat):
+    """
+    :param stage: Callable returning (items processed, extra result fields).
+    :return: Dict with the timings, throughput, peak memory and the extra fields of the last run.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items, extra = stage()
+        times.append(time.perf_counter() - start)
+
+    # a separate run, tracemalloc slows down allocations too much to time under it
+    tracemalloc.start()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(times)
+    result = {
+        "seconds": best,
+        "median_seconds": statistics.median(times),
+        "items": items,
+        "items_per_second": items / best if best > 0 else None,
+        "peak_memory_mb": peak / 2 ** 20,
+    }
+    result.update(extra)
+    return result
+
+
+def error_stats(values, truth):
+    error = np.abs(np.asarray(values, dtype=np.float64) - np.asarray(truth, dtype=np.float64))
+    return {"max_error": float(error.max()) if error.size else 0.0, "mean_error": float(error.mean()) if error.size else 0.0}
+
+
+def stage_extract_groups(args):
+    mesh_data = synthetic_meshes.grid_mesh(args.vertices)
+    vertex_groups = synthetic_meshes.blob_group_weights(mesh_data["co"], args.groups)
+    group_names = [f"Group_{index}" for index in range(args.groups)]
+    fake_blender.make_mesh_object("BenchmarkGrid", mesh_data, group_names, vertex_groups)
+
+    def stage():
+        group_weights = create_sticker.extract_group_weights("BenchmarkGrid")
+        # rebuild the dense matrix from the CSR layout to check it
+        dense = np.zeros_like(vertex_groups["dense"])
+        for column, name in enumerate(group_weights["names"]):
+            indices, weights = weight_core.get_group_weights(group_weights, name)
+            dense[indices, column] = weights
+        return len(vertex_groups["weights"]), error_stats(dense, vertex_groups["dense"])
+    return stage
+
+
+def stage_group_statistics(args):
+    mesh_data = synthetic_meshes.grid_mesh(args.vertices)
+    vertex_groups = synthetic_meshes.blob_group_weights(mesh_data["co"], args.groups)
+    vertex_ids = np.repeat(np.arange(len(mesh_data["co"])), np.diff(vertex_groups["offsets"]))
+    offsets, indices, weights = weight_core.build_group_csr(
+        vertex_groups["groups"], vertex_ids, vertex_groups["weights"], args.groups
+    )
+    group_weights = {
+        "names": [f"Group_{index}" for index in range(args.groups)],
+        "offsets": offsets,
+        "indices": indices,
+        "weights": weights,
+        "world": mesh_data["co"].astype(np.float64),
+    }
+    dense = vertex_groups["dense"].astype(np.float64)
+    truth = dense.T @ group_weights["world"] / dense.sum(axis=0)[:, None]
+
+    def stage():
+        statistics = weight_core.get_group_statistics(group_weights, principal_axes=True)
+        return len(weights), error_stats(statistics["centroids"], truth)
+    return stage
+
+
+def stage_encode_colormap(args):
+    weights = np.random.default_rng(1).random(args.samples, dtype=np.float32)
+
+    def stage():
+        weight_core.encode_weights(weights, "COLORMAP")
+        return len(weights), {}
+    return stage
+
+
+def stage_rasterize(args):
+    mesh_data = synthetic_meshes.uv_sphere(args.vertices)
+    triangles = synthetic_meshes.loop_triangles(mesh_data)
+    # the weight is the V coordinate, so every covered pixel knows its exact value
+    loop_weights = mesh_data["loop_uvs"][:, 1]
+    resolution = args.resolution
+    expected = ((np.arange(resolution) + 0.5) / resolution)[:, None].repeat(resolution, axis=1)
+
+    def stage():
+        weight_image, covered = weight_core.rasterize_uv_weights(
+            mesh_data["loop_uvs"], triangles, loop_weights, resolution
+        )
+        weight_core.dilate_weight_image(weight_image, covered, 2)
+        extra = error_stats(weight_image[covered], expected[covered])
+        extra["coverage"] = float(covered.mean())
+        return len(triangles), extra
+    return stage
+
+
+def stage_rasterize_packed(args, pack_size=4):
+    # pack_size groups in one pass over the triangles, each channel holds its own function of V
+    mesh_data = synthetic_meshes.uv_sphere(args.vertices)
+    triangles = synthetic_meshes.loop_triangles(mesh_data)
+    scales = np.linspace(1.0, 0.25, pack_size, dtype=np.float32)
+    loop_weights = mesh_data["loop_uvs"][:, 1:2] * scales
+    resolution = args.resolution
+    expected = ((np.arange(resolution) + 0.5) / resolution)[:, None].repeat(resolution, axis=1)[:, :, None] * scales
+
+    def stage():
+        weight_image = weight_core.render_packed_pixels(mesh_data["loop_uvs"], triangles, loop_weights, resolution, 0)
+        covered = weight_image[:, :, 0] > 0
+        return len(triangles) * pack_size, error_stats(weight_image[covered], expected[covered])
+    return stage
+
+
+def smooth_image(resolution, channels=4):
+    # f(u, v) = (sin(2 pi u) * cos(2 pi v) + 1) / 2 at the pixel centers, in every channel
+    centers = (np.arange(resolution) + 0.5) / resolution
+    u, v = np.meshgrid(centers, centers)
+    values = ((np.sin(2 * np.pi * u) * np.cos(2 * np.pi * v) + 1) / 2).astype(np.float32)
+    return np.repeat(values[:, :, None], channels, axis=2)
+
+
+def stage_sample_uvs(args, mode):
+    pixels = smooth_image(args.resolution)
+    # stay half a pixel inside the border where clamping changes the value
+    margin = 0.5 / args.resolution
+    uvs = np.random.default_rng(2).uniform(margin, 1.0 - margin, (args.samples, 2)).astype(np.float32)
+    truth = (np.sin(2 * np.pi * uvs[:, 0]) * np.cos(2 * np.pi * uvs[:, 1]) + 1) / 2
+
+    def stage():
+        samples = weight_core.sample_image_at_uvs(pixels, uvs, mode)
+        return len(uvs), error_stats(samples[:, 0], truth)
+    return stage
+
+
+# the ramp convert_to_weights.sample_weight_ramp() decodes real stickers against
+PRODUCTION_RAMP_POSITIONS = (0.09, 0.5, 0.75)
+PRODUCTION_RAMP_COLORS = ((0.0, 0.0, 1.0), (0.0, 1.0, 0.0), (1.0, 0.0, 0.0))
+
+
+def bspline_ramp_colors(weights, positions, colors):
+    """
+    NumPy version of Blender's B_SPLINE ColorRamp evaluation: a uniform cubic B-spline over the stops, the
+    first and last stop repeated at 0.0 and 1.0.
+
+    :return: (N, 3) float32 colors.
+    """
+    weights = np.clip(np.asarray(weights, dtype=np.float64).ravel(), 0.0, 1.0)
+    colors = np.asarray(colors, dtype=np.float64)
+    stop_positions = np.concatenate(([0.0], positions, [1.0]))
+    stop_colors = np.concatenate((colors[:1], colors, colors[-1:]))
+    # the stops left and right of each weight, and one more stop on either side
+    right = np.searchsorted(np.asarray(positions), weights, side='right') + 1
+    left = right - 1
+    outer_left = np.maximum(left - 1, 0)
+    outer_right = np.minimum(right + 1, len(stop_positions) - 1)
+
+    span = stop_positions[left] - stop_positions[right]
+    t = np.clip(np.divide(weights - stop_positions[right], span, out=np.zeros_like(weights), where=span != 0), 0.0, 1.0)
+    # t runs from the right stop (0.0) to the left one (1.0)
+    t2 = t * t
+    t3 = t2 * t
+    blended = (
+        ((1.0 - t) ** 3 / 6)[:, None] * stop_colors[outer_right]
+        + (0.5 * t3 - t2 + 2 / 3)[:, None] * stop_colors[right]
+        + (-0.5 * t3 + 0.5 * t2 + 0.5 * t + 1 / 6)[:, None] * stop_colors[left]
+        + (t3 / 6)[:, None] * stop_colors[outer_left]
+    )
+    return np.clip(blended, 0.0, 1.0).astype(np.float32)
+
+
+def stage_decode(args, lut_size):
+    # decode against the same B_SPLINE ramp, sampled the same way, as convert_to_weights does inside Blender
+    ramp_weights = np.linspace(0.0, 1.0, 101, dtype=np.float32)
+    ramp_colors = bspline_ramp_colors(ramp_weights, PRODUCTION_RAMP_POSITIONS, PRODUCTION_RAMP_COLORS)
+    decoder = weight_core.RgbWeightDecoder(ramp_weights, ramp_colors, weight_core.OFF_RAMP_COLORS, lut_size=lut_size)
+    weights = np.random.default_rng(3).random(args.samples, dtype=np.float32)
+    colors = bspline_ramp_colors(weights, PRODUCTION_RAMP_POSITIONS, PRODUCTION_RAMP_COLORS)
+
+    def stage():
+        return len(colors), error_stats(decoder.decode(colors), weights)
+    return stage
+
+
+def stage_gradients(args):
+    # real writes into existing groups, the MULTIPLY spec also reads the current weights of its group
+    mesh_data = synthetic_meshes.uv_sphere(args.vertices)
+    group_names = ["Linear", "Radial"]
+    obj = fake_blender.make_mesh_object(
+        "BenchmarkSphere", mesh_data, group_names, synthetic_meshes.blob_group_weights(mesh_data["co"], len(group_names))
+    )
+    specs = [
+        {"group": "Linear", "start": (0.0, 0.0, -1.0), "end": (0.0, 0.0, 1.0)},
+        {"group": "Radial", "start": (0.0, 0.0, 1.0), "end": (0.0, 0.0, 0.0), "shape": 'RADIAL', "falloff": 'SMOOTH'},
+        {"group": "Radial", "start": (-1.0, 0.0, 0.0), "end": (1.0, 0.0, 0.0), "mix": 'MULTIPLY', "flip": True},
+    ]
+    # ground truth of the first spec: z mapped from -1..1 to 0..1
+    truth = (mesh_data["co"][:, 2] + 1.0) / 2.0
+
+    def stage():
+        hair.apply_weight_gradients("BenchmarkSphere", specs)
+        add_calls = 0
+        for vertex_group in obj.vertex_groups:
+            add_calls += vertex_group.add_calls
+            vertex_group.add_calls = 0
+        return len(mesh_data["co"]) * len(specs), dict(
+            error_stats(obj.vertex_groups.get("Linear").weights, truth), add_calls=add_calls
+        )
+    return stage
+
+
+def stage_write_weights(args, steps):
+    # a real write through vertex_group.add(), the stand-in counts the calls Blender would make over RNA
+    mesh_data = synthetic_meshes.grid_mesh(args.vertices)
+    obj = fake_blender.make_mesh_object("BenchmarkWrite", mesh_data)
+    co = mesh_data["co"]
+    weights = ((np.sin(3 * co[:, 0]) * np.cos(3 * co[:, 1]) + 1) / 2).astype(np.float32)
+    vertex_indices = np.arange(len(co))
+
+    def stage():
+        mesh_io.write_vertex_group_weights(obj, "Written", vertex_indices, weights, 'REPLACE', steps)
+        vertex_group = obj.vertex_groups.get("Written")
+        add_calls = vertex_group.add_calls
+        vertex_group.add_calls = 0
+        return len(co), dict(error_stats(vertex_group.weights, weights), add_calls=add_calls)
+    return stage
+
+
+def stage_hair_strands(args):
+    mesh_data = synthetic_meshes.hair_bundle(args.strands)
+    vertex_count = len(mesh_data["co"])
+    vertex_v = np.full(vertex_count, -np.inf, dtype=np.float32)
+    np.maximum.at(vertex_v, mesh_data["loop_vertices"], mesh_data["loop_uvs"][:, 1])
+    truth_ids = np.arange(vertex_count) // (vertex_count // args.strands)
+
+    def stage():
+        strand_ids = weight_core.label_strands(mesh_data["edges"], vertex_count)
+        weight_core.strand_gradient_weights(strand_ids, vertex_v, 0.5)
+        # strand ids are numbered by their lowest vertex, which is the generation order here
+        return vertex_count, {"mislabelled_vertices": int((strand_ids != truth_ids).sum())}
+    return stage
+
+
+def stage_layer_masks(args):
+    try:
+        import get_layer_data
+    except ImportError as e:
+        return None, f"skipped, {e}"
+    rng = np.random.default_rng(4)
+    pixels = rng.integers(0, 256, (args.resolution, args.resolution, 3), dtype=np.uint8)
+    pixels[: args.resolution // 2] = 0
+    truth = ~np.all(pixels == 0, axis=2) & ~np.all(pixels == [0, 0, 255], axis=2)
+
+    def stage():
+        mask = get_layer_data.get_layer_mask(pixels)
+        np.packbits(mask, axis=1)
+        return mask.size, {"wrong_pixels": int((mask != truth).sum())}
+    return stage, None
+
+
+def stage_write_sticker(args, sticker_format, output_dir):
+    pixels = smooth_image(args.resolution)
+    output_path = Path(output_dir) / f"benchmark{image_io.STICKER_FORMATS[sticker_format]['extension']}"
+
+    def stage():
+        image_io.write_sticker_image(output_path, pixels, sticker_format)
+        return pixels.shape[0] * pixels.shape[1], {"file_size_mb": output_path.stat().st_size / 2 ** 20}
+    return stage
+
+
+def stage_sample_sticker_file(args, sticker_format, output_dir):
+    # the written file is sampled without decoding all of it, peak memory stays near one chunk
+    pixels = smooth_image(args.resolution)
+    output_path = Path(output_dir) / f"sampled{image_io.STICKER_FORMATS[sticker_format]['extension']}"
+    image_io.write_sticker_image(output_path, pixels, sticker_format)
+    del pixels
+    margin = 0.5 / args.resolution
+    uvs = np.random.default_rng(3).uniform(margin, 1.0 - margin, (args.samples, 2)).astype(np.float32)
+    truth = (np.sin(2 * np.pi * uvs[:, 0]) * np.cos(2 * np.pi * uvs[:, 1]) + 1) / 2
+
+    def stage():
+        samples = sticker_reader.sample_sticker_file(output_path, uvs, 'BILINEAR')
+        return len(uvs), error_stats(samples[:, 0], truth)
+    return stage
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args):
+    output_dir = tempfile.mkdtemp(prefix="sticker_benchmark_")
+    stages = {
+        "extract_groups": lambda: stage_extract_groups(args),
+        "group_statistics": lambda: stage_group_statistics(args),
+        "encode_colormap": lambda: stage_encode_colormap(args),
+        "rasterize_uv_weights": lambda: stage_rasterize(args),
+        "rasterize_packed_rgba": lambda: stage_rasterize_packed(args),
+        "sample_uvs_nearest": lambda: stage_sample_uvs(args, 'NEAREST'),
+        "sample_uvs_bilinear": lambda: stage_sample_uvs(args, 'BILINEAR'),
+        "decode_projection": lambda: stage_decode(args, None),
+        "decode_lut": lambda: stage_decode(args, 64),
+        "gradients": lambda: stage_gradients(args),
+        "write_weights_exact": lambda: stage_write_weights(args, None),
+        "write_weights_16bit": lambda: stage_write_weights(args, mesh_io.WEIGHT_STEPS),
+        "write_weights_colormap": lambda: stage_write_weights(args, image_io.STICKER_FORMATS["COLORMAP_EXR"]["weight_steps"]),
+        "hair_strands": lambda: stage_hair_strands(args),
+        "layer_masks": lambda: stage_layer_masks(args),
+        "write_weight_exr": lambda: stage_write_sticker(args, "WEIGHT_EXR_FLOAT", output_dir),
+        "write_weight_png16": lambda: stage_write_sticker(args, "WEIGHT_PNG16", output_dir),
+        "sample_weight_exr_file": lambda: stage_sample_sticker_file(args, "WEIGHT_EXR_FLOAT", output_dir),
+        "sample_weight_png16_file": lambda: stage_sample_sticker_file(args, "WEIGHT_PNG16", output_dir),
+    }
+
+    results = {}
+    for name, make_stage in stages.items():
+        if args.stages and name not in args.stages:
+            continue
+        stage = make_stage()
+        skip_reason = None
+        # stages with optional dependencies return (stage or None, skip reason)
+        if isinstance(stage, tuple):
+            stage, skip_reason = stage
+        if stage is None:
+            print(f"{name:<24} {skip_reason}")
+            results[name] = {"skipped": skip_reason}
+            continue
+        results[name] = measure(stage, args.repeat)
+        print(format_result(name, results[name]))
+
+    return {
+        "meta": {
+            "commit": get_git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.platform(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "stages": results,
+    }
+
+
+def format_result(name, result):
+    line = f"{name:<24} {result['seconds'] * 1000:10.2f} ms {result['items_per_second']:14,.0f} items/s {result['peak_memory_mb']:9.1f} MB"
+    if "max_error" in result:
+        line += f"   max error {result['max_error']:.2e}"
+    if "add_calls" in result:
+        line += f"   {result['add_calls']:,} add() calls"
+    return line
+
+
+def compare_results(old, new):
+    # speedup > 1 means the new run is faster
+    print(f"\nCompared with {old['meta'].get('commit')}:")
+    for name, result in new["stages"].items():
+        previous = old["stages"].get(name)
+        if not previous or "seconds" not in previous or "seconds" not in result:
+            continue
+        speedup = previous["seconds"] / result["seconds"]
+        memory = result["peak_memory_mb"] - previous["peak_memory_mb"]
+        print(f"{name:<24} {speedup:6.2f}x speed {memory:+9.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the weight sticker pipeline on synthetic meshes.")
+    parser.add_argument("--vertices", type=int, default=100000, help="vertex count of the grid and sphere meshes")
+    parser.add_argument("--groups", type=int, default=32, help="vertex groups on the grid mesh")
+    parser.add_argument("--strands", type=int, default=5000, help="strands in the hair bundle")
+    parser.add_argument("--samples", type=int, default=1000000, help="colors or UVs per encode, decode and sample stage")
+    parser.add_argument("--resolution", type=int, default=2048, help="image resolution")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best one is reported")
+    parser.add_argument("--stages", nargs="*", help="only run these stages")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+    if args.compare:
+        with open(args.compare, "r") as file:
+            compare_results(json.load(file), results)
+
+
+if __name__ == "__main__":
+    main()
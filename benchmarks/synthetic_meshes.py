@@ -0,0 +1,120 @@
+"""
+Procedural meshes for the benchmarks, as the flat arrays the repo reads with foreach_get:
+"co" (V, 3), "edges" (E, 2), "loop_starts" / "loop_totals" per face, "loop_vertices" and
+"loop_uvs" (L, 2) per face corner.
+"""
+import numpy as np
+
+
+def quad_mesh(co, quads, quad_uvs):
+    # assembles a mesh of quads, quad_uvs holds the (4, 2) UVs of every quad corner
+    quads = np.asarray(quads, dtype=np.int32).reshape(-1, 4)
+    edges = np.concatenate([quads[:, [0, 1]], quads[:, [1, 2]], quads[:, [2, 3]], quads[:, [3, 0]]])
+    edges = np.unique(np.sort(edges, axis=1), axis=0)
+    return {
+        "co": np.asarray(co, dtype=np.float32).reshape(-1, 3),
+        "edges": edges.astype(np.int32),
+        "loop_starts": np.arange(0, 4 * len(quads), 4, dtype=np.int32),
+        "loop_totals": np.full(len(quads), 4, dtype=np.int32),
+        "loop_vertices": quads.ravel(),
+        "loop_uvs": np.asarray(quad_uvs, dtype=np.float32).reshape(-1, 2),
+    }
+
+
+def grid_vertices_and_quads(columns, rows):
+    # (columns + 1) x (rows + 1) vertices on the unit square, with their quads
+    u, v = np.meshgrid(np.linspace(0.0, 1.0, columns + 1), np.linspace(0.0, 1.0, rows + 1))
+    index = np.arange((columns + 1) * (rows + 1)).reshape(rows + 1, columns + 1)
+    quads = np.stack([index[:-1, :-1], index[:-1, 1:], index[1:, 1:], index[1:, :-1]], axis=-1).reshape(-1, 4)
+    return u.ravel(), v.ravel(), quads
+
+
+def grid_mesh(vertex_count):
+    """
+    Flat square grid with roughly vertex_count vertices, UVs equal to its XY coordinates.
+    """
+    side = max(int(round(np.sqrt(vertex_count))) - 1, 1)
+    u, v, quads = grid_vertices_and_quads(side, side)
+    uvs = np.stack([u, v], axis=1)
+    co = np.stack([u, v, np.zeros_like(u)], axis=1)
+    return quad_mesh(co, quads, uvs[quads])
+
+
+def uv_sphere(vertex_count):
+    """
+    UV sphere with roughly vertex_count vertices. The seam and poles keep duplicate vertices so
+    every quad has plain equirectangular UVs.
+    """
+    rings = max(int(round(np.sqrt(vertex_count / 2))) - 1, 2)
+    segments = 2 * rings
+    u, v, quads = grid_vertices_and_quads(segments, rings)
+    theta = u * 2 * np.pi
+    phi = v * np.pi
+    co = np.stack([np.sin(phi) * np.cos(theta), np.sin(phi) * np.sin(theta), -np.cos(phi)], axis=1)
+    uvs = np.stack([u, v], axis=1)
+    return quad_mesh(co, quads, uvs[quads])
+
+
+def hair_bundle(strand_count, segments=16, seed=0):
+    """
+    Hair cards: strand_count separate quad strips hanging down from random roots, V running from
+    1.0 at the root to 0.0 at the tip like the hair meshes paint_hair_top is written for.
+    """
+    rng = np.random.default_rng(seed)
+    roots = rng.uniform(-1.0, 1.0, (strand_count, 3))
+    width = 0.02
+    t = np.linspace(0.0, 1.0, segments + 1)
+    # (strand, segment point, side) vertices
+    co = np.empty((strand_count, segments + 1, 2, 3))
+    co[:, :, :, :] = roots[:, None, None, :]
+    co[:, :, 1, 0] += width
+    co[:, :, :, 2] -= t[None, :, None]
+    co = co.reshape(-1, 3)
+
+    per_strand = 2 * (segments + 1)
+    base = (np.arange(strand_count) * per_strand)[:, None]
+    point = 2 * np.arange(segments)[None, :]
+    quads = np.stack([base + point, base + point + 1, base + point + 3, base + point + 2], axis=-1).reshape(-1, 4)
+
+    # every strand gets its own column of the UV square
+    column = (np.arange(strand_count) % 64) / 64.0
+    uvs = np.empty((strand_count, segments + 1, 2, 2))
+    uvs[:, :, 0, 0] = column[:, None]
+    uvs[:, :, 1, 0] = column[:, None] + 1.0 / 64.0
+    uvs[:, :, :, 1] = 1.0 - t[None, :, None]
+    uvs = uvs.reshape(-1, 2)
+    return quad_mesh(co, quads, uvs[quads])
+
+
+def blob_group_weights(co, group_count, seed=0, radius=0.35):
+    """
+    Smooth weight blobs around random vertices, so vertices sit in several overlapping groups like
+    on a skinned mesh.
+
+    :return: Per vertex CSR weights: "offsets" (V + 1,), "groups" and "weights", plus the dense
+        (V, group_count) float32 "dense" matrix as ground truth.
+    """
+    rng = np.random.default_rng(seed)
+    co = np.asarray(co, dtype=np.float64)
+    extent = np.ptp(co, axis=0).max() or 1.0
+    centers = co[rng.integers(0, len(co), group_count)]
+    dense = np.zeros((len(co), group_count), dtype=np.float32)
+    for group, center in enumerate(centers):
+        distance = np.linalg.norm(co - center, axis=1) / (radius * extent)
+        dense[:, group] = np.clip(1.0 - distance, 0.0, 1.0)
+
+    vertex_ids, group_ids = np.nonzero(dense)
+    offsets = np.zeros(len(co) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(vertex_ids, minlength=len(co)), out=offsets[1:])
+    return {
+        "offsets": offsets,
+        "groups": group_ids.astype(np.int32),
+        "weights": dense[vertex_ids, group_ids],
+        "dense": dense,
+    }
+
+
+def loop_triangles(mesh_data):
+    # (T, 3) loop indices of the quads split into two triangles, like mesh.loop_triangles
+    starts = mesh_data["loop_starts"][:, None]
+    return np.concatenate([starts + [0, 1, 2], starts + [0, 2, 3]]).astype(np.int32)
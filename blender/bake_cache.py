@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+MANIFEST_NAME = "sticker_manifest.json"
+
+
+def hash_arrays(*arrays):
+    # dtype and shape are part of the hash so a reinterpreted buffer never matches
+    digest = hashlib.sha1()
+    for array in arrays:
+        digest.update(array.dtype.str.encode())
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def hash_settings(settings):
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def group_bake_key(base_key, vertex_indices, weights):
+    """
+    Cache key of one group bake.
+
+    :param base_key: Hash of everything the groups share (mesh topology, UVs, bake settings).
+    :param vertex_indices: Vertex indices of the group.
+    :param weights: Weights of the group.
+    """
+    return hashlib.sha1((base_key + hash_arrays(vertex_indices, weights)).encode()).hexdigest()
+
+
+def read_manifest(path):
+    if not Path(path).exists():
+        return {}
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def write_manifest(path, entries):
+    # write to a temporary file first so an interrupted run never leaves half a manifest
+    temp_path = Path(str(path) + ".tmp")
+    with open(temp_path, "w") as file:
+        json.dump(entries, file, indent=4, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+class BakeManifest:
+    """
+    Remembers which cache key every sticker in an output directory was baked with, stored as
+    sticker_manifest.json next to the stickers.
+
+    :param output_dir: Directory holding the stickers.
+    :param shard: When set, changes are written to sticker_manifest.<shard>.json instead, so parallel
+        workers never write the same file. merge_shard_manifests() folds them back in.
+    """
+
+    def __init__(self, output_dir, shard=None):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / MANIFEST_NAME
+        self.entries = read_manifest(self.path)
+        self.shard = shard
+        # None marks a removed entry
+        self.changes = {}
+
+    def is_fresh(self, group_name, key, output_path):
+        entry = self.entries.get(group_name)
+        return entry is not None and entry["key"] == key and Path(output_path).exists()
+
+    def invalidate(self, group_name, keep_file=False):
+        # removes the outdated sticker so a failed re-bake can not leave it behind, unless another entry
+        # still points at it (a packed sticker) or keep_file leaves it to remove_unreferenced()
+        entry = self.entries.pop(group_name, None)
+        if entry is None:
+            return
+        self.changes[group_name] = None
+        if keep_file or any(other["file"] == entry["file"] for other in self.entries.values()):
+            return
+        stale_path = self.output_dir / entry["file"]
+        if stale_path.exists():
+            stale_path.unlink()
+        # the sticker format header next to it
+        header_path = stale_path.with_suffix(".json")
+        if header_path.exists():
+            header_path.unlink()
+
+    def record(self, group_name, key, output_path):
+        entry = {"key": key, "file": Path(output_path).name}
+        self.entries[group_name] = entry
+        self.changes[group_name] = entry
+
+    def remove_stale(self, current_group_names):
+        # stickers of groups that no longer exist (or have no weights anymore)
+        current_group_names = set(current_group_names)
+        for group_name in [name for name in self.entries if name not in current_group_names]:
+            self.invalidate(group_name)
+
+    def remove_unreferenced(self, pattern):
+        # stickers matching pattern that no entry points at anymore, e.g. packs left over by sharded workers
+        referenced = {entry["file"] for entry in self.entries.values()}
+        for path in sorted(self.output_dir.glob(pattern)):
+            if path.suffix == ".json" or path.name in referenced:
+                continue
+            path.unlink()
+            header_path = path.with_suffix(".json")
+            if header_path.exists():
+                header_path.unlink()
+
+    def save(self):
+        if self.shard is None:
+            write_manifest(self.path, self.entries)
+        else:
+            write_manifest(self.output_dir / f"sticker_manifest.{self.shard}.json", self.changes)
+
+
+def merge_shard_manifests(output_dir):
+    """
+    Folds the changes of every sharded worker into sticker_manifest.json and deletes the shard files.
+
+    :return: The merged BakeManifest.
+    """
+    manifest = BakeManifest(output_dir)
+    for shard_path in sorted(Path(output_dir).glob("sticker_manifest.*.json")):
+        for group_name, entry in read_manifest(shard_path).items():
+            if entry is None:
+                manifest.entries.pop(group_name, None)
+            else:
+                manifest.entries[group_name] = entry
+        shard_path.unlink()
+    manifest.save()
+    return manifest
@@ -0,0 +1,188 @@
+"""
+Bakes the weight stickers of a mesh in parallel across several headless Blender instances.
+Runs with plain Python, every worker is a `blender --background` process that opens the .blend
+(it is never saved) and runs create_sticker.py on its share of the vertex groups.
+
+python bake_runner.py --blend head.blend --output-dir E:/MODS/scripts/EXAMPLE --backend RASTER
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from bake_cache import merge_shard_manifests
+from sticker_format import write_sticker_index
+
+CREATE_STICKER_SCRIPT = Path(__file__).resolve().parent / "create_sticker.py"
+
+
+def blender_command(blender, blend_file, script_args):
+    return [
+        blender, "--background", str(blend_file),
+        # a python error exits with 1 instead of 0
+        "--python-exit-code", "1",
+        "--python", str(CREATE_STICKER_SCRIPT),
+        "--",
+    ] + script_args
+
+
+def list_groups(blender, blend_file, mesh_name, work_dir, mirror_side=None):
+    # returns {group name: vertex count} for every group with weights that gets baked
+    groups_path = Path(work_dir) / "groups.json"
+    script_args = ["--mesh", mesh_name, "--list-groups", str(groups_path)]
+    if mirror_side:
+        script_args += ["--mirror-side", mirror_side]
+    command = blender_command(blender, blend_file, script_args)
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    with open(groups_path, "r") as file:
+        return json.load(file)
+
+
+def shard_groups(group_sizes, worker_count):
+    """
+    Splits the groups into worker_count shards of roughly equal work, largest group first onto
+    the least loaded shard.
+
+    :param group_sizes: Dict of {group name: vertex count}.
+    :return: List of group name lists, empty shards are dropped.
+    """
+    shards = [[] for _ in range(worker_count)]
+    loads = [0] * worker_count
+    for name in sorted(group_sizes, key=group_sizes.get, reverse=True):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(name)
+        loads[lightest] += group_sizes[name]
+    return [shard for shard in shards if shard]
+
+
+def run_workers(blender, blend_file, mesh_name, output_dir, backend, sticker_format, shards, work_dir, exr_codec=None,
+                profile_dir=None, mirror_side=None, resolution_settings=None, pack=None, pack_size=None):
+    """
+    Starts one Blender per shard and waits for all of them.
+
+    :return: Dict of {group name: result}, groups of a crashed worker are reported as errors.
+    """
+    workers = []
+    for worker_index, shard in enumerate(shards):
+        groups_path = Path(work_dir) / f"shard_{worker_index}.json"
+        report_path = Path(work_dir) / f"report_{worker_index}.json"
+        log_path = Path(work_dir) / f"worker_{worker_index}.log"
+        with open(groups_path, "w") as file:
+            json.dump(shard, file)
+
+        script_args = [
+            "--mesh", mesh_name,
+            "--output-dir", str(output_dir),
+            "--backend", backend,
+            "--format", sticker_format,
+            "--groups-file", str(groups_path),
+            "--report", str(report_path),
+            "--manifest-shard", str(worker_index),
+        ]
+        if exr_codec:
+            script_args += ["--exr-codec", exr_codec]
+        if profile_dir:
+            script_args += ["--profile", str(Path(profile_dir) / f"profile_{worker_index}.json")]
+        if mirror_side:
+            script_args += ["--mirror-side", mirror_side]
+        for key, value in (resolution_settings or {}).items():
+            script_args += ["--" + key.replace("_", "-"), str(value)]
+        if pack:
+            script_args += ["--pack", pack, "--unwrap-once"]
+            if pack_size:
+                script_args += ["--pack-size", str(pack_size)]
+        command = blender_command(blender, blend_file, script_args)
+        log_file = open(log_path, "w")
+        process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+        workers.append((process, log_file, shard, report_path, log_path))
+
+    results = {}
+    for process, log_file, shard, report_path, log_path in workers:
+        return_code = process.wait()
+        log_file.close()
+
+        report = {}
+        if report_path.exists():
+            with open(report_path, "r") as file:
+                report = json.load(file)
+
+        for name in shard:
+            if name in report:
+                results[name] = report[name]
+            else:
+                results[name] = {
+                    "status": "error",
+                    "error": f"worker exited with code {return_code} before baking this group, see {log_path}",
+                }
+        # the other side of the groups this worker baked
+        results.update({name: result for name, result in report.items() if result["status"] == "mirrored"})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bake weight stickers across several Blender processes.")
+    parser.add_argument("--blend", required=True, help=".blend file holding the source mesh")
+    parser.add_argument("--blender", default="blender", help="path to the Blender executable")
+    parser.add_argument("--mesh", default="LOD_1_Group_0_Sub_3__esf_Head00", help="source mesh object name")
+    parser.add_argument("--output-dir", default=str(Path("E:/MODS/scripts") / "EXAMPLE"))
+    parser.add_argument("--backend", default="RASTER", help="bake backend passed on to create_sticker.py")
+    parser.add_argument("--format", default="WEIGHT_EXR_FLOAT", help="sticker format passed on to create_sticker.py")
+    parser.add_argument("--exr-codec", help="EXR codec override passed on to create_sticker.py")
+    parser.add_argument("--profile-dir", help="every worker writes a Chrome trace profile_<worker>.json in here")
+    parser.add_argument("--texels-per-vertex", type=float, help="passed on to create_sticker.py")
+    parser.add_argument("--min-resolution", type=int, help="passed on to create_sticker.py")
+    parser.add_argument("--max-resolution", type=int, help="passed on to create_sticker.py")
+    parser.add_argument("--pack", choices=["RGBA", "CHANNELS"], help="passed on to create_sticker.py, with --unwrap-once")
+    parser.add_argument("--pack-size", type=int, help="passed on to create_sticker.py")
+    parser.add_argument("--mirror-side", choices=["L", "R"], help="only bake this side of L_/R_ group pairs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of Blender processes")
+    parser.add_argument("--report", help="write the per group results to this JSON file")
+    args = parser.parse_args()
+
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="bake_runner_")
+
+    group_sizes = list_groups(args.blender, args.blend, args.mesh, work_dir, args.mirror_side)
+    shards = shard_groups(group_sizes, max(1, args.workers))
+    print(f"Baking {len(group_sizes)} groups with {len(shards)} workers, logs in {work_dir}")
+
+    resolution_settings = {
+        key: value for key, value in
+        [("texels_per_vertex", args.texels_per_vertex), ("min_resolution", args.min_resolution),
+         ("max_resolution", args.max_resolution)]
+        if value is not None
+    }
+    results = run_workers(
+        args.blender, args.blend, args.mesh, args.output_dir, args.backend, args.format, shards, work_dir, args.exr_codec,
+        args.profile_dir, args.mirror_side, resolution_settings, args.pack, args.pack_size
+    )
+
+    # fold the worker manifests back in and drop stickers of groups that are gone, and the packed stickers
+    # the workers left for this pass instead of deleting them under each other
+    manifest = merge_shard_manifests(args.output_dir)
+    manifest.remove_stale(group_sizes)
+    manifest.remove_unreferenced("pack_*")
+    manifest.save()
+    if args.pack:
+        write_sticker_index(args.output_dir)
+
+    skipped = [name for name, result in results.items() if result["status"] == "skipped"]
+    mirrored = [name for name, result in results.items() if result["status"] == "mirrored"]
+    failed = {name: result for name, result in results.items() if result["status"] == "error"}
+    baked_count = len(results) - len(failed) - len(skipped) - len(mirrored)
+    print(f"{baked_count} groups baked, {len(skipped)} unchanged, {len(mirrored)} mirrored, {len(failed)} failed")
+    for name, result in sorted(failed.items()):
+        print(f"  {name}: {result['error']}")
+
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(results, file, indent=4)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
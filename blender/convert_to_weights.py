@@ -1,10 +1,18 @@
 import bpy
-import bmesh
-from mathutils import Vector, kdtree
-import math
+import numpy as np
 import json
+import sys
 from pathlib import Path
 
+# sibling modules are not on sys.path when the script runs inside Blender
+sys.path.append(str(Path(__file__).resolve().parent))
+from mesh_io import write_vertex_group_weights, foreach_get, WEIGHT_STEPS
+from sticker_format import STICKER_FORMATS, read_sticker_metadata
+from profiling import profiler
+from sticker_reader import sample_sticker_file, Prefetcher, READ_ERRORS
+from misc import mirror_vertex_groups
+from weight_core import OFF_RAMP_COLORS, RgbWeightDecoder, sample_image_at_uvs, average_per_vertex, decode_sticker_samples
+
 def delete_temp_material():
     temp_materials = []
     for material in bpy.data.materials:
@@ -16,8 +24,13 @@ def delete_temp_material():
 
 
     
-def create_rgb_to_weight_map():
+def sample_weight_ramp(increments=100):
+    """
+    Samples the B_SPLINE color ramp the stickers are decoded against.
 
+    :param increments: Number of steps between weight 0.0 and 1.0.
+    :return: (increments + 1,) float32 weights and the matching (increments + 1, 3) RGB colors.
+    """
     # Create a temporary material to access the color ramp node
     temp_material = bpy.data.materials.new(name="TempMaterial")
     temp_material.use_nodes = True
@@ -35,47 +48,37 @@ def create_rgb_to_weight_map():
     color_ramp_node.color_ramp.elements[1].position = 0.75
     color_ramp_node.color_ramp.elements[0].position = 0.09
 
-    rgb_to_weight_map = {}
-    
-    increments = 100
-    for i in range(increments + 1):
-        weight = i / increments
-        sampled_rgb = color_ramp_node.color_ramp.evaluate(weight)[:3]
-        rgb_to_weight_map[sampled_rgb] = weight
+    weights = np.linspace(0.0, 1.0, increments + 1, dtype=np.float32)
+    colors = np.array([color_ramp_node.color_ramp.evaluate(weight)[:3] for weight in weights.tolist()], dtype=np.float32)
 
     # Clean up: remove the temporary material
     bpy.data.materials.remove(temp_material, do_unlink=True)
 
-    #kind of hacky but if the rgb value is black, give it the same value as if it were blue
-    #adding black (for the background) to a number system that really spans between blue, red, green
-    rgb_to_weight_map[(0.0, 0.0, 0.0)] = 0.0
+    return weights, colors
+
+
+def create_rgb_to_weight_map():
+    weights, colors = sample_weight_ramp()
 
-    #also a hack but map grey to blue as well 
-    rgb_to_weight_map[(0.50390625, 0.50390625, 0.50390625)] = 0.0
+    rgb_to_weight_map = {}
+    for weight, sampled_rgb in zip(weights.tolist(), colors.tolist()):
+        rgb_to_weight_map[tuple(sampled_rgb)] = weight
+    rgb_to_weight_map.update(OFF_RAMP_COLORS)
 
     return rgb_to_weight_map
 
-def rgb_to_weight(rgb, rgb_to_weight_map):
-    """
-    Converts an RGB color to a weight value (0.0 - 1.0) by approximating Blender's weight paint color gradient.
-    :param rgb: An (r, g, b) tuple with values between 0.0 and 1.0.
-    :return: A float value representing the weight (0.0 for blue to 1.0 for red).
-    """
-    rgb_values = list(rgb_to_weight_map.keys()) 
-    closest_rgb = min(rgb_values, key=lambda x: math.sqrt(sum((x[j] - rgb[j]) ** 2 for j in range(3))))
-    closest_weight = rgb_to_weight_map[closest_rgb]
 
-    return closest_weight
+def create_weight_decoder(lut_size=None):
+    weights, colors = sample_weight_ramp()
+    return RgbWeightDecoder(weights, colors, OFF_RAMP_COLORS, lut_size=lut_size)
 
 
-def sample_texture_at_uv(obj, uv, image):
-    # Convert UV coordinates to image pixel space
-    uv_x = int(uv.x * image.size[0])
-    uv_y = int(uv.y * image.size[1])
-    # Sample the color from the image pixels
-    pixel_index = (uv_y * image.size[0] + uv_x) * 4
-    r, g, b, a = image.pixels[pixel_index:pixel_index + 4]
-    return (r, g, b, a)
+def read_image_pixels(image):
+    # one foreach_get instead of slicing image.pixels through RNA for every sample
+    width, height = image.size
+    pixels = np.empty(width * height * image.channels, dtype=np.float32)
+    foreach_get(image.pixels, None, pixels)
+    return pixels.reshape(height, width, image.channels)
 
 
 def get_dict_from_json(file_path):
@@ -90,69 +93,179 @@ def get_reverse_lookup(data):
             reverse_lookup[value] = key
     return reverse_lookup
 
-def project_texture_to_weights(obj, image, vertex_group_name, rgb_to_weight_map):
+def read_selected_loops(obj):
+    """
+    :return: (L, 2) UVs and (L,) vertex indices of the loops of the selected vertices, None when obj is
+        not a mesh with a UV layer.
+    """
     # Ensure the object is a mesh
     if obj is None or obj.type != 'MESH':
         print("Selected object is not a mesh.")
-        return
+        return None
 
-    # Access the mesh data directly without switching modes repeatedly
-    # Switching modes (Edit <-> Object) is costly. Instead, use bmesh.new() to create a BMesh object and bm.from_mesh(obj.data) to load mesh data directly.
-    bm = bmesh.new()
-    bm.from_mesh(obj.data)
-    uv_layer = bm.loops.layers.uv.active
+    # Read the mesh data with foreach_get instead of walking a BMesh loop by loop
+    mesh = obj.data
+    uv_layer = mesh.uv_layers.active
     if not uv_layer:
         print("No active UV layer found.")
-        bm.free()
-        return
+        return None
 
-    # Ensure the vertex group exists
-    vertex_group = obj.vertex_groups.get(vertex_group_name)
-    if not vertex_group:
-        vertex_group = obj.vertex_groups.new(name=vertex_group_name)
+    loop_uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+    foreach_get(uv_layer.data, "uv", loop_uvs)
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    foreach_get(mesh.loops, "vertex_index", loop_vertices)
+    selected = np.empty(len(mesh.vertices), dtype=bool)
+    foreach_get(mesh.vertices, "select", selected)
 
-    # Dictionary to store weights for vertices
-    vertex_weights = {}
+    # Only process the loops of selected vertices
+    loop_mask = selected[loop_vertices]
+    return loop_uvs.reshape(-1, 2)[loop_mask], loop_vertices[loop_mask]
 
-    # Iterate through faces and process selected vertices
-    for face in bm.faces:
-        for loop in face.loops:
-            vertex = loop.vert
-            if vertex.select:
-                uv = loop[uv_layer].uv
-                # Sample color from the texture at the UV coordinate
-                red, green, blue, alpha = sample_texture_at_uv(obj, uv, image)
-                # Convert RGB to weight
-                weight_value = rgb_to_weight((red, green, blue), rgb_to_weight_map)
 
-                # Accumulate weights for the vertex (to avoid duplicates)
-                vertex_weights[vertex.index] = weight_value
+def get_weight_steps(metadata):
+    # the quantization the weights of a sticker are written with, see STICKER_FORMATS
+    if metadata is None:
+        return STICKER_FORMATS["COLORMAP_EXR"]["weight_steps"]
+    return STICKER_FORMATS.get(metadata.get("format"), {}).get("weight_steps", WEIGHT_STEPS)
 
-    # Apply the weights in Object Mode
-    bm.to_mesh(obj.data)  # Write changes back to the mesh
-    bm.free()
-
-    for idx, weight_value in vertex_weights.items():
-        vertex_group.add([idx], weight_value, 'REPLACE')
 
+def project_texture_to_weights(obj, image, vertex_group_name, weight_decoder, sample_mode='NEAREST', metadata=None):
+    """
+    :param weight_decoder: Decoder of colormap stickers, unused for WEIGHT stickers.
+    :param metadata: Sticker header from read_sticker_metadata(), colormap when not given.
+    """
+    loops = read_selected_loops(obj)
+    if loops is None:
+        return
+    loop_uvs, loop_vertices = loops
 
+    with profiler.stage("read_image", vertex_group_name, pixels=image.size[0] * image.size[1]):
+        pixels = read_image_pixels(image)
+    with profiler.stage("decode", vertex_group_name, vertices=len(loop_vertices)):
+        colors = sample_image_at_uvs(pixels, loop_uvs, sample_mode)
+        loop_weights = decode_sticker_samples(colors, metadata, weight_decoder)
+        vertex_indices, vertex_weights = average_per_vertex(loop_vertices, loop_weights)
 
-# Example usage:
-object_name = "low_head"
-obj = bpy.data.objects.get(object_name)
+    # The vertex group is created if it does not exist yet
+    write_vertex_group_weights(obj, vertex_group_name, vertex_indices, vertex_weights, 'REPLACE', get_weight_steps(metadata))
 
-#folder_path = "E:\MODS\scripts\slickback_weight_textures"
-folder_path = "E:\MODS\scripts\slickback_extras"
-directory = Path(folder_path)
-delete_temp_material()
-rgb_to_weight_map = create_rgb_to_weight_map()
 
-file_paths = list(directory.glob("*.exr")) + list(directory.glob("*.png"))
+def decode_sticker_file(file_path, loop_uvs, loop_vertices, metadata, weight_decoder, sample_mode='NEAREST'):
+    """
+    Samples a sticker file at the loop UVs and averages the decoded weights per vertex. Does not touch bpy,
+    so it can run on the Prefetcher threads.
 
-for idx, file_path in enumerate(file_paths):
+    :return: (vertex indices, their float32 weights).
+    :raises ValueError: When the file can not be read outside of Blender, see sample_sticker_file().
+    """
     vertex_group_name = Path(file_path).stem
-    print(vertex_group_name)
-    img = bpy.data.images.load(str(file_path.resolve()))
-    project_texture_to_weights(obj, img, vertex_group_name, rgb_to_weight_map)
-    bpy.data.images.remove(img, do_unlink=True)
-    print(idx)
+    with profiler.stage("read_image", vertex_group_name, samples=len(loop_uvs)):
+        colors = sample_sticker_file(file_path, loop_uvs, sample_mode)
+    with profiler.stage("decode", vertex_group_name, vertices=len(loop_vertices)):
+        loop_weights = decode_sticker_samples(colors, metadata, weight_decoder)
+        return average_per_vertex(loop_vertices, loop_weights)
+
+
+def decode_packed_sticker_file(file_path, loop_uvs, loop_vertices, metadata, sample_mode='NEAREST'):
+    """
+    Samples every channel of a packed sticker in one pass over the file, see bake_packed_groups().
+
+    :return: Dict of {group name: (vertex indices, their float32 weights)}.
+    """
+    groups = metadata["groups"]
+    pack_name = Path(file_path).stem
+    with profiler.stage("read_image", pack_name, samples=len(loop_uvs)):
+        samples = sample_sticker_file(file_path, loop_uvs, sample_mode, list(groups.values()))
+    decoded = {}
+    with profiler.stage("decode", pack_name, vertices=len(loop_vertices) * len(groups)):
+        # packed stickers always hold raw weights
+        for column, group_name in enumerate(groups):
+            decoded[group_name] = average_per_vertex(loop_vertices, np.clip(samples[:, column], 0.0, 1.0))
+    return decoded
+
+
+def import_sticker_directory(obj, directory, weight_decoder, sample_mode='NEAREST', prefetch=2, workers=1):
+    """
+    Projects every sticker in directory onto the vertex group named after its file, packed stickers onto
+    every group listed in their header. Files are read and decoded on Prefetcher threads, up to prefetch
+    files ahead, while the main thread writes the weights of the previous file. Files the reader can not
+    decode are loaded through Blender on the main thread, truncated or corrupt files are reported and skipped.
+
+    Stickers baked with --mirror-side name the group of the other side in their header, those groups are
+    re-derived from the imported side in one mirror pass at the end.
+
+    :param prefetch: Files decoded ahead of the weight writes.
+    :param workers: Decoding threads.
+    """
+    loops = read_selected_loops(obj)
+    if loops is None:
+        return
+    loop_uvs, loop_vertices = loops
+
+    file_paths = list(Path(directory).glob("*.exr")) + list(Path(directory).glob("*.png"))
+    jobs = []
+    for file_path in file_paths:
+        try:
+            jobs.append((file_path, read_sticker_metadata(file_path)))
+        except (OSError, ValueError) as e:
+            print(f"Skipping {file_path.name}, its header can not be read: {e}")
+
+    def decode_job(job):
+        file_path, metadata = job
+        if "groups" in metadata:
+            return decode_packed_sticker_file(file_path, loop_uvs, loop_vertices, metadata, sample_mode)
+        return {file_path.stem: decode_sticker_file(file_path, loop_uvs, loop_vertices, metadata, weight_decoder, sample_mode)}
+
+    prefetcher = Prefetcher(decode_job, jobs, depth=prefetch, workers=workers)
+    mirror_pairs = {}
+    for idx, ((file_path, metadata), future) in enumerate(prefetcher):
+        vertex_group_name = file_path.stem
+        print(vertex_group_name)
+        decoded = {}
+        try:
+            decoded = future.result()
+        except ValueError as e:
+            if "groups" in metadata:
+                # Blender can not split a packed sticker into its groups
+                print(f"Could not read packed sticker {file_path.name}: {e}")
+                continue
+            print(f"Loading {file_path.name} through Blender: {e}")
+            try:
+                img = bpy.data.images.load(str(file_path.resolve()))
+            except RuntimeError as load_error:
+                print(f"Skipping {file_path.name}, Blender can not load it either: {load_error}")
+                continue
+            if metadata["encoding"] == "WEIGHT":
+                # raw weights, keep Blender from applying a color transform when reading the pixels
+                img.colorspace_settings.is_data = True
+            project_texture_to_weights(obj, img, vertex_group_name, weight_decoder, sample_mode, metadata)
+            bpy.data.images.remove(img, do_unlink=True)
+        except READ_ERRORS as e:
+            print(f"Skipping {file_path.name}, the file is truncated or corrupt: {e}")
+            continue
+        for group_name, (vertex_indices, vertex_weights) in decoded.items():
+            # The vertex group is created if it does not exist yet
+            write_vertex_group_weights(obj, group_name, vertex_indices, vertex_weights, 'REPLACE', get_weight_steps(metadata))
+        if metadata.get("mirror"):
+            mirror_pairs[vertex_group_name] = metadata["mirror"]
+        mirror_pairs.update(metadata.get("mirrors", {}))
+        print(idx)
+    prefetcher.print_stats()
+
+    if mirror_pairs:
+        with profiler.stage("mirror", vertices=len(obj.data.vertices) * len(mirror_pairs)):
+            mirror_vertex_groups(obj, mirror_pairs)
+        print(f"Mirrored {len(mirror_pairs)} vertex groups.")
+
+
+if __name__ == "__main__":
+    # Example usage:
+    object_name = "low_head"
+    obj = bpy.data.objects.get(object_name)
+
+    #folder_path = "E:\MODS\scripts\slickback_weight_textures"
+    folder_path = "E:\MODS\scripts\slickback_extras"
+    delete_temp_material()
+    weight_decoder = create_weight_decoder()
+    import_sticker_directory(obj, Path(folder_path), weight_decoder)
+    profiler.print_summary()
@@ -1,30 +1,38 @@
 import bpy
 from pathlib import Path
-import bmesh
-import time
 import sys
-from mathutils import kdtree, Euler
-import heapq
-from mathutils import Vector
-
-
-def progress_bar(iteration, total, length=50):
-    percent = 100 * (iteration / float(total))
-    filled_length = int(length * iteration // total)
-    bar = '█' * filled_length + '-' * (length - filled_length) 
-    # '\r' returns the cursor to the start of the line so we overwrite previous output
-    sys.stdout.write(f'\r|{bar}| {percent:.2f}% Complete')
-    sys.stdout.flush()  # Ensure the output is printed immediately
-    if iteration == total:
-        print()  # Move to the next line after completion
-
-
-def is_in_vertex_group(vert_index, vert_group):
-      return vert_group.weight(vert_index) > 0
+from mathutils import kdtree, Euler, Matrix
+import argparse
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# sibling modules are not on sys.path when the script runs inside Blender
+sys.path.append(str(Path(__file__).resolve().parent))
+from mesh_io import get_mesh_topology, read_loop_triangles, read_group_weights, foreach_get, foreach_set
+from bake_cache import BakeManifest, group_bake_key, hash_arrays, hash_settings
+from sticker_format import (
+    STICKER_FORMATS, write_sticker_metadata, update_sticker_metadata, read_sticker_metadata, write_sticker_index
+)
+from image_io import ImageWriter, can_write_sticker
+from profiling import profiler, GroupProgress, profile_calls
+from weight_core import (
+    get_group_weights, get_weighted_group_names, get_group_submesh, crop_uvs, fan_triangles,
+    split_mirrored_groups, choose_bake_resolution, BAKE_RESOLUTION, get_pack_channels, get_packed_submesh,
+    write_packed_raster_sticker, get_group_statistics,
+    encode_weights, render_sticker_pixels, write_raster_sticker,
+)
+
+
+def extract_group_weights(source_mesh_name):
+    """
+    Makes the normals of the mesh point inwards for the bake, then reads every vertex group weight with
+    read_group_weights().
 
-def arrange_all_groups(source_mesh_name, bm):
-    vertex_groups = get_vertex_groups(source_mesh_name)
-    vertex_group_dict = {}
+    :param source_mesh_name: Name of the mesh object to read.
+    :return: The CSR-style weights of read_group_weights().
+    """
     source_obj = bpy.data.objects[source_mesh_name]
 
     bpy.context.view_layer.objects.active = source_obj
@@ -33,127 +41,132 @@ def arrange_all_groups(source_mesh_name, bm):
     bpy.ops.mesh.normals_make_consistent(inside=True)
     bpy.ops.object.mode_set(mode='OBJECT')
 
-    bm.from_mesh(source_obj.data)
-    for v in bm.verts:
-        for vertex_group in vertex_groups:
-            vertex_group_name = vertex_group.name
-            try:
-                if is_in_vertex_group(v.index, vertex_group):
-                    # Assign the weight to the target group
-                    weight = vertex_group.weight(v.index)
-                    v_world = source_obj.matrix_world @ v.co
-                    if vertex_group_name in vertex_group_dict:
-                        vertex_group_dict[vertex_group_name][v.index] = {"weight": weight, "world": v_world, "vertex": v}
-                    else:
-                        vertex_group_dict[vertex_group_name] = {}
-                        vertex_group_dict[vertex_group_name][v.index] = {"weight": weight, "world": v_world, "vertex": v}
-            except RuntimeError as e:
-                #Error: Vertex not in group
-                continue
-    return vertex_group_dict
+    return read_group_weights(source_obj)
 
-def arrange_vertex_group(source_mesh_name, bm, vertex_group_name):
-    source_obj = bpy.data.objects[source_mesh_name]
-
-    vertex_group = source_obj.vertex_groups.get(vertex_group_name)
-    vertex_group_dict = {}
-    #flip normals
-#    source_obj = bpy.context.active_object
-    bpy.context.view_layer.objects.active = source_obj
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.normals_make_consistent(inside=True)
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    #copy vertices
-    bm.from_mesh(source_obj.data)
-    # Loop through all vertices to get all non zero weights and their vertex coordinates
-    for v in bm.verts:
-        try:
-            if is_in_vertex_group(v.index, vertex_group):
-                # Assign the weight to the target group
-                weight = vertex_group.weight(v.index)
-                v_world = source_obj.matrix_world @ v.co
-                if vertex_group_name in vertex_group_dict:
-                    vertex_group_dict[vertex_group_name][v.index] = {"weight": weight, "world": v_world, "vertex": v}
-                else:
-                    vertex_group_dict[vertex_group_name] = {}
-                    vertex_group_dict[vertex_group_name][v.index] = {"weight": weight, "world": v_world, "vertex": v}
-        except RuntimeError as e:
-            #Error: Vertex not in group
-            continue
-    return vertex_group_dict
 
 # this function is meant to be used in a for loop, looping through all of the bones/vertex groups on an armature/meshG
 # for mods, the bone names should be the same for both armatures
-def create_weight_sticker(vertex_group_dictionaries, source_mesh_name, source_vertex_group_name, output_path):
+def create_weight_sticker(group_weights, source_mesh_name, source_vertex_group_name, output_path, bake_backend="CYCLES",
+                          source_topology=None, sticker_format="COLORMAP_EXR", image_writer=None, exr_codec=None,
+                          resolution_settings=None):
+    """
+    :param image_writer: Optional ImageWriter, the sticker is then written in the background.
+    :param exr_codec: Overrides the EXR codec of the sticker format.
+    :param resolution_settings: choose_bake_resolution() arguments, BAKE_RESOLUTION when not given.
+    :return: Future of the background write, None when the sticker was written right away.
+    """
     source_mesh = bpy.data.objects[source_mesh_name]
-    # 1) create list of all non zero vertices for a vertex group
-    source_selected_vertices = vertex_group_dictionaries[source_vertex_group_name]
-    # create color attribute for mesh
-    create_color_attribute(source_selected_vertices, source_mesh)
-    #bake attributes to an image
-    selected_verts_indices = [i for i in source_selected_vertices]
-    
-    bpy.context.view_layer.objects.active = source_mesh
-    source_mesh.select_set(True)
-
-    bpy.ops.object.duplicate_move(
-        OBJECT_OT_duplicate={"linked": False, "mode": 'TRANSLATION'}, 
-        TRANSFORM_OT_translate={"value": (0, 0, 0)}
-    )
-
-    # Get the new active object, which is the duplicated one
-    duplicated_object = bpy.context.active_object
-
-    delete_unwanted_vertices(duplicated_object, selected_verts_indices)
-
-    #redo UV maps
-    bpy.context.view_layer.objects.active = duplicated_object
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.uv.unwrap(method='ANGLE_BASED', margin=0)
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    bake_weights(source_vertex_group_name, duplicated_object, output_path)
-    
-    #delete new object
-    bpy.context.view_layer.objects.active = duplicated_object
-    duplicated_object.select_set(True)
-    bpy.ops.object.delete()
-
-
-def delete_unwanted_vertices(obj, vertices_to_keep):
-    # Set the object as active and switch to edit mode
-    bpy.context.view_layer.objects.active = obj
-    bpy.ops.object.mode_set(mode='EDIT')
-
-    # Get the BMesh representation of the object in edit mode
-    bm = bmesh.from_edit_mesh(obj.data)
-
-    # Deselect all vertices
-    bpy.ops.mesh.select_all(action='DESELECT')
-
-    # Loop through all vertices in the mesh
-    for v in bm.verts:
-        if v.index not in vertices_to_keep:
-            # Select the vertices not in the list of vertices to keep
-            v.select = True
+    if source_topology is None:
+        source_topology = get_mesh_topology(source_mesh)
+    # 1) get all non zero vertices for a vertex group
+    vertex_indices, weights = get_group_weights(group_weights, source_vertex_group_name)
+
+    # 2) build the group's faces straight into the reusable scratch mesh instead of duplicating the
+    # whole source object and deleting everything else
+    scratch_object = get_scratch_object()
+    scratch_object.matrix_world = source_mesh.matrix_world
+    with profiler.stage("duplicate", source_vertex_group_name, vertices=len(vertex_indices)):
+        kept_loops = fill_group_submesh(scratch_object.data, source_topology, vertex_indices)
+
+    # create color attribute for mesh, the scratch vertices are numbered like vertex_indices
+    encoding = STICKER_FORMATS[sticker_format]["encoding"]
+    with profiler.stage("encode", source_vertex_group_name):
+        create_color_attribute(np.arange(len(vertex_indices)), weights, scratch_object, encoding)
+
+    bpy.ops.object.select_all(action='DESELECT')
+    bpy.context.view_layer.objects.active = scratch_object
+    scratch_object.select_set(True)
+
+    with profiler.stage("unwrap", source_vertex_group_name):
+        if source_topology["loop_uvs"] is None:
+            #redo UV maps
+            bpy.ops.object.mode_set(mode='EDIT')
+            bpy.ops.mesh.select_all(action='SELECT')
+            bpy.ops.uv.unwrap(method='ANGLE_BASED', margin=0)
+            bpy.ops.object.mode_set(mode='OBJECT')
         else:
-            v.select = False  # Deselect vertices that are to be kept
+            # crop the group out of the UVs unwrapped once for the whole mesh
+            uv_layer = scratch_object.data.uv_layers.new(name="UVMap")
+            foreach_set(uv_layer.data, "uv", crop_uvs(source_topology["loop_uvs"][kept_loops]).ravel())
 
-    # Update the mesh to reflect the selections
-    bmesh.update_edit_mesh(obj.data)
+    #bake attributes to an image
+    return BAKE_BACKENDS[bake_backend](
+        source_vertex_group_name, scratch_object, output_path, sticker_format, image_writer, exr_codec, resolution_settings
+    )
 
-    # Delete the selected vertices
-    bpy.ops.mesh.delete(type='VERT')
-
-    # Switch back to object mode
-    bpy.ops.object.mode_set(mode='OBJECT')
 
+SCRATCH_NAME = "WeightStickerScratch"
+
+
+def get_scratch_object():
+    # one mesh object reused by every group, its geometry is replaced for each bake
+    mesh = bpy.data.meshes.get(SCRATCH_NAME)
+    if mesh is None:
+        mesh = bpy.data.meshes.new(SCRATCH_NAME)
+    scratch_object = bpy.data.objects.get(SCRATCH_NAME)
+    if scratch_object is None:
+        scratch_object = bpy.data.objects.new(SCRATCH_NAME, mesh)
+    if not scratch_object.users_collection:
+        bpy.context.scene.collection.objects.link(scratch_object)
+    return scratch_object
+
+
+def remove_scratch_object():
+    scratch_object = bpy.data.objects.get(SCRATCH_NAME)
+    if scratch_object is not None:
+        bpy.data.objects.remove(scratch_object, do_unlink=True)
+    mesh = bpy.data.meshes.get(SCRATCH_NAME)
+    if mesh is not None:
+        bpy.data.meshes.remove(mesh)
+
+
+def fill_group_submesh(mesh, source_topology, vertex_indices):
+    # replaces the geometry of mesh with the group submesh, returns the mask of kept source loops
+    coords, loop_vertices, loop_totals, kept_loops = get_group_submesh(source_topology, vertex_indices)
+    loop_starts = np.cumsum(loop_totals) - loop_totals
+    mesh.clear_geometry()
+    # bulk adds and foreach_set instead of building python lists for from_pydata
+    mesh.vertices.add(len(coords))
+    mesh.loops.add(len(loop_vertices))
+    mesh.polygons.add(len(loop_totals))
+    foreach_set(mesh.vertices, "co", np.ascontiguousarray(coords, dtype=np.float32).ravel())
+    foreach_set(mesh.loops, "vertex_index", loop_vertices.astype(np.int32))
+    foreach_set(mesh.polygons, "loop_start", loop_starts.astype(np.int32))
+    # Blender 4.0 derives loop_total from the next loop_start and made it read-only
+    if not mesh.polygons.bl_rna.properties["loop_total"].is_readonly:
+        foreach_set(mesh.polygons, "loop_total", loop_totals.astype(np.int32))
+    mesh.update(calc_edges=True)
+    return kept_loops
+
+
+def unwrap_source_once(source_mesh_name):
+    """
+    Unwraps the whole source mesh into a temporary UV layer and returns its (L, 2) loop UVs.
+    The source mesh's own UV layers are left untouched.
+    """
+    source_obj = bpy.data.objects[source_mesh_name]
+    mesh = source_obj.data
+    previous_active = mesh.uv_layers.active_index
+    uv_layer = mesh.uv_layers.new(name="StickerUnwrap")
+    try:
+        mesh.uv_layers.active = uv_layer
+        bpy.ops.object.select_all(action='DESELECT')
+        bpy.context.view_layer.objects.active = source_obj
+        source_obj.select_set(True)
+        bpy.ops.object.mode_set(mode='EDIT')
+        bpy.ops.mesh.select_all(action='SELECT')
+        bpy.ops.uv.unwrap(method='ANGLE_BASED', margin=0.001)
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+        loop_uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+        foreach_get(uv_layer.data, "uv", loop_uvs)
+    finally:
+        mesh.uv_layers.remove(mesh.uv_layers["StickerUnwrap"])
+        mesh.uv_layers.active_index = max(previous_active, 0)
+    return loop_uvs.reshape(-1, 2)
 
 
-def create_color_attribute(selected_vertices, mesh):
+def create_color_attribute(vertex_indices, weights, mesh, encoding="COLORMAP"):
     # Iterate over and remove all color attributes
     while len(mesh.data.color_attributes) > 0:
         mesh.data.color_attributes.remove(mesh.data.color_attributes[0])
@@ -162,57 +175,25 @@ def create_color_attribute(selected_vertices, mesh):
     if not color_layer:
         color_layer = mesh.data.color_attributes.new(name="WeightColor", type='FLOAT_COLOR', domain='POINT')
 
-    for idx in selected_vertices:
-        weight = selected_vertices[idx]["weight"]
-        color_layer.data[idx].color = weight_to_rgb(weight)
+    # read the current colors once so vertices outside of the group keep the attribute default
+    colors = np.empty(len(color_layer.data) * 4, dtype=np.float32)
+    foreach_get(color_layer.data, "color", colors)
+    colors = colors.reshape(-1, 4)
+    colors[vertex_indices] = encode_weights(weights, encoding)
+    foreach_set(color_layer.data, "color", colors.ravel())
+
+    # raw weights for the raster bake backend, which interpolates weights instead of colors
+    weight_layer = mesh.data.attributes.get("WeightValue")
+    if weight_layer:
+        mesh.data.attributes.remove(weight_layer)
+    weight_layer = mesh.data.attributes.new(name="WeightValue", type='FLOAT', domain='POINT')
+    values = np.zeros(len(weight_layer.data), dtype=np.float32)
+    values[vertex_indices] = weights
+    foreach_set(weight_layer.data, "value", values)
 
     # Update the mesh to reflect the changes
     mesh.data.update()
 
-def weight_to_rgb(weight):
-    """
-    Converts a weight (0.0 - 1.0) to an RGB value using Blender's weight paint color gradient.
-    
-    :param weight: A float value between 0.0 (blue) and 1.0 (red).
-    :return: An (r, g, b) tuple with values between 0.0 and 1.0.
-    """
-    # Clamp weight between 0.0 and 1.0 to avoid out-of-bounds issues
-    weight = max(0.0, min(weight, 1.0))
-    
-    # Create a temporary material to access the color ramp node
-    temp_material = bpy.data.materials.new(name="TempMaterial")
-    temp_material.use_nodes = True
-    nodes = temp_material.node_tree.nodes
-    links = temp_material.node_tree.links
-    
-    # Create a ColorRamp node
-    color_ramp_node = nodes.new(type="ShaderNodeValToRGB")
-    color_ramp_node.location = (0, 0)
-    
-    # Set up a color ramp with Blender-like weight colors
-    color_ramp_node.color_ramp.interpolation = 'LINEAR'
-
-    # Define the color stops
-    # Add Blue at position 0.0
-    blue_element = color_ramp_node.color_ramp.elements[0]
-    blue_element.color = (0.0, 0.0, 1.0, 1.0)  # Blue (RGBA)
-
-    # Add Red at position 1.0
-    red_element = color_ramp_node.color_ramp.elements[1]
-    red_element.color = (1.0, 0.0, 0.0, 1.0)  # Red 
-
-    # Add Green at position 0.5
-    green_element = color_ramp_node.color_ramp.elements.new(0.5)
-    green_element.color = (0.0, 1.0, 0.0, 1.0)  # Green (RGBA)
-    
-    # Evaluate the color ramp at the given weight
-    rgb = color_ramp_node.color_ramp.evaluate(weight)
-    
-    # Clean up: remove the temporary material
-    bpy.data.materials.remove(temp_material, do_unlink=True)
-    
-    return rgb
-
 
 def create_weight_material(obj, image_path, material_name="Weights"):
 
@@ -272,9 +253,9 @@ def convert_texture_rotation(mapping_rotation):
     local_rotation = Euler(mapping_rotation, 'XYZ').to_matrix().to_4x4()
     return local_rotation
 
-def transform_image_texture(obj, image_path, location, rotation, scale):
+def transform_image_texture(obj, image_path, location, rotation, scale, material_name="Weights"):
 
-    info = create_weight_material(obj, image_path, material_name="Weights")
+    info = create_weight_material(obj, image_path, material_name=material_name)
     mapping_node = info["mapping_node"]
     mapping_node.inputs['Location'].default_value = location
     mapping_node.inputs['Rotation'].default_value = rotation  
@@ -285,6 +266,36 @@ def transform_image_texture(obj, image_path, location, rotation, scale):
     #mapping_node.inputs['Scale'].default_value = (2.0, 2.0, 1.0)  # Adjust scale
 
 
+def place_group_stickers(obj, anchors, image_paths, rotation=None, scale=(1.0, 1.0, 1.0)):
+    """
+    Places the sticker of every group at its anchor with transform_image_texture, one material per group.
+
+    :param anchors: get_group_anchors() result.
+    :param image_paths: Dict of {group name: sticker path}, groups without an anchor are skipped.
+    :param rotation: Euler rotation for every sticker. When None, stickers are turned to the principal
+        axes of their group if the anchors have them, and not turned otherwise.
+    """
+    for group_name, image_path in image_paths.items():
+        anchor = anchors.get(group_name)
+        if anchor is None:
+            print(f"No anchor for '{group_name}', its sticker is not placed.")
+            continue
+        sticker_rotation = rotation
+        if sticker_rotation is None:
+            sticker_rotation = get_axes_rotation(anchor["axes"]) if "axes" in anchor else (0.0, 0.0, 0.0)
+        transform_image_texture(
+            obj, image_path, anchor["location"], sticker_rotation, scale, material_name=f"Weights_{group_name}"
+        )
+
+
+def get_axes_rotation(axes):
+    # Euler rotation turning X, Y and Z onto the rows of axes, flipped to a right handed basis if needed
+    basis = np.array(axes, dtype=np.float64).T
+    if np.linalg.det(basis) < 0:
+        basis[:, 2] *= -1
+    return tuple(Matrix(basis.tolist()).to_euler('XYZ'))
+
+
 def get_material_index(obj, material_name):
     if obj and obj.data.materials:
         for i, mat in enumerate(obj.data.materials):
@@ -294,7 +305,18 @@ def get_material_index(obj, material_name):
 
 
 # Saving user settings
-def bake_weights(vertex_group_name, obj, output_path):
+def get_bake_resolution(obj, resolution_settings=None):
+    # resolution of the sticker of a scratch mesh, picked from its UVs and vertex count
+    mesh = obj.data
+    loop_uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+    foreach_get(mesh.uv_layers.active.data, "uv", loop_uvs)
+    return choose_bake_resolution(
+        loop_uvs.reshape(-1, 2), read_loop_triangles(mesh), len(mesh.vertices), **(resolution_settings or BAKE_RESOLUTION)
+    )
+
+
+def bake_weights(vertex_group_name, obj, output_path, sticker_format="COLORMAP_EXR", image_writer=None, exr_codec=None,
+                 resolution_settings=None):
     # Ensure the object has a material
     if len(obj.data.materials) == 0:
         mat = bpy.data.materials.new(name="Baking_Material")
@@ -323,14 +345,12 @@ def bake_weights(vertex_group_name, obj, output_path):
     default_render_engine = scene.render.engine
     default_view_transform = scene.view_settings.view_transform
     default_display_device = scene.display_settings.display_device
-    default_file_format = scene.render.image_settings.file_format
-    default_color_mode = scene.render.image_settings.color_mode
-    default_codec = scene.render.image_settings.exr_codec
     default_denoise = scene.cycles.use_denoising
     default_compute_device = scene.cycles.device
     default_scene_samples = scene.cycles.samples
 
-    render_resolution = 2048
+    render_resolution = get_bake_resolution(obj, resolution_settings)
+    texture_image = None
 
     try:
         # Prepare baking
@@ -345,14 +365,10 @@ def bake_weights(vertex_group_name, obj, output_path):
         texture_image = bpy.data.images.new(
             name=vertex_group_name, width=render_resolution, height=render_resolution, alpha=True, float_buffer=True
         )
-        pixels = [0.0, 0.0, 0.0, 0.0] * render_resolution * render_resolution
-        texture_image.pixels = pixels
+        # clear straight from a float32 buffer instead of a Python list of floats
+        foreach_set(texture_image.pixels, None, np.zeros(4 * render_resolution * render_resolution, dtype=np.float32))
 
         texture_image.filepath_raw = output_path
-        scene.render.image_settings.file_format = 'OPEN_EXR'
-        scene.render.image_settings.color_mode = 'RGB'
-        scene.render.image_settings.exr_codec = 'NONE'
-
         texture_image.use_half_precision = False
         texture_image.colorspace_settings.is_data = True
         #texture_image.colorspace_settings.name = 'Non-Color'
@@ -368,23 +384,25 @@ def bake_weights(vertex_group_name, obj, output_path):
         bpy.context.scene.render.bake.use_pass_indirect = False
         bpy.context.scene.render.bake.use_pass_color = True
 
-        bpy.ops.object.bake(type='DIFFUSE')
-        # save as render so we have more control over compression settings
-        texture_image.save_render(
-            filepath=bpy.path.abspath(output_path), scene=scene, quality=0
-        )
-        # Removes the dirty flag, so the image doesn't have to be saved again by the user.
-        texture_image.pack()
-        texture_image.unpack(method='REMOVE')
+        with profiler.stage("bake", vertex_group_name, pixels=render_resolution * render_resolution):
+            bpy.ops.object.bake(type='DIFFUSE')
+        if image_writer is not None and can_write_sticker(sticker_format, exr_codec):
+            # hand a copy of the pixels to the writer thread, the image itself is removed below
+            pixels = np.empty(4 * render_resolution * render_resolution, dtype=np.float32)
+            foreach_get(texture_image.pixels, None, pixels)
+            return image_writer.submit(output_path, pixels.reshape(render_resolution, render_resolution, 4), sticker_format, exr_codec)
+        save_weight_image(texture_image, output_path, sticker_format, exr_codec)
         
     except BaseException as e:
         print(e)
         print("ERROR")
+        # let the caller record the failed group
+        raise
 
     finally:
-        scene.render.image_settings.file_format = default_file_format
-        scene.render.image_settings.color_mode = default_color_mode
-        scene.render.image_settings.exr_codec = default_codec
+        # the sticker is on disk (or queued), so the image is not kept around unsaved
+        if texture_image is not None:
+            bpy.data.images.remove(texture_image)
         scene.cycles.samples = default_scene_samples
         scene.display_settings.display_device = default_display_device
         scene.view_settings.view_transform = default_view_transform
@@ -392,15 +410,129 @@ def bake_weights(vertex_group_name, obj, output_path):
         scene.cycles.device = default_compute_device
         scene.render.engine = default_render_engine
 
-def get_weight_area_center(vertex_group_dictionaries, source_vertex_group_name, source_obj, kdt):
-    vertex_information = vertex_group_dictionaries[source_vertex_group_name]
-    source_selected_vertices = [vertex_information[v_idx]["world"] for v_idx in vertex_information]
-    length = len(source_selected_vertices)
-    center = sum(source_selected_vertices, Vector()) / length # look up this syntas again
-    #vertex_group_dict[vertex_group_name][v.index] = {"weight": weight, "world": v_world, "vertex": v}
-    vertex_index = get_closest_vertex_on_mesh_with_kdtree(center, kdt)
-    closest_vertex = source_obj.data.vertices[vertex_index]
-    return closest_vertex
+
+def save_weight_image(texture_image, output_path, sticker_format="COLORMAP_EXR", exr_codec=None):
+    # writes through Blender, for codecs like PIZ and DWAA that image_io can not write
+    scene = bpy.context.scene
+    settings = STICKER_FORMATS[sticker_format]
+    default_file_format = scene.render.image_settings.file_format
+    default_color_mode = scene.render.image_settings.color_mode
+    default_color_depth = scene.render.image_settings.color_depth
+    default_codec = scene.render.image_settings.exr_codec
+    default_view_transform = scene.view_settings.view_transform
+
+    try:
+        scene.render.image_settings.file_format = settings["file_format"]
+        scene.render.image_settings.color_mode = settings["color_mode"]
+        scene.render.image_settings.color_depth = settings["color_depth"]
+        exr_codec = exr_codec or settings["exr_codec"]
+        if exr_codec:
+            scene.render.image_settings.exr_codec = exr_codec
+        # weights are data, a view transform would bend them when writing non-linear formats like PNG
+        scene.view_settings.view_transform = 'Raw'
+        # save as render so we have more control over compression settings
+        with profiler.stage("save", Path(output_path).stem, pixels=texture_image.size[0] * texture_image.size[1]):
+            texture_image.save_render(
+                filepath=bpy.path.abspath(output_path), scene=scene, quality=0
+            )
+    finally:
+        scene.render.image_settings.file_format = default_file_format
+        scene.render.image_settings.color_mode = default_color_mode
+        scene.render.image_settings.color_depth = default_color_depth
+        scene.render.image_settings.exr_codec = default_codec
+        scene.view_settings.view_transform = default_view_transform
+
+    write_sticker_metadata(output_path, sticker_format, resolution=texture_image.size[0], exr_codec=exr_codec)
+
+
+def bake_weights_raster(vertex_group_name, obj, output_path, sticker_format="COLORMAP_EXR", image_writer=None, exr_codec=None,
+                        resolution_settings=None, margin=2):
+    """
+    CPU alternative to bake_weights. Rasterizes the triangles of obj directly in UV space and
+    interpolates the "WeightValue" attribute, so no render engine or GPU is needed and the
+    result is deterministic. Writes the same image layout as the Cycles bake.
+    """
+    mesh = obj.data
+    triangles = read_loop_triangles(mesh)
+    loop_uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+    foreach_get(mesh.uv_layers.active.data, "uv", loop_uvs)
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    foreach_get(mesh.loops, "vertex_index", loop_vertices)
+    vertex_weights = np.empty(len(mesh.vertices), dtype=np.float32)
+    foreach_get(mesh.attributes["WeightValue"].data, "value", vertex_weights)
+    render_resolution = choose_bake_resolution(
+        loop_uvs.reshape(-1, 2), triangles, len(mesh.vertices), **(resolution_settings or BAKE_RESOLUTION)
+    )
+
+    with profiler.stage("bake", vertex_group_name, pixels=render_resolution * render_resolution):
+        rgba = render_sticker_pixels(
+            loop_uvs.reshape(-1, 2), triangles, vertex_weights[loop_vertices], render_resolution, margin,
+            STICKER_FORMATS[sticker_format]["encoding"]
+        )
+    if image_writer is not None and can_write_sticker(sticker_format, exr_codec):
+        return image_writer.submit(output_path, rgba, sticker_format, exr_codec)
+
+    texture_image = bpy.data.images.new(
+        name=vertex_group_name, width=render_resolution, height=render_resolution, alpha=True, float_buffer=True
+    )
+    try:
+        texture_image.filepath_raw = output_path
+        texture_image.use_half_precision = False
+        texture_image.colorspace_settings.is_data = True
+        foreach_set(texture_image.pixels, None, rgba.ravel())
+        save_weight_image(texture_image, output_path, sticker_format, exr_codec)
+    finally:
+        bpy.data.images.remove(texture_image)
+
+
+def build_vertex_kdtree(coordinates):
+    # one KD-tree per mesh, shared by every anchor lookup
+    kd = kdtree.KDTree(len(coordinates))
+    for index, co in enumerate(np.asarray(coordinates).tolist()):
+        kd.insert(co, index)
+    kd.balance()
+    return kd
+
+
+def get_group_anchors(group_weights, group_names=None, kd=None, principal_axes=False):
+    """
+    Sticker anchors of many groups at once: the weighted centroid of every group (see get_group_statistics)
+    snapped to the closest vertex of the mesh.
+
+    :param group_names: Groups to anchor, every group with weights when None.
+    :param kd: KD-tree over group_weights["world"] from build_vertex_kdtree(), built when not given.
+    :param principal_axes: Also return the principal "axes" and "variances" of every group.
+    :return: Dict of {group name: {"vertex", "location", "centroid", "bbox_min", "bbox_max", ...}}, in world
+        space. Groups without weights are left out.
+    """
+    with profiler.stage("anchors", vertices=len(group_weights["weights"])):
+        statistics = get_group_statistics(group_weights, principal_axes=principal_axes)
+        if kd is None:
+            kd = build_vertex_kdtree(group_weights["world"])
+        wanted = set(statistics["names"] if group_names is None else group_names)
+        anchors = {}
+        for index, group_name in enumerate(statistics["names"]):
+            if group_name not in wanted or statistics["total_weights"][index] <= 0:
+                continue
+            location, vertex_index, _ = kd.find(statistics["centroids"][index].tolist())
+            anchor = {
+                "vertex": vertex_index,
+                "location": tuple(location),
+                "centroid": statistics["centroids"][index],
+                "bbox_min": statistics["bbox_min"][index],
+                "bbox_max": statistics["bbox_max"][index],
+            }
+            if principal_axes:
+                anchor["axes"] = statistics["axes"][index]
+                anchor["variances"] = statistics["variances"][index]
+            anchors[group_name] = anchor
+    return anchors
+
+
+def get_weight_area_center(group_weights, source_vertex_group_name, source_obj, kdt=None):
+    # the vertex closest to the weighted centroid of one group, get_group_anchors does many groups at once
+    anchor = get_group_anchors(group_weights, [source_vertex_group_name], kdt)[source_vertex_group_name]
+    return source_obj.data.vertices[anchor["vertex"]]
 
 
 def mark_location(vertex):
@@ -410,13 +542,386 @@ def get_vertex_groups(mesh_name):
     vertex_groups = bpy.data.objects[mesh_name].vertex_groups
     return vertex_groups
 
-source_mesh_name = "LOD_1_Group_0_Sub_3__esf_Head00"
 
-bm = bmesh.new() #bmesh where you will put copy of source vertex
-vertex_group_dictionary = arrange_all_groups(source_mesh_name, bm)
-total_groups = len(vertex_group_dictionary)
-for idx, source_vertex_group_name in enumerate(vertex_group_dictionary):
-    image_path = str(Path("E:/MODS/scripts") / "EXAMPLE" / f"{source_vertex_group_name}.exr")
-    create_weight_sticker(vertex_group_dictionary, source_mesh_name, source_vertex_group_name, image_path)
-    progress_bar(idx, total_groups)
+BAKE_BACKENDS = {
+    "CYCLES": bake_weights,
+    "RASTER": bake_weights_raster,
+}
+
+def bake_groups(group_weights, source_mesh_name, group_names, output_dir, bake_backend="CYCLES", manifest=None, cache_key="",
+                source_topology=None, sticker_format="COLORMAP_EXR", image_writer=None, exr_codec=None, process_pool=None,
+                profile_group=None, resolution_settings=None):
+    """
+    Bakes one sticker per group and keeps going when a group fails.
+    With a manifest, groups whose cache key matches an existing sticker are skipped.
+    With an image_writer, the next group bakes while the last one is written.
+    With a process_pool, RASTER bakes of an unwrapped-once mesh run in the pool (see submit_raster_sticker).
+    The group named profile_group is baked under cProfile, its stats are saved as <group>.prof in output_dir.
+    Every sticker gets its own resolution, see choose_bake_resolution() and resolution_settings.
+
+    :return: Dict of {group name: {"status": "ok", "skipped" or "error", "path" or "error": ...}}.
+    """
+    results = {}
+    # (group name, write future, cache key, image path) of the stickers still being written
+    pending_writes = []
+    progress = GroupProgress(len(group_names))
+    if source_topology is None:
+        source_topology = get_mesh_topology(bpy.data.objects[source_mesh_name])
+    for idx, source_vertex_group_name in enumerate(group_names):
+        image_path = str(Path(output_dir) / f"{source_vertex_group_name}{STICKER_FORMATS[sticker_format]['extension']}")
+
+        group_key = None
+        if manifest is not None:
+            group_key = group_bake_key(cache_key, *get_group_weights(group_weights, source_vertex_group_name))
+            if manifest.is_fresh(source_vertex_group_name, group_key, image_path):
+                results[source_vertex_group_name] = {"status": "skipped", "path": image_path}
+                progress.update(source_vertex_group_name, skipped=True)
+                continue
+            manifest.invalidate(source_vertex_group_name)
+
+        profiling_group = source_vertex_group_name == profile_group
+        try:
+            with profile_calls(profiling_group, Path(output_dir) / f"{source_vertex_group_name}.prof"):
+                if process_pool is not None and bake_backend == "RASTER" and source_topology["loop_uvs"] is not None:
+                    write_future = submit_raster_sticker(
+                        process_pool, group_weights, source_topology, source_vertex_group_name, image_path, sticker_format, exr_codec,
+                        resolution_settings
+                    )
+                else:
+                    write_future = create_weight_sticker(
+                        group_weights, source_mesh_name, source_vertex_group_name, image_path, bake_backend, source_topology,
+                        sticker_format, image_writer, exr_codec, resolution_settings
+                    )
+                # the profiled group includes its write, even when it runs in the background
+                if profiling_group and write_future is not None:
+                    write_future.exception()
+            pending_writes.append((source_vertex_group_name, write_future, group_key, image_path))
+        except Exception as e:
+            print(f"\nFailed to bake '{source_vertex_group_name}': {e}")
+            results[source_vertex_group_name] = {"status": "error", "error": str(e)}
+        collect_written_stickers(pending_writes, results, manifest)
+        progress.update(source_vertex_group_name, vertices=len(get_group_weights(group_weights, source_vertex_group_name)[0]))
+
+    collect_written_stickers(pending_writes, results, manifest, wait=True)
+    return results
+
+
+def bake_packed_groups(group_weights, group_names, output_dir, manifest=None, cache_key="", source_topology=None,
+                       sticker_format="WEIGHT_EXR_FLOAT", exr_codec=None, process_pool=None, pack_mode="RGBA", pack_size=4,
+                       resolution_settings=None):
+    """
+    Bakes the groups into packed stickers of pack_size groups each, one channel per group (see
+    get_pack_channels), every pack rasterized in one pass over its faces. Needs the UVs of the whole mesh
+    (--unwrap-once), the groups share them instead of being cropped one by one.
+
+    Each group is recorded in the manifest with the key of its whole pack, so a pack is re-baked as soon
+    as any of its groups or its layout changes.
+
+    :return: Dict of {group name: {"status": "ok", "skipped" or "error", "path" and "channel" or "error": ...}}.
+    """
+    extension = STICKER_FORMATS[sticker_format]["extension"]
+    packs = []
+    for start in range(0, len(group_names), pack_size):
+        names = group_names[start:start + pack_size]
+        groups = dict(zip(names, get_pack_channels(names, pack_mode)))
+        # named after the first group so packs of different bake_runner workers never collide
+        image_path = str(Path(output_dir) / f"pack_{names[0]}{extension}")
+        pack_key = hash_settings({
+            "file": Path(image_path).name,
+            "groups": groups,
+            "keys": [group_bake_key(cache_key, *get_group_weights(group_weights, name)) for name in names],
+        })
+        packs.append((groups, image_path, pack_key))
+
+    results = {}
+    stale_packs = []
+    for groups, image_path, pack_key in packs:
+        if manifest is not None and all(manifest.is_fresh(name, pack_key, image_path) for name in groups):
+            for name, channel in groups.items():
+                results[name] = {"status": "skipped", "path": image_path, "channel": channel}
+        else:
+            stale_packs.append((groups, image_path, pack_key))
+    # invalidate before baking anything, a stale entry may point at a pack file re-baked earlier in this run.
+    # A bake_runner worker only deletes the pack files it re-bakes itself, the others may be written by another
+    # worker right now, bake_runner removes the ones left over once every worker is done
+    if manifest is not None:
+        rebaked_files = {Path(image_path).name for _, image_path, _ in stale_packs}
+        for groups, _, _ in stale_packs:
+            for name in groups:
+                entry = manifest.entries.get(name)
+                keep_file = manifest.shard is not None and entry is not None and entry["file"] not in rebaked_files
+                manifest.invalidate(name, keep_file=keep_file)
+
+    progress = GroupProgress(len(stale_packs))
+    pending_writes = []
+    for groups, image_path, pack_key in stale_packs:
+        pack_name = Path(image_path).stem
+        vertex_count = 0
+        try:
+            with profiler.stage("duplicate", pack_name):
+                loop_uvs, triangles, loop_weights, vertex_count = get_packed_submesh(group_weights, list(groups), source_topology)
+            resolution = choose_bake_resolution(loop_uvs, triangles, vertex_count, **(resolution_settings or BAKE_RESOLUTION))
+            arguments = (image_path, loop_uvs, triangles, loop_weights, groups, sticker_format, exr_codec, resolution)
+            if process_pool is not None:
+                write_future = process_pool.submit(write_packed_raster_sticker, *arguments)
+            else:
+                with profiler.stage("bake", pack_name, pixels=resolution * resolution * len(groups)):
+                    write_packed_raster_sticker(*arguments)
+                write_future = None
+            pending_writes.append((groups, write_future, pack_key, image_path))
+        except Exception as e:
+            print(f"\nFailed to bake '{pack_name}': {e}")
+            for name in groups:
+                results[name] = {"status": "error", "error": str(e)}
+        progress.update(pack_name, vertices=vertex_count)
+
+    for groups, write_future, pack_key, image_path in pending_writes:
+        try:
+            if write_future is not None:
+                write_future.result()
+            for name, channel in groups.items():
+                results[name] = {"status": "ok", "path": image_path, "channel": channel}
+                if manifest is not None:
+                    manifest.record(name, pack_key, image_path)
+        except Exception as e:
+            print(f"\nFailed to write '{Path(image_path).name}': {e}")
+            for name in groups:
+                results[name] = {"status": "error", "error": str(e)}
+    return results
+
+
+def submit_raster_sticker(process_pool, group_weights, source_topology, source_vertex_group_name, output_path,
+                          sticker_format, exr_codec=None, resolution_settings=None):
+    """
+    RASTER bake of one group straight from the source arrays: no scratch mesh and no bpy call,
+    the rasterizing, encoding and writing happen in a worker process. The faces are split into
+    fans instead of Blender's loop triangles, which only differs for concave n-gons.
+
+    :return: Future of the worker, resolving to output_path.
+    """
+    vertex_indices, weights = get_group_weights(group_weights, source_vertex_group_name)
+    with profiler.stage("duplicate", source_vertex_group_name, vertices=len(vertex_indices)):
+        _, loop_vertices, loop_totals, kept_loops = get_group_submesh(source_topology, vertex_indices)
+    loop_uvs = crop_uvs(source_topology["loop_uvs"][kept_loops])
+    triangles = fan_triangles(loop_totals)
+    resolution = choose_bake_resolution(loop_uvs, triangles, len(vertex_indices), **(resolution_settings or BAKE_RESOLUTION))
+    # submesh vertex i is source vertex vertex_indices[i], which has weights[i]
+    return process_pool.submit(
+        write_raster_sticker, output_path, loop_uvs, triangles, weights[loop_vertices], sticker_format, exr_codec, resolution
+    )
+
+
+def start_process_pool(processes):
+    """
+    Process pool for submit_raster_sticker. Workers are spawned fresh and only import weight_core.
+    Spawned workers re-run the main script of the parent when it has a __file__, which would
+    import bpy, so it is hidden until the pool is shut down.
+
+    :return: (pool, restore function to call after pool.shutdown()).
+    """
+    main_module = sys.modules["__main__"]
+    main_file = main_module.__dict__.pop("__file__", None)
+
+    def restore():
+        if main_file is not None:
+            main_module.__file__ = main_file
+
+    return ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")), restore
+
+
+def collect_written_stickers(pending_writes, results, manifest, wait=False):
+    """
+    Records the stickers whose write has finished and removes them from pending_writes.
+    Runs on the main thread, so the manifest is only ever touched from there.
+
+    :param wait: Block until every pending write is done.
+    """
+    for entry in list(pending_writes):
+        group_name, write_future, group_key, image_path = entry
+        if write_future is not None and not (wait or write_future.done()):
+            continue
+        pending_writes.remove(entry)
+        try:
+            if write_future is not None:
+                write_future.result()
+            if not Path(image_path).exists():
+                raise RuntimeError(f"No image was written to {image_path}")
+            results[group_name] = {"status": "ok", "path": image_path}
+            if manifest is not None:
+                manifest.record(group_name, group_key, image_path)
+        except Exception as e:
+            print(f"\nFailed to write '{group_name}': {e}")
+            results[group_name] = {"status": "error", "error": str(e)}
+
+
+def get_mesh_cache_key(source_mesh_name, bake_settings):
+    # everything the stickers of all groups depend on besides their own weights
+    mesh = bpy.data.objects[source_mesh_name].data
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    foreach_get(mesh.vertices, "co", coords)
+    loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+    foreach_get(mesh.polygons, "loop_start", loop_starts)
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    foreach_get(mesh.loops, "vertex_index", loop_vertices)
+    loop_uvs = np.empty(len(mesh.loops) * 2 if mesh.uv_layers.active else 0, dtype=np.float32)
+    if mesh.uv_layers.active:
+        foreach_get(mesh.uv_layers.active.data, "uv", loop_uvs)
+    return hash_arrays(coords, loop_starts, loop_vertices, loop_uvs) + hash_settings(bake_settings)
+
+
+def parse_arguments(argv):
+    # Blender hands everything after "--" to the script, running from the text editor passes nothing
+    script_argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    parser = argparse.ArgumentParser(description="Bake every vertex group of a mesh into a weight sticker.")
+    parser.add_argument("--mesh", default="LOD_1_Group_0_Sub_3__esf_Head00", help="source mesh object name")
+    parser.add_argument("--output-dir", default=str(Path("E:/MODS/scripts") / "EXAMPLE"))
+    # "RASTER" bakes on the CPU without Cycles, for machines without a GPU
+    parser.add_argument("--backend", default="CYCLES", choices=sorted(BAKE_BACKENDS))
+    parser.add_argument("--groups-file", help="JSON list of the group names to bake, all groups when omitted")
+    parser.add_argument("--list-groups", help="write {group name: vertex count} to this JSON file and exit")
+    parser.add_argument("--report", help="write the per group results to this JSON file")
+    # COLORMAP_EXR is the old blue-green-red sticker, handy as a preview, the _HALF formats are 16 bit float EXRs
+    parser.add_argument("--format", default="WEIGHT_EXR_FLOAT", choices=sorted(STICKER_FORMATS))
+    parser.add_argument("--exr-codec", choices=["NONE", "ZIPS", "ZIP", "PIZ", "DWAA", "DWAB"],
+                        help="override the EXR codec of the format, NONE, ZIPS and ZIP are written in the background, "
+                             "the others are saved by Blender and ignore --write-queue")
+    parser.add_argument("--write-queue", type=int, default=2,
+                        help="stickers waiting to be written before baking pauses, 0 writes each sticker before the next bake")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="RASTER bakes with --unwrap-once run in this many worker processes")
+    parser.add_argument("--profile", help="write a Chrome trace of the stages to this JSON file (chrome://tracing, Perfetto)")
+    parser.add_argument("--profile-group", help="bake this group under cProfile and save <group>.prof in the output directory")
+    parser.add_argument("--texels-per-vertex", type=float, default=BAKE_RESOLUTION["texels_per_vertex"],
+                        help="texels aimed for per group vertex when picking the sticker resolution")
+    parser.add_argument("--min-resolution", type=int, default=BAKE_RESOLUTION["min_resolution"],
+                        help="smallest sticker resolution, set it to --max-resolution for a fixed size")
+    parser.add_argument("--max-resolution", type=int, default=BAKE_RESOLUTION["max_resolution"],
+                        help="largest sticker resolution")
+    parser.add_argument("--pack", choices=["RGBA", "CHANNELS"],
+                        help="rasterize --pack-size groups into each sticker, as R, G, B, A or as channels named after "
+                             "the groups (needs --unwrap-once and a WEIGHT_EXR format)")
+    parser.add_argument("--pack-size", type=int, default=4, help="groups per packed sticker, at most 4 for RGBA")
+    parser.add_argument("--mirror-side", choices=["L", "R"],
+                        help="only bake this side of L_/R_ group pairs, the other side is mirrored on import")
+    parser.add_argument("--unwrap-once", action="store_true",
+                        help="unwrap the whole mesh once and crop every group out of it instead of unwrapping per group")
+    parser.add_argument("--no-cache", action="store_true", help="re-bake every group, ignoring the manifest")
+    parser.add_argument("--manifest-shard", help="write manifest changes to a shard file, used by bake_runner.py")
+    return parser.parse_args(script_argv)
+
+
+def main(argv):
+    args = parse_arguments(argv)
+    profiler.reset()
+
+    with profiler.stage("extract"):
+        group_weights = extract_group_weights(args.mesh)
+    profiler.count(vertices_read=len(group_weights["world"]), weights_read=len(group_weights["weights"]))
+    group_names = get_weighted_group_names(group_weights)
+    mirrored_groups = {}
+    if args.mirror_side:
+        group_names, mirrored_groups = split_mirrored_groups(group_names, args.mirror_side)
+
+    if args.list_groups:
+        vertex_counts = dict(zip(group_weights["names"], np.diff(group_weights["offsets"]).tolist()))
+        with open(args.list_groups, "w") as file:
+            json.dump({name: vertex_counts[name] for name in group_names}, file, indent=4)
+        return
+
+    if args.groups_file:
+        with open(args.groups_file, "r") as file:
+            wanted = set(json.load(file))
+        group_names = [name for name in group_names if name in wanted]
+
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    pack_mode = args.pack
+    settings = STICKER_FORMATS[args.format]
+    if pack_mode and not (args.unwrap_once and settings["encoding"] == "WEIGHT" and settings["file_format"] == 'OPEN_EXR'):
+        print("--pack needs --unwrap-once and a WEIGHT_EXR format, baking one sticker per group.")
+        pack_mode = None
+    pack_size = max(1, min(args.pack_size, 4) if pack_mode == "RGBA" else args.pack_size)
+    if args.write_queue > 0 and not can_write_sticker(args.format, args.exr_codec):
+        print(f"--exr-codec {args.exr_codec} is saved by Blender, so --write-queue is ignored and every sticker is "
+              f"written before the next bake. Use NONE, ZIPS or ZIP to write in the background.")
+
+    resolution_settings = {
+        "texels_per_vertex": args.texels_per_vertex,
+        "min_resolution": args.min_resolution,
+        "max_resolution": args.max_resolution,
+    }
+    manifest = None
+    cache_key = ""
+    if not args.no_cache:
+        # anything that changes the baked pixels belongs in here
+        bake_settings = {
+            "backend": args.backend, "format": args.format, "exr_codec": args.exr_codec, "unwrap_once": args.unwrap_once,
+            "resolution": resolution_settings, "pack": pack_mode, "pack_size": pack_size,
+            # the headers of baked stickers name the group mirrored from them
+            "mirror_side": args.mirror_side,
+        }
+        cache_key = get_mesh_cache_key(args.mesh, bake_settings)
+        manifest = BakeManifest(args.output_dir, shard=args.manifest_shard)
+        # only a run over every group knows which stickers are left over
+        if not args.groups_file and args.manifest_shard is None:
+            manifest.remove_stale(group_names)
+
+    with profiler.stage("unwrap"):
+        loop_uvs = unwrap_source_once(args.mesh) if args.unwrap_once else None
+    with profiler.stage("extract"):
+        source_topology = get_mesh_topology(bpy.data.objects[args.mesh], loop_uvs)
+
+    image_writer = ImageWriter(args.write_queue) if args.write_queue > 0 else None
+    process_pool = None
+    if args.processes > 0:
+        # packs are always rasterized, whatever the backend
+        if (args.backend == "RASTER" or pack_mode) and args.unwrap_once:
+            process_pool, restore_main = start_process_pool(args.processes)
+        else:
+            print("--processes needs --backend RASTER and --unwrap-once, baking in this process.")
+    try:
+        if pack_mode:
+            results = bake_packed_groups(
+                group_weights, group_names, args.output_dir, manifest, cache_key, source_topology, args.format,
+                args.exr_codec, process_pool, pack_mode, pack_size, resolution_settings
+            )
+        else:
+            results = bake_groups(
+                group_weights, args.mesh, group_names, args.output_dir, args.backend, manifest, cache_key, source_topology,
+                args.format, image_writer, args.exr_codec, process_pool, args.profile_group, resolution_settings
+            )
+    finally:
+        if process_pool is not None:
+            process_pool.shutdown()
+            restore_main()
+        if image_writer is not None:
+            image_writer.close()
+        remove_scratch_object()
+        if manifest is not None:
+            manifest.save()
+        profiler.print_summary()
+        if args.profile:
+            profiler.write_chrome_trace(args.profile)
+
+    # tell the importer which groups to re-derive from the baked side
+    for source_name, mirrored_name in mirrored_groups.items():
+        result = results.get(source_name)
+        if result is None or result["status"] not in ("ok", "skipped"):
+            continue
+        if "channel" in result:
+            # a packed sticker lists the mirrored group of each of its groups
+            mirrors = read_sticker_metadata(result["path"]).get("mirrors", {})
+            mirrors[source_name] = mirrored_name
+            update_sticker_metadata(result["path"], mirrors=mirrors)
+        else:
+            update_sticker_metadata(result["path"], mirror=mirrored_name)
+        results[mirrored_name] = {"status": "mirrored", "source": source_name}
+    if pack_mode and not args.groups_file and args.manifest_shard is None:
+        write_sticker_index(args.output_dir)
+
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(results, file, indent=4)
+
 
+if __name__ == "__main__":
+    main(sys.argv)
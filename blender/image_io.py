@@ -0,0 +1,220 @@
+import os
+import queue
+import struct
+import threading
+import zlib
+from concurrent.futures import Future
+from pathlib import Path
+
+import numpy as np
+
+from sticker_format import STICKER_FORMATS, write_sticker_metadata
+from profiling import profiler
+
+# OpenEXR compression ids, and how many scanlines one chunk holds for the codecs written here.
+# PIZ, DWAA and the other codecs are left to Blender (see can_write_sticker).
+EXR_COMPRESSIONS = {"NONE": 0, "RLE": 1, "ZIPS": 2, "ZIP": 3, "PIZ": 4, "PXR24": 5, "B44": 6, "B44A": 7, "DWAA": 8, "DWAB": 9}
+EXR_LINES_PER_CHUNK = {"NONE": 1, "ZIPS": 1, "ZIP": 16}
+EXR_PIXEL_TYPES = {np.dtype('<f2'): 1, np.dtype('<f4'): 2}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def can_write_sticker(sticker_format, exr_codec=None):
+    # True when write_sticker_image can write the format without Blender
+    settings = STICKER_FORMATS[sticker_format]
+    if settings["file_format"] == 'PNG':
+        return True
+    return (exr_codec or settings["exr_codec"]) in EXR_LINES_PER_CHUNK
+
+
+def write_sticker_image(output_path, pixels, sticker_format, exr_codec=None):
+    """
+    Writes baked sticker pixels and their metadata header without touching bpy, so it can run on
+    the ImageWriter thread.
+
+    :param pixels: (height, width, 4) float RGBA in bpy.types.Image.pixels order, row 0 at the bottom.
+    :param sticker_format: A STICKER_FORMATS name.
+    :param exr_codec: Overrides the EXR codec of the format.
+    """
+    with profiler.stage("save", Path(output_path).stem, pixels=np.shape(pixels)[0] * np.shape(pixels)[1]):
+        write_sticker_file(output_path, pixels, sticker_format, exr_codec)
+
+
+def write_sticker_file(output_path, pixels, sticker_format, exr_codec=None):
+    settings = STICKER_FORMATS[sticker_format]
+    # files store the top row first
+    pixels = np.asarray(pixels)[::-1]
+    # write next to the target first so a failed write never leaves half a sticker behind
+    temp_path = Path(str(output_path) + ".tmp")
+    if settings["file_format"] == 'PNG':
+        write_png16(temp_path, pixels[:, :, 0])
+        os.replace(temp_path, output_path)
+        write_sticker_metadata(output_path, sticker_format, resolution=pixels.shape[1])
+        return
+
+    if settings["encoding"] == "WEIGHT":
+        channels = {"Y": pixels[:, :, 0]}
+    else:
+        channels = {"R": pixels[:, :, 0], "G": pixels[:, :, 1], "B": pixels[:, :, 2]}
+    exr_codec = exr_codec or settings["exr_codec"]
+    write_exr(temp_path, channels, half=settings["color_depth"] == '16', codec=exr_codec)
+    os.replace(temp_path, output_path)
+    write_sticker_metadata(output_path, sticker_format, resolution=pixels.shape[1], exr_codec=exr_codec)
+
+
+def write_packed_sticker_image(output_path, weight_image, groups, sticker_format, exr_codec=None):
+    """
+    Writes a sticker holding several groups, one EXR channel per group, and its header.
+
+    :param weight_image: (height, width, K) raw weights, row 0 at the bottom.
+    :param groups: Dict of {group name: channel name}, in the order of the last axis of weight_image.
+    :param sticker_format: A WEIGHT EXR name of STICKER_FORMATS.
+    """
+    settings = STICKER_FORMATS[sticker_format]
+    if settings["file_format"] != 'OPEN_EXR' or settings["encoding"] != "WEIGHT":
+        raise ValueError(f"Packed stickers need a WEIGHT EXR format, not '{sticker_format}'.")
+    with profiler.stage("save", Path(output_path).stem, pixels=weight_image.shape[0] * weight_image.shape[1]):
+        # files store the top row first
+        weight_image = np.asarray(weight_image)[::-1]
+        channels = {channel: weight_image[:, :, column] for column, channel in enumerate(groups.values())}
+        exr_codec = exr_codec or settings["exr_codec"]
+        temp_path = Path(str(output_path) + ".tmp")
+        write_exr(temp_path, channels, half=settings["color_depth"] == '16', codec=exr_codec)
+        os.replace(temp_path, output_path)
+        write_sticker_metadata(
+            output_path, sticker_format, resolution=weight_image.shape[1], exr_codec=exr_codec, groups=dict(groups)
+        )
+
+
+def write_exr(path, channels, half=False, codec="ZIP"):
+    """
+    Minimal scanline OpenEXR writer.
+
+    :param channels: Dict of {channel name: (height, width) array}, row 0 at the top.
+    :param half: Store 16 bit half floats instead of 32 bit floats.
+    :param codec: "NONE", "ZIPS" or "ZIP".
+    """
+    if codec not in EXR_LINES_PER_CHUNK:
+        raise ValueError(f"Codec '{codec}' can not be written without Blender.")
+    dtype = np.dtype('<f2') if half else np.dtype('<f4')
+    names = sorted(channels)
+    height, width = channels[names[0]].shape
+
+    channel_list = b"".join(
+        name.encode() + b"\0" + struct.pack("<iB3xii", EXR_PIXEL_TYPES[dtype], 0, 1, 1) for name in names
+    ) + b"\0"
+    window = struct.pack("<iiii", 0, 0, width - 1, height - 1)
+    header = b"".join([
+        struct.pack("<ii", 20000630, 2),
+        exr_attribute("channels", "chlist", channel_list),
+        exr_attribute("compression", "compression", struct.pack("<B", EXR_COMPRESSIONS[codec])),
+        exr_attribute("dataWindow", "box2i", window),
+        exr_attribute("displayWindow", "box2i", window),
+        exr_attribute("lineOrder", "lineOrder", struct.pack("<B", 0)),
+        exr_attribute("pixelAspectRatio", "float", struct.pack("<f", 1.0)),
+        exr_attribute("screenWindowCenter", "v2f", struct.pack("<ff", 0.0, 0.0)),
+        exr_attribute("screenWindowWidth", "float", struct.pack("<f", 1.0)),
+        b"\0",
+    ])
+
+    # every scanline holds all channels one after another, in channel name order
+    lines = np.stack([np.asarray(channels[name], dtype=dtype) for name in names], axis=1)
+    lines_per_chunk = EXR_LINES_PER_CHUNK[codec]
+    chunks = []
+    for y in range(0, height, lines_per_chunk):
+        data = lines[y:y + lines_per_chunk].tobytes()
+        if codec != "NONE":
+            data = exr_zip_compress(data)
+        chunks.append(struct.pack("<ii", y, len(data)) + data)
+
+    offsets = np.cumsum([0] + [len(chunk) for chunk in chunks[:-1]], dtype=np.int64) + len(header) + 8 * len(chunks)
+    with open(path, "wb") as file:
+        file.write(header)
+        file.write(offsets.astype('<u8').tobytes())
+        for chunk in chunks:
+            file.write(chunk)
+
+
+def exr_attribute(name, type_name, value):
+    return name.encode() + b"\0" + type_name.encode() + b"\0" + struct.pack("<i", len(value)) + value
+
+
+def exr_zip_compress(data):
+    # OpenEXR ZIP: split even and odd bytes, delta encode them, then deflate
+    raw = np.frombuffer(data, dtype=np.uint8)
+    reordered = np.concatenate([raw[0::2], raw[1::2]])
+    predicted = reordered.copy()
+    predicted[1:] = (np.diff(reordered.astype(np.int16)) + 128) & 0xFF
+    compressed = zlib.compress(predicted.tobytes())
+    # readers take a chunk as stored when it did not get smaller
+    return compressed if len(compressed) < len(data) else data
+
+
+def write_png16(path, gray):
+    """
+    Writes a 16 bit grayscale PNG.
+
+    :param gray: (height, width) weights in 0..1, row 0 at the top.
+    """
+    height, width = gray.shape
+    values = np.round(np.clip(gray, 0.0, 1.0) * 65535).astype('>u2')
+    # filter type 0 (none) in front of every row
+    rows = np.zeros((height, 1 + 2 * width), dtype=np.uint8)
+    rows[:, 1:] = values.view(np.uint8).reshape(height, 2 * width)
+    with open(path, "wb") as file:
+        file.write(PNG_SIGNATURE)
+        file.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 16, 0, 0, 0, 0)))
+        file.write(png_chunk(b"IDAT", zlib.compress(rows.tobytes())))
+        file.write(png_chunk(b"IEND", b""))
+
+
+def png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+class ImageWriter:
+    """
+    Compresses and writes stickers on a background thread, so the next group bakes while the last
+    one goes to disk. The queue is bounded: submit() blocks once max_pending images are waiting,
+    which caps the memory held by finished bakes.
+    """
+
+    def __init__(self, max_pending=2):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._run, name="StickerWriter", daemon=True)
+        self.thread.start()
+
+    def submit(self, output_path, pixels, sticker_format, exr_codec=None):
+        """
+        Queues a write_sticker_image call. The writer owns pixels from now on, do not change it.
+
+        :return: concurrent.futures.Future resolving to output_path, or raising the write error.
+        """
+        future = Future()
+        self.queue.put((future, output_path, pixels, sticker_format, exr_codec))
+        return future
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            future, output_path, pixels, sticker_format, exr_codec = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                write_sticker_image(output_path, pixels, sticker_format, exr_codec)
+                future.set_result(output_path)
+            except BaseException as e:
+                future.set_exception(e)
+
+    def close(self):
+        # waits for the queued writes to finish
+        self.queue.put(None)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,182 @@
+import numpy as np
+
+from profiling import profiler
+from weight_core import build_group_csr
+
+
+# default quantization of write_vertex_group_weights(): the 16 bit precision of WEIGHT_PNG16 stickers, at most
+# 7.6e-6 off a float weight, which caps a write at 65536 vertex_group.add() calls instead of one per vertex
+WEIGHT_STEPS = 65535
+
+
+def write_vertex_group_weights(obj, vertex_group_name, vertex_indices, weights, mode='REPLACE', steps=WEIGHT_STEPS,
+                               dry_run=False):
+    """
+    Writes many weights into a vertex group with as few RNA calls as possible.
+    Weights are quantized to 1 / steps and every set of vertices sharing a weight is written with a single
+    vertex_group.add() call, so at most steps + 1 calls are made whatever the vertex count.
+
+    :param obj: Mesh object that owns (or will own) the vertex group.
+    :param vertex_group_name: Vertex group to write to, created if missing.
+    :param vertex_indices: Array of vertex indices.
+    :param weights: Array of weights, one per vertex index, clamped to 0.0 - 1.0.
+    :param mode: 'REPLACE', 'ADD' or 'SUBTRACT', passed on to vertex_group.add().
+    :param steps: Quantization steps between 0.0 and 1.0, e.g. the "weight_steps" of a sticker format. None
+        writes the exact weights, at up to one vertex_group.add() call per vertex.
+    :param dry_run: Only return the arrays that would be written, obj is not touched.
+    :return: The (vertex indices, weights) arrays that were written.
+    """
+    vertex_indices = np.asarray(vertex_indices, dtype=np.int64).ravel()
+    weights = np.clip(np.asarray(weights, dtype=np.float32).ravel(), 0.0, 1.0)
+    if len(vertex_indices) != len(weights):
+        raise ValueError("vertex_indices and weights must have the same length.")
+    if steps:
+        weights = (np.round(weights * steps) / steps).astype(np.float32)
+
+    if dry_run:
+        return vertex_indices, weights
+
+    vertex_group = obj.vertex_groups.get(vertex_group_name)
+    if not vertex_group:
+        vertex_group = obj.vertex_groups.new(name=vertex_group_name)
+
+    values, inverse = np.unique(weights, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    buckets = np.split(vertex_indices[order], np.cumsum(np.bincount(inverse, minlength=len(values)))[:-1])
+    with profiler.stage("write_weights", vertex_group_name, vertices=len(vertex_indices), rna_calls=len(values)):
+        for value, members in zip(values.tolist(), buckets):
+            vertex_group.add(members.tolist(), value, mode)
+
+    return vertex_indices, weights
+
+
+def foreach_get(collection, attribute, array):
+    """
+    collection.foreach_get() that also counts the call in the profiler's rna_calls, every bulk read of the
+    pipeline goes through here.
+
+    :param attribute: Attribute to read, None for collections read without one such as image.pixels.
+    """
+    if attribute is None:
+        collection.foreach_get(array)
+    else:
+        collection.foreach_get(attribute, array)
+    profiler.count(rna_calls=1)
+
+
+def foreach_set(collection, attribute, array):
+    # collection.foreach_set() counted like foreach_get()
+    if attribute is None:
+        collection.foreach_set(array)
+    else:
+        collection.foreach_set(attribute, array)
+    profiler.count(rna_calls=1)
+
+
+def read_vertex_group_weights(obj, vertex_group_names):
+    """
+    Reads the current weights of some vertex groups in a single pass over mesh.vertices[*].groups.
+
+    :param obj: Mesh object.
+    :param vertex_group_names: Names of the groups to read, missing groups read as empty.
+    :return: Dict of {group name: (N,) float32 weights}, 0.0 for vertices outside of the group.
+    """
+    mesh = obj.data
+    wanted = {}
+    for name in vertex_group_names:
+        vertex_group = obj.vertex_groups.get(name)
+        if vertex_group:
+            wanted[vertex_group.index] = name
+
+    dense = {name: np.zeros(len(mesh.vertices), dtype=np.float32) for name in vertex_group_names}
+    if not wanted:
+        return dense
+
+    element_count = 0
+    for v in mesh.vertices:
+        for element in v.groups:
+            element_count += 1
+            name = wanted.get(element.group)
+            if name is not None:
+                dense[name][v.index] = element.weight
+    # one RNA access per vertex for its groups and one per group element
+    profiler.count(rna_calls=len(mesh.vertices) + element_count)
+    return dense
+
+
+def read_group_weights(obj):
+    """
+    Reads every vertex group weight of a mesh in a single pass over mesh.vertices[*].groups, without
+    touching the mesh.
+
+    :param obj: Mesh object.
+    :return: A dict holding a CSR-style layout of the weights:
+        "names": vertex group names, in vertex group index order
+        "offsets": int64 array, group g owns entries offsets[g]:offsets[g + 1]
+        "indices": int32 array of vertex indices
+        "weights": float32 array of weights (only weights > 0 are stored)
+        "world": (N, 3) float64 array of world space vertex coordinates
+    """
+    group_names = [vertex_group.name for vertex_group in obj.vertex_groups]
+
+    group_ids = []
+    vertex_ids = []
+    weights = []
+    element_count = 0
+    for v in obj.data.vertices:
+        for element in v.groups:
+            element_count += 1
+            if element.weight > 0:
+                group_ids.append(element.group)
+                vertex_ids.append(v.index)
+                weights.append(element.weight)
+    # one RNA access per vertex for its groups and one per group element
+    profiler.count(rna_calls=len(obj.data.vertices) + element_count)
+
+    offsets, indices, weights = build_group_csr(group_ids, vertex_ids, weights, len(group_names))
+    return {
+        "names": group_names,
+        "offsets": offsets,
+        "indices": indices,
+        "weights": weights,
+        "world": get_world_coordinates(obj),
+    }
+
+
+def get_world_coordinates(obj):
+    # one foreach_get instead of a matrix multiplication per vertex
+    mesh = obj.data
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    foreach_get(mesh.vertices, "co", coords)
+    coords = coords.reshape(-1, 3).astype(np.float64)
+    matrix = np.array(obj.matrix_world, dtype=np.float64)
+    return coords @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def get_mesh_topology(obj, loop_uvs=None):
+    """
+    Reads the arrays needed to cut group submeshes out of a mesh.
+
+    :param loop_uvs: Optional (L, 2) UVs of the whole mesh to crop from instead of unwrapping per group.
+    """
+    mesh = obj.data
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    foreach_get(mesh.vertices, "co", coords)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int64)
+    foreach_get(mesh.polygons, "loop_total", loop_totals)
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int64)
+    foreach_get(mesh.loops, "vertex_index", loop_vertices)
+    return {
+        "co": coords.reshape(-1, 3),
+        "loop_totals": loop_totals,
+        "loop_vertices": loop_vertices,
+        "loop_uvs": loop_uvs,
+    }
+
+
+def read_loop_triangles(mesh):
+    # (T, 3) loop indices of the triangulated faces
+    mesh.calc_loop_triangles()
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    foreach_get(mesh.loop_triangles, "loops", triangles)
+    return triangles.reshape(-1, 3)
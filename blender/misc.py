@@ -1,8 +1,16 @@
 import bpy
 from pathlib import Path
 import json
+import sys
+from mathutils import kdtree
+import numpy as np
 
-def compare_vertex_groups(source, target):
+# sibling modules are not on sys.path when the script runs inside Blender
+sys.path.append(str(Path(__file__).resolve().parent))
+from mesh_io import read_vertex_group_weights, write_vertex_group_weights, foreach_get
+from weight_core import get_mirrored_group_name, mirror_weights
+
+def compare_vertex_groups(source, target, path="E:\MODS\scripts\compare_vertex_groups.txt"):
     # Ensure both objects are valid meshes
     if source.type != 'MESH' or target.type != 'MESH':
         print("Both objects must be meshes.")
@@ -19,11 +27,11 @@ def compare_vertex_groups(source, target):
         if i not in vertex_groups_target:
             left_overs.append(i)
 
-    path = "E:\MODS\scripts\compare_vertex_groups.txt"
-
-    with open(path, "w") as file:
-        for item in left_overs:
-            file.write(item + "\n")
+    # path=None only returns the list
+    if path:
+        with open(path, "w") as file:
+            for item in left_overs:
+                file.write(item + "\n")
 
     return left_overs 
 
@@ -49,7 +57,14 @@ def delete_vertex_groups_from_file():
 
 
 
-def ensure_mirrored_vertex_groups(obj):
+def ensure_mirrored_vertex_groups(obj, fill=False, tolerance=1e-4, mirror_map=None):
+    """
+    Creates the missing R_ group of every L_ group.
+
+    :param fill: Also fill every R_ group from its L_ group through the mirror map, in one bulk pass.
+    :param tolerance: Largest distance between a vertex and the mirrored position of its partner.
+    :param mirror_map: A get_mirror_vertex_map() result to reuse, built when needed and not given.
+    """
     # Ensure the object is a mesh
     if obj.type != 'MESH':
         print("Object is not a mesh.")
@@ -57,12 +72,14 @@ def ensure_mirrored_vertex_groups(obj):
     
     # Get the list of existing vertex group names
     existing_groups = {vg.name for vg in obj.vertex_groups}
+    group_pairs = {}
     
     # Iterate over vertex groups that start with "L_"
-    for vg_name in existing_groups:
+    for vg_name in sorted(existing_groups):
         if vg_name.startswith("L_"):
             # Create the mirrored group name
-            mirrored_name = vg_name.replace("L_", "R_", 1)  # Replace only the first occurrence
+            mirrored_name = get_mirrored_group_name(vg_name)
+            group_pairs[vg_name] = mirrored_name
             
             # Check if the mirrored group exists
             if mirrored_name not in existing_groups:
@@ -70,12 +87,71 @@ def ensure_mirrored_vertex_groups(obj):
                 obj.vertex_groups.new(name=mirrored_name)
                 print(f"Added mirrored vertex group: {mirrored_name}")
 
+    if fill and group_pairs:
+        mirror_vertex_groups(obj, group_pairs, tolerance, mirror_map)
+
+
+def get_mirror_vertex_map(obj, tolerance=1e-4, axis=0):
+    """
+    Finds the mirror partner of every vertex across the local plane at 0 on axis (X by default),
+    with one KD-tree lookup per vertex.
+
+    :return: (V,) int64 array of partner vertex indices, -1 where no vertex lies within tolerance
+        of the mirrored position. Vertices on the mirror plane are their own partner.
+    """
+    mesh = obj.data
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    foreach_get(mesh.vertices, "co", coords)
+    coords = coords.reshape(-1, 3)
+
+    kd = kdtree.KDTree(len(coords))
+    for index, co in enumerate(coords.tolist()):
+        kd.insert(co, index)
+    kd.balance()
+
+    mirrored = coords.copy()
+    mirrored[:, axis] *= -1
+    mirror_map = np.full(len(coords), -1, dtype=np.int64)
+    for index, co in enumerate(mirrored.tolist()):
+        _, partner, distance = kd.find(co)
+        if partner is not None and distance <= tolerance:
+            mirror_map[index] = partner
+
+    unmatched = int((mirror_map < 0).sum())
+    if unmatched:
+        print(f"{unmatched} vertices of '{obj.name}' have no mirror partner within {tolerance}.")
+    return mirror_map
+
+
+def mirror_vertex_groups(obj, group_pairs, tolerance=1e-4, mirror_map=None):
+    """
+    Replaces every target group with its mirrored source group. All source groups are read in one
+    pass over the vertices, every target is written with the bucketed write_vertex_group_weights.
+
+    :param group_pairs: Dict of {source group name: target group name}.
+    :return: The mirror map, to reuse for further calls on the same mesh.
+    """
+    if mirror_map is None:
+        mirror_map = get_mirror_vertex_map(obj, tolerance)
+    source_weights = read_vertex_group_weights(obj, list(group_pairs))
+    all_vertices = list(range(len(obj.data.vertices)))
+    for source_name, target_name in group_pairs.items():
+        weights = mirror_weights(source_weights[source_name], mirror_map)
+        # the mirrored weights replace whatever the target held before
+        target_group = obj.vertex_groups.get(target_name)
+        if target_group:
+            target_group.remove(all_vertices)
+        vertex_indices = np.flatnonzero(weights > 0)
+        write_vertex_group_weights(obj, target_name, vertex_indices, weights[vertex_indices], 'REPLACE')
+    return mirror_map
 
-# Example usage
-source = bpy.data.objects.get("LOD_1_Group_0_Sub_3__esf_Head00")  # Replace with your object name
-target = bpy.data.objects.get("low_head")  # Replace with your object name
 
-if source and target:
-    unique_vertex_groups = compare_vertex_groups(source, target)
-else:
-    print("One or both objects not found.")
+# Example usage
+if __name__ == "__main__":
+    source = bpy.data.objects.get("LOD_1_Group_0_Sub_3__esf_Head00")  # Replace with your object name
+    target = bpy.data.objects.get("low_head")  # Replace with your object name
+
+    if source and target:
+        unique_vertex_groups = compare_vertex_groups(source, target)
+    else:
+        print("One or both objects not found.")
@@ -0,0 +1,181 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StageProfiler:
+    """
+    Times the stages of a run (extract, encode, unwrap, bake, save, decode, write weights) and counts
+    what they process. Safe to use from the ImageWriter thread, its stages show up on their own track.
+
+    Stages are recorded as complete events, write_chrome_trace() saves them for chrome://tracing or
+    https://ui.perfetto.dev and summary() totals them per stage.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_ns = time.perf_counter_ns()
+        self.events = []
+        self.counters = {}
+
+    def reset(self):
+        with self.lock:
+            self.start_ns = time.perf_counter_ns()
+            self.events = []
+            self.counters = {}
+
+    @contextmanager
+    def stage(self, name, group=None, **counts):
+        """
+        Times the with block as one stage.
+
+        :param group: Vertex group the stage works on, shown in the trace.
+        :param counts: Amounts processed, e.g. vertices=..., pixels=..., rna_calls=..., added to the counters.
+        """
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            with self.lock:
+                self.events.append((name, group, start, end, threading.get_ident(), counts))
+            self.count(**counts)
+
+    def count(self, **counts):
+        with self.lock:
+            for key, value in counts.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def summary(self):
+        """
+        :return: Dict of {"stages": {name: {"calls", "seconds", "mean_ms", counts...}}, "counters": {...},
+            "wall_seconds": ...}.
+        """
+        with self.lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+        stages = {}
+        for name, _, start, end, _, counts in events:
+            entry = stages.setdefault(name, {"calls": 0, "seconds": 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += (end - start) / 1e9
+            for key, value in counts.items():
+                entry[key] = entry.get(key, 0) + value
+        for entry in stages.values():
+            entry["mean_ms"] = 1000 * entry["seconds"] / entry["calls"]
+        return {
+            "wall_seconds": (time.perf_counter_ns() - self.start_ns) / 1e9,
+            "stages": stages,
+            "counters": counters,
+        }
+
+    def write_chrome_trace(self, path):
+        # Chrome trace event format, the summary goes along in "otherData"
+        with self.lock:
+            events = list(self.events)
+        process_id = os.getpid()
+        trace_events = []
+        for name, group, start, end, thread_id, counts in events:
+            args = dict(counts)
+            if group is not None:
+                args["group"] = group
+            trace_events.append({
+                "name": name,
+                "cat": "stage",
+                "ph": "X",
+                "ts": (start - self.start_ns) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": process_id,
+                "tid": thread_id,
+                "args": args,
+            })
+        with open(path, "w") as file:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms", "otherData": self.summary()}, file)
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"{'stage':<16}{'calls':>8}{'total s':>12}{'mean ms':>12}  share of {summary['wall_seconds']:.1f} s")
+        for name, entry in sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            share = 100 * entry["seconds"] / summary["wall_seconds"] if summary["wall_seconds"] else 0.0
+            print(f"{name:<16}{entry['calls']:>8}{entry['seconds']:>12.2f}{entry['mean_ms']:>12.1f}  {share:5.1f}%")
+        if summary["counters"]:
+            print("  " + ", ".join(f"{key} {value:,}" for key, value in sorted(summary["counters"].items())))
+
+
+# shared by every module of a run, so deep helpers can record stages without passing it around
+profiler = StageProfiler()
+
+
+class GroupProgress:
+    """
+    Live progress line with ETA and per group throughput, replacing the old progress bar.
+    The ETA only counts groups that were actually baked, skipped groups take no time.
+
+    :param total: Number of groups in the run.
+    """
+
+    def __init__(self, total, length=30):
+        self.total = total
+        self.length = length
+        self.done = 0
+        self.baked = 0
+        self.baked_seconds = 0.0
+        self.vertices = 0
+        self.last_time = time.perf_counter()
+
+    def update(self, group_name, skipped=False, vertices=0):
+        now = time.perf_counter()
+        self.done += 1
+        if not skipped:
+            self.baked += 1
+            self.baked_seconds += now - self.last_time
+            self.vertices += vertices
+        self.last_time = now
+
+        seconds_per_group = self.baked_seconds / self.baked if self.baked else 0.0
+        eta = seconds_per_group * (self.total - self.done)
+        vertices_per_second = self.vertices / self.baked_seconds if self.baked_seconds else 0.0
+        filled_length = self.length * self.done // max(self.total, 1)
+        bar = '█' * filled_length + '-' * (self.length - filled_length)
+        # '\r' returns the cursor to the start of the line so we overwrite previous output
+        sys.stdout.write(
+            f"\r|{bar}| {self.done}/{self.total} groups, {seconds_per_group:.2f} s/group, "
+            f"{vertices_per_second:,.0f} vertices/s, ETA {format_duration(eta)}  {group_name[:30]:<30}"
+        )
+        sys.stdout.flush()
+        if self.done == self.total:
+            print()
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+@contextmanager
+def profile_calls(enabled, output_path=None, top=25):
+    """
+    Runs the with block under cProfile when enabled, prints the top calls by cumulative time and
+    optionally saves the stats for snakeviz or pstats.
+    """
+    if not enabled:
+        yield
+        return
+    call_profiler = cProfile.Profile()
+    call_profiler.enable()
+    try:
+        yield
+    finally:
+        call_profiler.disable()
+        if output_path is not None:
+            call_profiler.dump_stats(str(output_path))
+        stream = io.StringIO()
+        pstats.Stats(call_profiler, stream=stream).sort_stats("cumulative").print_stats(top)
+        print(stream.getvalue())
@@ -0,0 +1,86 @@
+import json
+from pathlib import Path
+
+# How stickers are stored on disk.
+# COLORMAP stores the weight as a blue-green-red ramp color and needs the ramp decoder,
+# WEIGHT stores the raw weight in one channel and is read back directly.
+# weight_steps is the quantization imported weights are written with (see write_vertex_group_weights), no finer
+# than the sticker can tell apart: the colormap decoder is only good to about 4e-3.
+# The _HALF formats store 16 bit floats, half the size and still finer than their weight_steps.
+STICKER_FORMATS = {
+    "COLORMAP_EXR": {"encoding": "COLORMAP", "file_format": 'OPEN_EXR', "color_mode": 'RGB', "color_depth": '32', "exr_codec": 'NONE', "extension": ".exr", "weight_steps": 1024},
+    "COLORMAP_EXR_HALF": {"encoding": "COLORMAP", "file_format": 'OPEN_EXR', "color_mode": 'RGB', "color_depth": '16', "exr_codec": 'NONE', "extension": ".exr", "weight_steps": 1024},
+    "WEIGHT_EXR_FLOAT": {"encoding": "WEIGHT", "file_format": 'OPEN_EXR', "color_mode": 'BW', "color_depth": '32', "exr_codec": 'ZIP', "extension": ".exr", "weight_steps": 65535},
+    "WEIGHT_EXR_HALF": {"encoding": "WEIGHT", "file_format": 'OPEN_EXR', "color_mode": 'BW', "color_depth": '16', "exr_codec": 'ZIP', "extension": ".exr", "weight_steps": 65535},
+    "WEIGHT_PNG16": {"encoding": "WEIGHT", "file_format": 'PNG', "color_mode": 'BW', "color_depth": '16', "exr_codec": None, "extension": ".png", "weight_steps": 65535},
+}
+
+
+def get_metadata_path(image_path):
+    # <group>.exr -> <group>.json
+    return Path(image_path).with_suffix(".json")
+
+
+def write_sticker_metadata(image_path, sticker_format, **extra):
+    """
+    Writes the small JSON header next to a sticker that tells decoders how it is encoded.
+
+    :param sticker_format: A STICKER_FORMATS name.
+    :param extra: Further entries, e.g. resolution.
+    """
+    settings = STICKER_FORMATS[sticker_format]
+    metadata = {
+        "format": sticker_format,
+        "encoding": settings["encoding"],
+        # WEIGHT stickers keep the weight in the first channel
+        "channel": 0,
+        "file_format": settings["file_format"],
+        "color_depth": settings["color_depth"],
+    }
+    metadata.update(extra)
+    with open(get_metadata_path(image_path), "w") as file:
+        json.dump(metadata, file, indent=4)
+
+
+def update_sticker_metadata(image_path, **extra):
+    # adds entries to the header of an existing sticker
+    metadata = read_sticker_metadata(image_path)
+    metadata.update(extra)
+    with open(get_metadata_path(image_path), "w") as file:
+        json.dump(metadata, file, indent=4)
+
+
+def read_sticker_metadata(image_path):
+    # stickers written before the header existed are colormap encoded
+    metadata_path = get_metadata_path(image_path)
+    if not metadata_path.exists():
+        return {"format": "COLORMAP_EXR", "encoding": "COLORMAP", "channel": 0}
+    with open(metadata_path, "r") as file:
+        return json.load(file)
+
+
+# maps the groups of packed stickers to their file and channel, see write_sticker_index
+STICKER_INDEX_NAME = "sticker_index.json"
+
+
+def write_sticker_index(output_dir):
+    """
+    Collects the groups of every packed sticker in output_dir from their headers and saves them as
+    sticker_index.json.
+
+    :return: Dict of {group name: {"file": image file name, "channel": channel name}}.
+    """
+    index = {}
+    for header_path in sorted(Path(output_dir).glob("*.json")):
+        with open(header_path, "r") as file:
+            metadata = json.load(file)
+        if not isinstance(metadata, dict) or metadata.get("format") not in STICKER_FORMATS or "groups" not in metadata:
+            continue
+        image_path = header_path.with_suffix(STICKER_FORMATS[metadata["format"]]["extension"])
+        if not image_path.exists():
+            continue
+        for group_name, channel in metadata["groups"].items():
+            index[group_name] = {"file": image_path.name, "channel": channel}
+    with open(Path(output_dir) / STICKER_INDEX_NAME, "w") as file:
+        json.dump(index, file, indent=4, sort_keys=True)
+    return index
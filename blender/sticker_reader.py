@@ -0,0 +1,398 @@
+"""
+Reads sticker files outside of Blender, fetching only the parts of the image that are sampled.
+"""
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from image_io import EXR_COMPRESSIONS, EXR_LINES_PER_CHUNK, PNG_SIGNATURE
+from profiling import profiler
+from weight_core import get_sample_taps, blend_sample_taps
+
+# pixel type id to dtype, UINT channels (id 0) are not used for stickers
+EXR_READ_DTYPES = {1: np.dtype('<f2'), 2: np.dtype('<f4')}
+# PNG color type to channel count, palette images are not supported
+PNG_CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+# compressed bytes read and inflated bytes produced per step when streaming PNG rows
+PNG_READ_BYTES = 1 << 16
+# raised by the reader for truncated or corrupt files, as opposed to the ValueError of files it can not decode
+READ_ERRORS = (zlib.error, struct.error, EOFError, IndexError, OSError)
+
+
+def sample_sticker_file(path, uvs, mode='NEAREST', channels=None):
+    """
+    Samples a sticker file at many UVs without loading the whole image. Only the EXR chunks the UVs
+    land in are read and decompressed, PNG rows are streamed and dropped once sampled, so memory stays
+    at one chunk plus the samples whatever the resolution.
+
+    :param uvs: (N, 2) array of UV coordinates, clamped to 0.0 - 1.0.
+    :param mode: 'NEAREST' or 'BILINEAR'.
+    :param channels: EXR channel names to sample, e.g. the channels of a packed sticker.
+    :return: (N, 4) float32 RGBA samples, the same as sample_image_at_uvs() on the image loaded in Blender,
+        or (N, len(channels)) samples of the given channels.
+    :raises ValueError: For files the reader can not decode, e.g. PIZ or DWAA EXRs or PNGs using the Average
+        or Paeth filters. Load those through Blender instead.
+    :raises READ_ERRORS: For truncated or corrupt files.
+    """
+    with open(path, "rb") as file:
+        if file.read(8) == PNG_SIGNATURE:
+            if channels is not None:
+                raise ValueError("PNG stickers have no named channels.")
+            return sample_png_file(file, uvs, mode)
+        file.seek(0)
+        return sample_exr_file(file, uvs, mode, channels)
+
+
+def group_taps(keys):
+    # yields (key, indices of the taps with that key) in increasing key order
+    keys = keys.ravel()
+    order = np.argsort(keys, kind='stable')
+    unique, starts = np.unique(keys[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+    for key, start, end in zip(unique.tolist(), starts.tolist(), ends.tolist()):
+        yield key, order[start:end]
+
+
+def sample_exr_file(file, uvs, mode='NEAREST', channels=None):
+    header = read_exr_header(file)
+    channel_map = get_exr_channel_map(header, channels)
+    width, height = header["width"], header["height"]
+    rows, columns, blend = get_sample_taps(uvs, width, height, mode)
+    # files store the top row first
+    file_rows = (height - 1 - rows).ravel()
+    columns = columns.ravel()
+
+    chunk_width, chunk_height = header["tiles"] or (width, EXR_LINES_PER_CHUNK[header["compression"]])
+    tiles_across = -(-width // chunk_width)
+    chunk_ids = (file_rows // chunk_height) * tiles_across + columns // chunk_width
+
+    tap_values = np.zeros((file_rows.size, len(channel_map)), dtype=np.float32)
+    chunks_read = 0
+    for chunk_id, taps in group_taps(chunk_ids):
+        top, left, block = read_exr_chunk(file, header, chunk_id, channel_map)
+        tap_values[taps] = block[file_rows[taps] - top, columns[taps] - left]
+        chunks_read += 1
+    profiler.count(chunks_read=chunks_read)
+    return blend_sample_taps(tap_values.reshape(rows.shape + (len(channel_map),)), blend)
+
+
+def read_null_string(file):
+    characters = bytearray()
+    while True:
+        character = file.read(1)
+        if not character:
+            raise EOFError("OpenEXR file ends inside its header.")
+        if character == b"\0":
+            return characters.decode()
+        characters += character
+
+
+def read_exr_header(file):
+    """
+    Parses the header and chunk offset table of a single part scanline or single level tiled OpenEXR file.
+
+    :return: Dict with "width", "height", "y_min", "x_min", "compression" name, "channels" [(name, dtype)],
+        "tiles" ((tile width, tile height) or None for scanline files) and the chunk "offsets".
+    """
+    magic, version = struct.unpack("<ii", file.read(8))
+    if magic != 20000630:
+        raise ValueError("Not an OpenEXR file.")
+    if version & 0x1800:
+        raise ValueError("Deep and multi part OpenEXR files are not supported.")
+
+    attributes = {}
+    while True:
+        name = read_null_string(file)
+        if not name:
+            break
+        type_name = read_null_string(file)
+        size, = struct.unpack("<i", file.read(4))
+        attributes[name] = file.read(size)
+        if len(attributes[name]) != size:
+            raise EOFError("OpenEXR file ends inside its header.")
+
+    missing = [name for name in ("compression", "channels", "dataWindow") if name not in attributes]
+    if missing:
+        raise ValueError(f"OpenEXR header has no {missing} attributes.")
+    compression = {value: key for key, value in EXR_COMPRESSIONS.items()}[attributes["compression"][0]]
+    if compression not in EXR_LINES_PER_CHUNK:
+        raise ValueError(f"Codec '{compression}' can not be read without Blender.")
+
+    channels = []
+    channel_list = attributes["channels"]
+    position = 0
+    while channel_list[position] != 0:
+        end = channel_list.index(b"\0", position)
+        name = channel_list[position:end].decode()
+        pixel_type, _, x_sampling, y_sampling = struct.unpack("<iB3xii", channel_list[end + 1:end + 17])
+        if pixel_type not in EXR_READ_DTYPES or (x_sampling, y_sampling) != (1, 1):
+            raise ValueError(f"Channel '{name}' has a pixel type or sampling that can not be read.")
+        channels.append((name, EXR_READ_DTYPES[pixel_type]))
+        position = end + 17
+
+    x_min, y_min, x_max, y_max = struct.unpack("<iiii", attributes["dataWindow"])
+    width, height = x_max - x_min + 1, y_max - y_min + 1
+    tiles = None
+    if "tiles" in attributes:
+        tile_width, tile_height, level_mode = struct.unpack("<IIB", attributes["tiles"])
+        if level_mode & 0x0F != 0:
+            raise ValueError("Mipmapped and ripmapped OpenEXR files are not supported.")
+        tiles = (tile_width, tile_height)
+        chunk_count = -(-width // tile_width) * -(-height // tile_height)
+    else:
+        chunk_count = -(-height // EXR_LINES_PER_CHUNK[compression])
+    offsets = file.read(8 * chunk_count)
+    if len(offsets) != 8 * chunk_count:
+        raise EOFError("OpenEXR file ends inside its chunk offset table.")
+
+    return {
+        "width": width,
+        "height": height,
+        "x_min": x_min,
+        "y_min": y_min,
+        "compression": compression,
+        "channels": channels,
+        "tiles": tiles,
+        "offsets": np.frombuffer(offsets, dtype='<u8'),
+    }
+
+
+def get_exr_channel_map(header, channels=None):
+    """
+    :param channels: Channel names to read, the image as RGBA when None.
+    :return: Index into header["channels"] of every channel read, None for an alpha the file does not have.
+    """
+    names = [name for name, _ in header["channels"]]
+    if channels is not None:
+        missing = [name for name in channels if name not in names]
+        if missing:
+            raise ValueError(f"Channels {missing} are not in the file.")
+        return [names.index(name) for name in channels]
+
+    # layers of multilayer files are named like "ViewLayer.Combined.R"
+    short_names = [name.split(".")[-1] for name in names]
+    if "Y" in short_names:
+        color = [short_names.index("Y")] * 3
+    elif all(name in short_names for name in "RGB"):
+        color = [short_names.index(name) for name in "RGB"]
+    else:
+        raise ValueError(f"No Y or RGB channels in {short_names}.")
+    return color + [short_names.index("A") if "A" in short_names else None]
+
+
+def read_exr_chunk(file, header, chunk_index, channel_map):
+    """
+    Reads and decompresses one chunk.
+
+    :param channel_map: get_exr_channel_map() result.
+    :return: (first row, first column, (rows, columns, len(channel_map)) float32 block), rows counted from the top.
+    """
+    file.seek(int(header["offsets"][chunk_index]))
+    if header["tiles"]:
+        tile_x, tile_y, _, _, size = struct.unpack("<iiiii", file.read(20))
+        tile_width, tile_height = header["tiles"]
+        left, top = tile_x * tile_width, tile_y * tile_height
+        columns = min(tile_width, header["width"] - left)
+        rows = min(tile_height, header["height"] - top)
+    else:
+        y, size = struct.unpack("<ii", file.read(8))
+        left, top = 0, y - header["y_min"]
+        columns = header["width"]
+        rows = min(EXR_LINES_PER_CHUNK[header["compression"]], header["height"] - top)
+    data = file.read(size)
+    if len(data) != size:
+        raise EOFError("OpenEXR file ends inside a chunk.")
+
+    line_bytes = columns * sum(dtype.itemsize for _, dtype in header["channels"])
+    # chunks that did not get smaller are stored uncompressed
+    if header["compression"] != "NONE" and size < rows * line_bytes:
+        data = exr_zip_decompress(data)
+    lines = np.frombuffer(data, dtype=np.uint8).reshape(rows, line_bytes)
+
+    # every scanline holds all channels one after another, only the mapped ones are converted
+    planes = {}
+    position = 0
+    for index, (_, dtype) in enumerate(header["channels"]):
+        plane_bytes = columns * dtype.itemsize
+        if index in channel_map:
+            planes[index] = lines[:, position:position + plane_bytes].copy().view(dtype)
+        position += plane_bytes
+
+    block = np.ones((rows, columns, len(channel_map)), dtype=np.float32)
+    for target, source in enumerate(channel_map):
+        if source is not None:
+            block[:, :, target] = planes[source]
+    return top, left, block
+
+
+def exr_zip_decompress(data):
+    # undoes exr_zip_compress: inflate, undo the delta encoding, interleave even and odd bytes again
+    predicted = np.frombuffer(zlib.decompress(data), dtype=np.uint8).astype(np.int64)
+    predicted[1:] -= 128
+    reordered = (np.cumsum(predicted) & 0xFF).astype(np.uint8)
+    raw = np.empty_like(reordered)
+    half = (len(raw) + 1) // 2
+    raw[0::2] = reordered[:half]
+    raw[1::2] = reordered[half:]
+    return raw.tobytes()
+
+
+def sample_png_file(file, uvs, mode='NEAREST'):
+    # file is positioned right after the PNG signature
+    length, chunk_type = struct.unpack(">I4s", file.read(8))
+    if chunk_type != b"IHDR":
+        raise ValueError("PNG file does not start with an IHDR chunk.")
+    width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", file.read(length))
+    file.read(4)
+    if interlace or bit_depth not in (8, 16) or color_type not in PNG_CHANNELS:
+        raise ValueError("Only non interlaced 8 and 16 bit gray, gray alpha, RGB and RGBA PNGs can be read.")
+
+    rows, columns, blend = get_sample_taps(uvs, width, height, mode)
+    # files store the top row first
+    file_rows = (height - 1 - rows).ravel()
+    columns = columns.ravel()
+    channels = PNG_CHANNELS[color_type]
+    dtype = np.dtype('>u2') if bit_depth == 16 else np.dtype('u1')
+    scale = 1.0 / (65535.0 if bit_depth == 16 else 255.0)
+
+    tap_values = np.ones((file_rows.size, 4), dtype=np.float32)
+    png_rows = iter_png_rows(file, width * channels * dtype.itemsize, channels * dtype.itemsize)
+    row_index = -1
+    for row, taps in group_taps(file_rows):
+        # rows in between are only unfiltered, never kept
+        while row_index < row:
+            next_row = next(png_rows, None)
+            if next_row is None:
+                raise EOFError(f"PNG image data ends after {row_index + 1} of {height} rows.")
+            row_index, row_bytes = next_row
+        values = np.frombuffer(row_bytes, dtype=dtype).reshape(width, channels)[columns[taps]] * scale
+        if channels <= 2:
+            tap_values[taps, :3] = values[:, :1]
+        else:
+            tap_values[taps, :3] = values[:, :3]
+        if channels in (2, 4):
+            tap_values[taps, 3] = values[:, -1]
+    png_rows.close()
+    profiler.count(rows_decoded=row_index + 1)
+    return blend_sample_taps(tap_values.reshape(rows.shape + (4,)), blend)
+
+
+def iter_png_rows(file, row_length, pixel_bytes):
+    """
+    Inflates the IDAT chunks piece by piece as they are read and yields (row index, unfiltered row bytes).
+    At most PNG_READ_BYTES of compressed and of inflated data are held at a time, whatever the image size.
+
+    :raises ValueError: For rows using the Average or Paeth filters, which can not be undone without a
+        per pixel loop.
+    :raises EOFError: For truncated files.
+    """
+    decompressor = zlib.decompressobj()
+    pending = bytearray()
+    previous = np.zeros(row_length, dtype=np.uint8)
+    row_index = 0
+    while True:
+        length, chunk_type = struct.unpack(">I4s", file.read(8))
+        if chunk_type == b"IEND":
+            return
+        if chunk_type != b"IDAT":
+            # skip the chunk data and its CRC
+            file.seek(length + 4, 1)
+            continue
+        remaining = length
+        while remaining:
+            data = file.read(min(remaining, PNG_READ_BYTES))
+            if not data:
+                raise EOFError("PNG file ends inside an IDAT chunk.")
+            remaining -= len(data)
+            while data:
+                pending += decompressor.decompress(data, PNG_READ_BYTES)
+                data = decompressor.unconsumed_tail
+                while len(pending) > row_length:
+                    filter_type = pending[0]
+                    row = np.frombuffer(bytes(pending[1:row_length + 1]), dtype=np.uint8)
+                    del pending[:row_length + 1]
+                    if filter_type == 1:
+                        # Sub adds the byte one pixel to the left, a running sum per byte of the pixel
+                        row = (np.cumsum(row.reshape(-1, pixel_bytes), axis=0, dtype=np.int64) & 0xFF).astype(np.uint8).ravel()
+                    elif filter_type == 2:
+                        row = row + previous
+                    elif filter_type != 0:
+                        raise ValueError(f"PNG filter type {filter_type} is not supported, load the image through Blender.")
+                    yield row_index, row.tobytes()
+                    previous = row
+                    row_index += 1
+        file.read(4)
+
+
+class Prefetcher:
+    """
+    Runs function over items on worker threads, at most depth items ahead of the consumer, and yields
+    (item, Future) in item order. Reading and decoding release the GIL in zlib and NumPy, so the next
+    stickers decode while the main thread writes the weights of the last one through bpy.
+
+    Records how long the consumer stalled on a result ("prefetch_wait" stage), how many results were
+    already waiting when it asked (the queue depth) and how long finished results sat in the queue.
+
+    :param depth: Results decoded ahead of the consumer, bounds the memory held by finished results.
+    :param workers: Worker threads, at most depth of them do work at the same time.
+    """
+
+    def __init__(self, function, items, depth=2, workers=1):
+        self.function = function
+        self.items = items
+        self.depth = max(1, depth)
+        self.workers = max(1, min(workers, self.depth))
+        self.stats = {"items": 0, "stalls": 0, "stall_seconds": 0.0, "queue_depth_total": 0, "max_queue_depth": 0,
+                      "queued_seconds": 0.0}
+
+    def __iter__(self):
+        items = iter(self.items)
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="StickerReader")
+        try:
+            for item in items:
+                pending.append(self.submit(executor, item))
+                if len(pending) == self.depth:
+                    break
+            while pending:
+                item, future, finished = pending.popleft()
+                # results already decoded when the consumer asks for the next one
+                ready = int(future.done()) + sum(queued.done() for _, queued, _ in pending)
+                start = time.perf_counter()
+                if not future.done():
+                    with profiler.stage("prefetch_wait"):
+                        future.exception()
+                    self.stats["stalls"] += 1
+                now = time.perf_counter()
+                self.stats["items"] += 1
+                self.stats["stall_seconds"] += now - start
+                self.stats["queue_depth_total"] += ready
+                self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], ready)
+                self.stats["queued_seconds"] += max(0.0, start - finished[0])
+                # keep the workers busy while the consumer handles this result
+                for next_item in items:
+                    pending.append(self.submit(executor, next_item))
+                    break
+                yield item, future
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, executor, item):
+        future = executor.submit(self.function, item)
+        # finished[0] is when the result became ready
+        finished = [float("inf")]
+        future.add_done_callback(lambda _: finished.__setitem__(0, time.perf_counter()))
+        return item, future, finished
+
+    def print_stats(self):
+        stats = self.stats
+        items = max(stats["items"], 1)
+        print(
+            f"prefetch: {stats['items']} items, consumer stalled {stats['stalls']} times for "
+            f"{stats['stall_seconds']:.2f} s, mean queue depth {stats['queue_depth_total'] / items:.1f} "
+            f"(max {stats['max_queue_depth']} of {self.depth}), results waited {stats['queued_seconds']:.2f} s"
+        )
@@ -0,0 +1,159 @@
+import bpy
+import sys
+from pathlib import Path
+from mathutils import kdtree
+from mathutils.bvhtree import BVHTree
+import numpy as np
+
+# sibling modules are not on sys.path when the script runs inside Blender
+sys.path.append(str(Path(__file__).resolve().parent))
+from misc import compare_vertex_groups
+from mesh_io import write_vertex_group_weights, get_world_coordinates, read_loop_triangles, read_group_weights, foreach_get
+from weight_core import get_weighted_group_names
+
+
+def transfer_weights(source_mesh_name, target_mesh_name, method='BARYCENTRIC', name_map=None,
+                     create_missing=True, max_distance=None, dry_run=False):
+    """
+    Moves every weighted vertex group of the source mesh onto the target mesh in one batched pass,
+    without baking and decoding sticker textures.
+
+    :param method: 'NEAREST' copies the weights of the closest source vertex, 'BARYCENTRIC'
+        interpolates the weights of the closest point on the source surface.
+    :param name_map: Optional {source group name: target group name}, e.g. get_reverse_lookup() of a
+        group mapping JSON. Unmapped groups keep their name.
+    :param create_missing: Create target groups that do not exist yet (the compare_vertex_groups
+        left overs), otherwise those groups are skipped.
+    :param max_distance: Target vertices farther than this from the source get no weight.
+    :param dry_run: Only return the arrays without writing them.
+    :return: Dict of {target group name: (vertex indices, weights)}.
+    """
+    source = bpy.data.objects[source_mesh_name]
+    target = bpy.data.objects[target_mesh_name]
+    name_map = name_map or {}
+
+    # read without the bake's normals fix, the source mesh is left as it is
+    group_weights = read_group_weights(source)
+    group_names = get_weighted_group_names(group_weights)
+
+    if name_map:
+        target_names = {vertex_group.name for vertex_group in target.vertex_groups}
+        left_overs = {name for name in group_names if name_map.get(name, name) not in target_names}
+    else:
+        left_overs = set(compare_vertex_groups(source, target, path=None) or [])
+    if not create_missing:
+        for name in sorted(left_overs):
+            print(f"Skipping '{name}', the target has no matching vertex group.")
+        group_names = [name for name in group_names if name not in left_overs]
+
+    target_world = get_world_coordinates(target)
+    if method == 'NEAREST':
+        corners, factors, distances = nearest_vertex_weights(group_weights["world"], target_world)
+    elif method == 'BARYCENTRIC':
+        corners, factors, distances = nearest_surface_weights(source, group_weights["world"], target_world)
+    else:
+        raise ValueError(f"Unknown transfer method '{method}'.")
+
+    reached = np.ones(len(target_world), dtype=bool)
+    if max_distance is not None:
+        reached = distances <= max_distance
+
+    # every group at once: (source vertices, groups) weights gathered at the corners of each target vertex
+    group_columns = {name: column for column, name in enumerate(group_names)}
+    dense = group_weight_matrix(group_weights, group_columns)
+    transferred = np.einsum('tk,tkg->tg', factors, dense[corners])
+    transferred[~reached] = 0.0
+
+    results = {}
+    for name, column in group_columns.items():
+        target_name = name_map.get(name, name)
+        vertex_indices = np.flatnonzero(transferred[:, column] > 0)
+        if not dry_run:
+            # the transfer replaces whatever the group held before
+            vertex_group = target.vertex_groups.get(target_name)
+            if vertex_group:
+                vertex_group.remove(list(range(len(target.data.vertices))))
+        results[target_name] = write_vertex_group_weights(
+            target, target_name, vertex_indices, transferred[vertex_indices, column], 'REPLACE', dry_run=dry_run
+        )
+    return results
+
+
+def group_weight_matrix(group_weights, group_columns):
+    # dense (vertex count, group count) matrix of the CSR weights of the chosen groups
+    dense = np.zeros((len(group_weights["world"]), len(group_columns)), dtype=np.float32)
+    offsets = group_weights["offsets"]
+    for name, column in group_columns.items():
+        group_index = group_weights["names"].index(name)
+        start, end = offsets[group_index], offsets[group_index + 1]
+        dense[group_weights["indices"][start:end], column] = group_weights["weights"][start:end]
+    return dense
+
+
+def nearest_vertex_weights(source_world, target_world):
+    """
+    :return: (T, 1) closest source vertex, (T, 1) factors of 1.0 and (T,) distances.
+    """
+    kd = kdtree.KDTree(len(source_world))
+    for index, co in enumerate(source_world.tolist()):
+        kd.insert(co, index)
+    kd.balance()
+
+    corners = np.empty((len(target_world), 1), dtype=np.int64)
+    distances = np.empty(len(target_world), dtype=np.float64)
+    for index, co in enumerate(target_world.tolist()):
+        _, corners[index, 0], distances[index] = kd.find(co)
+    return corners, np.ones((len(target_world), 1), dtype=np.float32), distances
+
+
+def nearest_surface_weights(source, source_world, target_world):
+    """
+    Finds the closest point on the triangulated source surface for every target vertex.
+
+    :return: (T, 3) source vertices of the closest triangle, (T, 3) barycentric factors and (T,) distances.
+    """
+    mesh = source.data
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int64)
+    foreach_get(mesh.loops, "vertex_index", loop_vertices)
+    triangles = loop_vertices[read_loop_triangles(mesh)]
+    bvh = BVHTree.FromPolygons(source_world.tolist(), triangles.tolist(), all_triangles=True)
+
+    locations = np.zeros((len(target_world), 3), dtype=np.float64)
+    triangle_indices = np.zeros(len(target_world), dtype=np.int64)
+    distances = np.full(len(target_world), np.inf, dtype=np.float64)
+    for index, co in enumerate(target_world.tolist()):
+        location, _, triangle_index, distance = bvh.find_nearest(co)
+        if triangle_index is not None:
+            locations[index] = location
+            triangle_indices[index] = triangle_index
+            distances[index] = distance
+
+    corners = triangles[triangle_indices]
+    return corners, barycentric_factors(source_world[corners], locations), distances
+
+
+def barycentric_factors(triangle_points, points):
+    """
+    :param triangle_points: (N, 3, 3) triangle corners.
+    :param points: (N, 3) points on (or projected onto) the triangles.
+    :return: (N, 3) float32 barycentric factors, clamped to the triangle.
+    """
+    a, b, c = triangle_points[:, 0], triangle_points[:, 1], triangle_points[:, 2]
+    v0, v1, v2 = b - a, c - a, points - a
+    d00 = (v0 * v0).sum(axis=1)
+    d01 = (v0 * v1).sum(axis=1)
+    d11 = (v1 * v1).sum(axis=1)
+    d20 = (v2 * v0).sum(axis=1)
+    d21 = (v2 * v1).sum(axis=1)
+    denominator = d00 * d11 - d01 * d01
+    # degenerate triangles fall back to their first corner
+    safe = np.abs(denominator) > 1e-20
+    denominator = np.where(safe, denominator, 1.0)
+    v = np.where(safe, (d11 * d20 - d01 * d21) / denominator, 0.0)
+    w = np.where(safe, (d00 * d21 - d01 * d20) / denominator, 0.0)
+    factors = np.clip(np.stack([1.0 - v - w, v, w], axis=1), 0.0, 1.0)
+    return (factors / factors.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+if __name__ == "__main__":
+    transfer_weights("LOD_1_Group_0_Sub_3__esf_Head00", "low_head")
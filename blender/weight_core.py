@@ -0,0 +1,771 @@
+"""
+Array-only core of the sticker pipeline: group weights, colormaps, rasterizing, sampling, decoding,
+gradients and strand labelling. Nothing in here imports bpy, so it runs outside Blender and in
+worker processes. Reading and writing Blender data is left to mesh_io and the scripts.
+"""
+import functools
+
+import numpy as np
+
+from image_io import write_sticker_image, write_packed_sticker_image
+from sticker_format import STICKER_FORMATS
+
+
+def build_group_csr(group_ids, vertex_ids, weights, group_count):
+    """
+    Builds the CSR layout of read_group_weights from (group, vertex, weight) triplets.
+
+    :return: (offsets, indices, weights), group g owns entries offsets[g]:offsets[g + 1].
+    """
+    group_ids = np.asarray(group_ids, dtype=np.int32)
+    # stable sort keeps the vertices of each group in ascending index order
+    order = np.argsort(group_ids, kind='stable')
+    counts = np.bincount(group_ids, minlength=group_count)
+    offsets = np.zeros(group_count + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return (
+        offsets,
+        np.asarray(vertex_ids, dtype=np.int32)[order],
+        np.asarray(weights, dtype=np.float32)[order],
+    )
+
+
+def get_group_weights(group_weights, vertex_group_name):
+    # returns the (vertex indices, weights) slices of one group
+    group_index = group_weights["names"].index(vertex_group_name)
+    start = group_weights["offsets"][group_index]
+    end = group_weights["offsets"][group_index + 1]
+    return group_weights["indices"][start:end], group_weights["weights"][start:end]
+
+
+def get_weighted_group_names(group_weights):
+    # names of the groups that have at least one vertex with a non zero weight
+    counts = np.diff(group_weights["offsets"])
+    return [name for name, count in zip(group_weights["names"], counts) if count > 0]
+
+
+def get_group_statistics(group_weights, coordinates=None, principal_axes=False):
+    """
+    Weighted centroids and bounding boxes of every group at once, from one pass over the CSR weights
+    instead of a loop per group.
+
+    :param coordinates: (V, 3) vertex coordinates, group_weights["world"] when None.
+    :param principal_axes: Also compute the weighted principal axes of every group.
+    :return: Dict of "names", "total_weights" (G,), "centroids" (G, 3), "bbox_min" and "bbox_max" (G, 3), and
+        with principal_axes "axes" (G, 3, 3) with one axis per row, largest spread first, and their "variances"
+        (G, 3). Groups without weights get NaN.
+    """
+    coordinates = np.asarray(group_weights["world"] if coordinates is None else coordinates, dtype=np.float64)
+    offsets = group_weights["offsets"]
+    group_count = len(offsets) - 1
+    counts = np.diff(offsets)
+    # group of every CSR entry, the entries of a group are stored one after another
+    entry_groups = np.repeat(np.arange(group_count), counts)
+    weights = group_weights["weights"].astype(np.float64)
+    points = coordinates[group_weights["indices"]]
+
+    total_weights = np.bincount(entry_groups, weights=weights, minlength=group_count)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centroids = np.stack(
+            [np.bincount(entry_groups, weights=weights * points[:, axis], minlength=group_count) for axis in range(3)],
+            axis=1,
+        ) / total_weights[:, None]
+
+    bbox_min = np.full((group_count, 3), np.nan)
+    bbox_max = np.full((group_count, 3), np.nan)
+    filled = counts > 0
+    if filled.any():
+        starts = offsets[:-1][filled]
+        bbox_min[filled] = np.minimum.reduceat(points, starts, axis=0)
+        bbox_max[filled] = np.maximum.reduceat(points, starts, axis=0)
+
+    statistics = {
+        "names": list(group_weights["names"]),
+        "total_weights": total_weights,
+        "centroids": centroids,
+        "bbox_min": bbox_min,
+        "bbox_max": bbox_max,
+    }
+    if principal_axes:
+        # weighted covariance of every group from the offsets to its centroid
+        centered = points - centroids[entry_groups]
+        covariances = np.zeros((group_count, 3, 3))
+        for row in range(3):
+            for column in range(row, 3):
+                values = np.bincount(entry_groups, weights=weights * centered[:, row] * centered[:, column],
+                                     minlength=group_count)
+                covariances[:, row, column] = covariances[:, column, row] = values
+        with np.errstate(invalid='ignore', divide='ignore'):
+            covariances /= total_weights[:, None, None]
+        variances = np.full((group_count, 3), np.nan)
+        axes = np.full((group_count, 3, 3), np.nan)
+        if filled.any():
+            # eigh sorts ascending, flip to put the largest spread first
+            values, vectors = np.linalg.eigh(covariances[filled])
+            variances[filled] = values[:, ::-1]
+            axes[filled] = np.swapaxes(vectors[:, :, ::-1], 1, 2)
+        statistics["axes"] = axes
+        statistics["variances"] = variances
+    return statistics
+
+
+# vertex group prefixes of the two sides of a symmetric mesh
+MIRROR_PREFIXES = {"L_": "R_", "R_": "L_"}
+
+
+def get_mirrored_group_name(group_name):
+    # L_Eye -> R_Eye and back, None for groups on the center line
+    for prefix, mirrored_prefix in MIRROR_PREFIXES.items():
+        if group_name.startswith(prefix):
+            return mirrored_prefix + group_name[len(prefix):]
+    return None
+
+
+def split_mirrored_groups(group_names, bake_side="L"):
+    """
+    Picks the groups to bake when only one side of a symmetric mesh is baked.
+
+    :param bake_side: "L" or "R", the side whose stickers are baked.
+    :return: (group names to bake, {baked group: group re-derived from it by mirroring}).
+        Groups of the other side without a counterpart on the baked side are still baked.
+    """
+    bake_prefix = bake_side + "_"
+    names = set(group_names)
+    mirrored_groups = {}
+    for name in group_names:
+        mirrored_name = get_mirrored_group_name(name)
+        if name.startswith(bake_prefix) and mirrored_name in names:
+            mirrored_groups[name] = mirrored_name
+    derived = set(mirrored_groups.values())
+    return [name for name in group_names if name not in derived], mirrored_groups
+
+
+def mirror_weights(weights, mirror_map):
+    """
+    :param weights: (V,) dense weights of one group.
+    :param mirror_map: (V,) index of each vertex's mirror partner, -1 when it has none.
+    :return: (V,) float32 weights of the mirrored group, 0.0 for vertices without a partner.
+    """
+    mirrored = np.zeros(len(mirror_map), dtype=np.float32)
+    has_partner = mirror_map >= 0
+    mirrored[has_partner] = np.asarray(weights, dtype=np.float32)[mirror_map[has_partner]]
+    return mirrored
+
+
+def get_group_submesh(source_topology, vertex_indices):
+    """
+    Keeps the faces whose vertices are all in vertex_indices, the same faces that survive deleting
+    every other vertex.
+
+    :return: (vertex coordinates, remapped loop vertices, loop totals per face, bool mask of kept source loops).
+        Submesh vertex i is source vertex vertex_indices[i].
+    """
+    vertex_count = len(source_topology["co"])
+    loop_totals = source_topology["loop_totals"]
+    loop_vertices = source_topology["loop_vertices"]
+
+    in_group = np.zeros(vertex_count, dtype=bool)
+    in_group[vertex_indices] = True
+    # loops are stored face after face, so each face owns the next loop_totals[f] loops
+    loop_faces = np.repeat(np.arange(len(loop_totals)), loop_totals)
+    outside_loops = np.bincount(loop_faces, weights=~in_group[loop_vertices], minlength=len(loop_totals))
+    kept_faces = outside_loops == 0
+    kept_loops = kept_faces[loop_faces]
+
+    remap = np.full(vertex_count, -1, dtype=np.int64)
+    remap[vertex_indices] = np.arange(len(vertex_indices))
+    return (
+        source_topology["co"][vertex_indices],
+        remap[loop_vertices[kept_loops]],
+        loop_totals[kept_faces],
+        kept_loops,
+    )
+
+
+def crop_uvs(loop_uvs, padding=0.01):
+    # scales the UV bounding box up to fill the image, the same factor on both axes to keep the aspect
+    if len(loop_uvs) == 0:
+        return loop_uvs
+    low = loop_uvs.min(axis=0)
+    size = max(float((loop_uvs.max(axis=0) - low).max()), 1e-8)
+    return ((loop_uvs - low) / size * (1.0 - 2.0 * padding) + padding).astype(np.float32)
+
+
+def fan_triangles(loop_totals):
+    """
+    Splits every face into a fan of triangles around its first loop, for rasterizing a submesh
+    without Blender. Matches mesh.loop_triangles for triangles, quads and convex n-gons.
+
+    :param loop_totals: Loop count per face, faces store their loops one after another.
+    :return: (T, 3) int64 loop indices.
+    """
+    loop_totals = np.asarray(loop_totals, dtype=np.int64)
+    loop_starts = np.cumsum(loop_totals) - loop_totals
+    triangle_counts = np.maximum(loop_totals - 2, 0)
+    face_starts = np.repeat(loop_starts, triangle_counts)
+    # corner k of a face's fan runs from 1 to loop_total - 2
+    fan_offsets = np.arange(triangle_counts.sum()) - np.repeat(np.cumsum(triangle_counts) - triangle_counts, triangle_counts) + 1
+    return np.stack([face_starts, face_starts + fan_offsets, face_starts + fan_offsets + 1], axis=1)
+
+
+class WeightColormap:
+    """
+    NumPy version of a LINEAR ColorRamp node, so a whole weight array can be encoded in one call.
+
+    :param positions: Increasing ramp stop positions between 0.0 and 1.0.
+    :param colors: One (r, g, b, a) color per stop.
+    """
+
+    def __init__(self, positions, colors):
+        self.positions = np.asarray(positions, dtype=np.float32)
+        self.colors = np.asarray(colors, dtype=np.float32)
+
+    def encode(self, weights):
+        """
+        :param weights: Array of weights, values outside 0.0 - 1.0 are clamped.
+        :return: (N, 4) float32 array of RGBA colors.
+        """
+        weights = np.clip(np.asarray(weights, dtype=np.float32).ravel(), 0.0, 1.0)
+        rgba = np.empty((weights.size, 4), dtype=np.float32)
+        for channel in range(4):
+            rgba[:, channel] = np.interp(weights, self.positions, self.colors[:, channel])
+        return rgba
+
+
+# Blender-like weight colors: blue at 0.0, green at 0.5, red at 1.0
+WEIGHT_RAMP_POSITIONS = (0.0, 0.5, 1.0)
+WEIGHT_RAMP_COLORS = (
+    (0.0, 0.0, 1.0, 1.0),
+    (0.0, 1.0, 0.0, 1.0),
+    (1.0, 0.0, 0.0, 1.0),
+)
+
+
+def encode_weights(weights, encoding="COLORMAP"):
+    # (N, 4) colors for the weights: the colormap ramp, or the raw weight as grey for WEIGHT stickers
+    if encoding == "COLORMAP":
+        return get_weight_colormap().encode(weights)
+    weights = np.clip(np.asarray(weights, dtype=np.float32).ravel(), 0.0, 1.0)
+    rgba = np.repeat(weights[:, None], 4, axis=1)
+    rgba[:, 3] = 1.0
+    return rgba
+
+
+@functools.lru_cache(maxsize=None)
+def get_weight_colormap():
+    # built once and shared by every group
+    return WeightColormap(WEIGHT_RAMP_POSITIONS, WEIGHT_RAMP_COLORS)
+
+
+def weight_to_rgb(weight):
+    """
+    Converts a weight (0.0 - 1.0) to an RGB value using Blender's weight paint color gradient.
+    
+    :param weight: A float value between 0.0 (blue) and 1.0 (red).
+    :return: An (r, g, b, a) tuple with values between 0.0 and 1.0.
+    """
+    return tuple(get_weight_colormap().encode([weight])[0].tolist())
+
+
+def rasterize_uv_weights(loop_uvs, triangles, loop_weights, resolution, max_candidates=1 << 22):
+    """
+    Rasterizes triangles in UV space and interpolates loop weights with barycentric coordinates.
+    A pixel is filled when its center lies inside a triangle.
+
+    :param loop_uvs: (L, 2) UV coordinate per loop.
+    :param triangles: (T, 3) loop indices per triangle.
+    :param loop_weights: (L,) weight per loop, or (L, K) weights of K groups rasterized in the same pass.
+    :param resolution: Width and height of the square image.
+    :param max_candidates: Upper bound of candidate pixels tested at once, limits memory use.
+    :return: (resolution, resolution) float32 weight image, (resolution, resolution, K) for K groups, and its
+        boolean coverage mask. Row 0 is v = 0, the same order as bpy.types.Image.pixels.
+    """
+    loop_weights = np.asarray(loop_weights, dtype=np.float32)
+    weight_image = np.zeros((resolution, resolution) + loop_weights.shape[1:], dtype=np.float32)
+    covered = np.zeros((resolution, resolution), dtype=bool)
+    if len(triangles) == 0:
+        return weight_image, covered
+
+    # pixel space where the center of pixel i sits at i
+    corners = np.asarray(loop_uvs, dtype=np.float64)[triangles] * resolution - 0.5
+    values = loop_weights[triangles]
+
+    x0 = np.clip(np.ceil(corners[:, :, 0].min(axis=1)), 0, resolution).astype(np.int64)
+    x1 = np.clip(np.floor(corners[:, :, 0].max(axis=1)), -1, resolution - 1).astype(np.int64)
+    y0 = np.clip(np.ceil(corners[:, :, 1].min(axis=1)), 0, resolution).astype(np.int64)
+    y1 = np.clip(np.floor(corners[:, :, 1].max(axis=1)), -1, resolution - 1).astype(np.int64)
+    widths = np.maximum(x1 - x0 + 1, 0)
+    heights = np.maximum(y1 - y0 + 1, 0)
+
+    a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+    area = (b[:, 1] - c[:, 1]) * (a[:, 0] - c[:, 0]) + (c[:, 0] - b[:, 0]) * (a[:, 1] - c[:, 1])
+    # degenerate triangles have no interior to fill
+    counts = np.where(np.abs(area) > 1e-12, widths * heights, 0)
+    cumulative = np.cumsum(counts)
+
+    start = 0
+    while start < len(triangles):
+        base = cumulative[start - 1] if start else 0
+        stop = max(int(np.searchsorted(cumulative, base + max_candidates, side='right')), start + 1)
+        ids = np.arange(start, stop)
+        start = stop
+
+        chunk_counts = counts[ids]
+        total = int(chunk_counts.sum())
+        if total == 0:
+            continue
+        tri = np.repeat(ids, chunk_counts)
+        local = np.arange(total) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+        xs = x0[tri] + local % widths[tri]
+        ys = y0[tri] + local // widths[tri]
+
+        ta, tb, tc = a[tri], b[tri], c[tri]
+        dx = xs - tc[:, 0]
+        dy = ys - tc[:, 1]
+        l0 = ((tb[:, 1] - tc[:, 1]) * dx + (tc[:, 0] - tb[:, 0]) * dy) / area[tri]
+        l1 = ((tc[:, 1] - ta[:, 1]) * dx + (ta[:, 0] - tc[:, 0]) * dy) / area[tri]
+        l2 = 1.0 - l0 - l1
+        inside = (l0 >= -1e-9) & (l1 >= -1e-9) & (l2 >= -1e-9)
+
+        tri = tri[inside]
+        l0, l1, l2 = l0[inside], l1[inside], l2[inside]
+        if values.ndim == 3:
+            l0, l1, l2 = l0[:, None], l1[:, None], l2[:, None]
+        weight_image[ys[inside], xs[inside]] = l0 * values[tri, 0] + l1 * values[tri, 1] + l2 * values[tri, 2]
+        covered[ys[inside], xs[inside]] = True
+
+    return weight_image, covered
+
+
+def dilate_weight_image(weight_image, covered, margin):
+    # grows the filled area by one pixel per step, averaging the covered 4-neighbours,
+    # the same job as the bake margin in Cycles
+    for _ in range(margin):
+        if covered.all():
+            break
+        total = np.zeros_like(weight_image)
+        # grows (H, W) and (H, W, K) images alike
+        count = np.zeros(covered.shape, dtype=np.int32)
+        total[1:, :] += weight_image[:-1, :]
+        count[1:, :] += covered[:-1, :]
+        total[:-1, :] += weight_image[1:, :]
+        count[:-1, :] += covered[1:, :]
+        total[:, 1:] += weight_image[:, :-1]
+        count[:, 1:] += covered[:, :-1]
+        total[:, :-1] += weight_image[:, 1:]
+        count[:, :-1] += covered[:, 1:]
+
+        grown = ~covered & (count > 0)
+        counts = count[grown]
+        weight_image[grown] = total[grown] / (counts[:, None] if weight_image.ndim == 3 else counts)
+        covered |= grown
+
+
+# adaptive bake resolution: texels aimed for per vertex of the group, and the power of two bounds
+BAKE_RESOLUTION = {"texels_per_vertex": 64, "min_resolution": 256, "max_resolution": 2048}
+
+
+def get_uv_coverage(loop_uvs, triangles):
+    # fraction of the 0..1 UV square covered by the triangles, overlaps count twice
+    a, b, c = (loop_uvs[triangles[:, corner]].astype(np.float64) for corner in range(3))
+    cross = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    return float(np.abs(cross).sum() / 2)
+
+
+def choose_bake_resolution(loop_uvs, triangles, vertex_count, texels_per_vertex=64, min_resolution=256,
+                           max_resolution=2048):
+    """
+    Picks the sticker resolution of one group so its faces get about texels_per_vertex texels per vertex,
+    a small group that fills little of its UV square gets a small image.
+
+    :param loop_uvs: (L, 2) UVs the group is baked with.
+    :param triangles: (T, 3) loop indices of its triangles.
+    :param vertex_count: Vertices of the group.
+    :return: The power of two resolution, clamped to min_resolution - max_resolution, min_resolution when
+        there are no triangles or they cover no UV area.
+    """
+    triangles = np.asarray(triangles).reshape(-1, 3)
+    if len(triangles) == 0:
+        return int(min_resolution)
+    coverage = min(get_uv_coverage(np.asarray(loop_uvs).reshape(-1, 2), triangles), 1.0)
+    if coverage <= 0.0:
+        return int(min_resolution)
+    side = np.sqrt(max(vertex_count, 1) * texels_per_vertex / coverage)
+    resolution = 2 ** int(np.ceil(np.log2(side)))
+    return int(min(max(resolution, min_resolution), max_resolution))
+
+
+def render_sticker_pixels(loop_uvs, triangles, loop_weights, resolution=2048, margin=2, encoding="COLORMAP"):
+    """
+    Rasterizes and encodes one sticker.
+
+    :return: (resolution, resolution, 4) float32 RGBA in bpy.types.Image.pixels order, uncovered
+        pixels stay black like the cleared Cycles bake target.
+    """
+    weight_image, covered = rasterize_uv_weights(loop_uvs, triangles, loop_weights, resolution)
+    dilate_weight_image(weight_image, covered, margin)
+    rgba = encode_weights(weight_image, encoding)
+    rgba[~covered.ravel()] = 0.0
+    return rgba.reshape(resolution, resolution, 4)
+
+
+def write_raster_sticker(output_path, loop_uvs, triangles, loop_weights, sticker_format, exr_codec=None,
+                         resolution=2048, margin=2):
+    # a whole raster bake from plain arrays, picklable so it can run in a process pool
+    rgba = render_sticker_pixels(
+        loop_uvs, triangles, loop_weights, resolution, margin, STICKER_FORMATS[sticker_format]["encoding"]
+    )
+    write_sticker_image(output_path, rgba, sticker_format, exr_codec)
+    return output_path
+
+
+# channels of a --pack RGBA image, --pack CHANNELS names the channels after the groups instead
+PACK_CHANNELS = "RGBA"
+
+
+def get_pack_channels(group_names, pack_mode="RGBA"):
+    # channel name of every group of one packed sticker
+    if pack_mode == "RGBA":
+        if len(group_names) > len(PACK_CHANNELS):
+            raise ValueError(f"An RGBA sticker holds at most {len(PACK_CHANNELS)} groups, got {len(group_names)}.")
+        return list(PACK_CHANNELS[:len(group_names)])
+    if pack_mode == "CHANNELS":
+        return list(group_names)
+    raise ValueError(f"Unknown pack mode '{pack_mode}'.")
+
+
+def get_packed_submesh(group_weights, group_names, source_topology):
+    """
+    Faces and loop weights of several groups for baking them into one packed sticker. Keeps the faces
+    whose vertices all lie in at least one of the groups and uses the UVs of the whole mesh, so every
+    group sits at the same place in every channel.
+
+    :return: (L, 2) loop UVs, (T, 3) triangles, (L, K) loop weights of the K groups and the vertex count.
+    """
+    dense = np.zeros((len(source_topology["co"]), len(group_names)), dtype=np.float32)
+    for column, name in enumerate(group_names):
+        vertex_indices, weights = get_group_weights(group_weights, name)
+        dense[vertex_indices, column] = weights
+    union = np.flatnonzero(dense.any(axis=1))
+    _, _, loop_totals, kept_loops = get_group_submesh(source_topology, union)
+    loop_vertices = source_topology["loop_vertices"][kept_loops]
+    return source_topology["loop_uvs"][kept_loops], fan_triangles(loop_totals), dense[loop_vertices], len(union)
+
+
+def render_packed_pixels(loop_uvs, triangles, loop_weights, resolution=2048, margin=2):
+    # (resolution, resolution, K) raw weights of K groups from one pass over the triangles, uncovered pixels stay 0
+    weight_image, covered = rasterize_uv_weights(loop_uvs, triangles, loop_weights, resolution)
+    dilate_weight_image(weight_image, covered, margin)
+    weight_image[~covered] = 0.0
+    return np.clip(weight_image, 0.0, 1.0)
+
+
+def write_packed_raster_sticker(output_path, loop_uvs, triangles, loop_weights, groups, sticker_format, exr_codec=None,
+                                resolution=2048, margin=2):
+    """
+    Raster bake of a packed sticker from plain arrays, picklable so it can run in a process pool.
+
+    :param groups: Dict of {group name: channel name}, in the column order of loop_weights.
+    """
+    weight_image = render_packed_pixels(loop_uvs, triangles, loop_weights, resolution, margin)
+    write_packed_sticker_image(output_path, weight_image, groups, sticker_format, exr_codec)
+    return output_path
+
+
+#kind of hacky but if the rgb value is black, give it the same value as if it were blue
+#adding black (for the background) to a number system that really spans between blue, red, green
+#also a hack but map grey to blue as well
+OFF_RAMP_COLORS = {
+    (0.0, 0.0, 0.0): 0.0,
+    (0.50390625, 0.50390625, 0.50390625): 0.0,
+}
+
+
+class RgbWeightDecoder:
+    """
+    Decodes whole arrays of colors back to weights by projecting every color onto the polyline through
+    the sampled ramp colors. The weight is interpolated along the closest segment, so it is continuous
+    instead of snapped to the sample steps.
+
+    :param ramp_weights: Increasing weights the ramp was sampled at.
+    :param ramp_colors: (S, 3) RGB color per sample.
+    :param off_ramp_colors: Dict of extra {(r, g, b): weight} points, used when a color is closer to
+        one of them than to the ramp (black background, grey).
+    :param lut_size: If set, precomputes a lut_size^3 RGB table that decode() interpolates trilinearly
+        instead of projecting every color.
+    """
+
+    def __init__(self, ramp_weights, ramp_colors, off_ramp_colors=None, lut_size=None, chunk_size=8192):
+        weights, colors = collapse_flat_runs(
+            np.asarray(ramp_weights, dtype=np.float32), np.asarray(ramp_colors, dtype=np.float32)
+        )
+        if len(colors) == 1:
+            # a single color still needs a segment to project on
+            weights = np.repeat(weights, 2)
+            colors = np.repeat(colors, 2, axis=0)
+        self.segment_starts = colors[:-1]
+        self.segment_directions = colors[1:] - colors[:-1]
+        self.segment_lengths = (self.segment_directions ** 2).sum(axis=1)
+        self.start_weights = weights[:-1]
+        self.weight_steps = weights[1:] - weights[:-1]
+
+        off_ramp_colors = off_ramp_colors or {}
+        self.off_ramp_colors = np.array(list(off_ramp_colors.keys()), dtype=np.float32).reshape(-1, 3)
+        self.off_ramp_weights = np.array(list(off_ramp_colors.values()), dtype=np.float32)
+
+        self.chunk_size = chunk_size
+        self.lut = None
+        if lut_size:
+            axis = np.linspace(0.0, 1.0, lut_size, dtype=np.float32)
+            grid = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1)
+            self.lut = self.project(grid.reshape(-1, 3)).reshape(lut_size, lut_size, lut_size)
+
+    def decode(self, colors):
+        """
+        :param colors: (N, 3) or (N, 4) array of colors, alpha is ignored.
+        :return: (N,) float32 array of weights.
+        """
+        colors = np.asarray(colors, dtype=np.float32)
+        if colors.ndim == 1:
+            colors = colors.reshape(-1, 3) if colors.size == 0 else colors.reshape(1, -1)
+        colors = colors.reshape(-1, colors.shape[-1])[:, :3]
+        if self.lut is None:
+            return self.project(colors)
+        return self._interpolate_lut(colors)
+
+    def project(self, colors):
+        weights = np.empty(len(colors), dtype=np.float32)
+        lengths = np.where(self.segment_lengths > 0, self.segment_lengths, 1.0)
+        for start in range(0, len(colors), self.chunk_size):
+            chunk = colors[start:start + self.chunk_size]
+            offsets = chunk[:, None, :] - self.segment_starts[None, :, :]
+            t = np.clip((offsets * self.segment_directions).sum(axis=2) / lengths, 0.0, 1.0)
+            distances = ((offsets - t[:, :, None] * self.segment_directions) ** 2).sum(axis=2)
+            # argmin keeps the first segment on ties, like min() over the old lookup map
+            best = distances.argmin(axis=1)
+            rows = np.arange(len(chunk))
+            chunk_weights = self.start_weights[best] + t[rows, best] * self.weight_steps[best]
+
+            if len(self.off_ramp_colors):
+                off_distances = ((chunk[:, None, :] - self.off_ramp_colors[None, :, :]) ** 2).sum(axis=2)
+                closest = off_distances.argmin(axis=1)
+                use_off_ramp = off_distances[rows, closest] < distances[rows, best]
+                chunk_weights[use_off_ramp] = self.off_ramp_weights[closest[use_off_ramp]]
+
+            weights[start:start + len(chunk)] = chunk_weights
+        return weights
+
+    def _interpolate_lut(self, colors):
+        last = self.lut.shape[0] - 1
+        position = np.clip(colors, 0.0, 1.0) * last
+        low = np.minimum(np.floor(position).astype(np.int64), last - 1)
+        fraction = position - low
+        weights = np.zeros(len(colors), dtype=np.float32)
+        for corner in range(8):
+            offset = np.array([(corner >> 2) & 1, (corner >> 1) & 1, corner & 1])
+            factor = np.prod(np.where(offset, fraction, 1.0 - fraction), axis=1)
+            index = low + offset
+            weights += factor * self.lut[index[:, 0], index[:, 1], index[:, 2]]
+        return weights
+
+
+def collapse_flat_runs(weights, colors, tolerance=1e-6):
+    # the ramp is clamped outside its first and last stop, so several samples share one color.
+    # Keep one sample per run: the lowest weight for the leading run, the highest for the trailing run.
+    same_as_previous = np.all(np.abs(np.diff(colors, axis=0)) <= tolerance, axis=1)
+    run_starts = np.flatnonzero(np.concatenate(([True], ~same_as_previous)))
+    run_ends = np.concatenate((run_starts[1:], [len(colors)])) - 1
+    run_weights = (weights[run_starts] + weights[run_ends]) / 2
+    run_weights[0] = weights[run_starts[0]]
+    if len(run_starts) > 1:
+        run_weights[-1] = weights[run_ends[-1]]
+    return run_weights.astype(np.float32), colors[run_starts]
+
+
+def get_sample_taps(uvs, width, height, mode='NEAREST'):
+    """
+    Finds the pixels sample_image_at_uvs() blends for every UV, so readers that only hold part of an
+    image know which pixels to fetch.
+
+    :param uvs: (N, 2) array of UV coordinates, clamped to 0.0 - 1.0.
+    :param mode: 'NEAREST' (one tap per UV) or 'BILINEAR' (four taps).
+    :return: (N, taps) rows with row 0 at v = 0, (N, taps) columns and (N, taps) float32 blend weights.
+    """
+    uvs = np.clip(np.asarray(uvs, dtype=np.float32).reshape(-1, 2), 0.0, 1.0)
+
+    if mode == 'NEAREST':
+        # u = 1.0 lands on the last pixel instead of one past it
+        x = np.minimum((uvs[:, 0] * width).astype(np.int64), width - 1)
+        y = np.minimum((uvs[:, 1] * height).astype(np.int64), height - 1)
+        return y[:, None], x[:, None], np.ones((len(uvs), 1), dtype=np.float32)
+
+    if mode != 'BILINEAR':
+        raise ValueError(f"Unknown sample mode '{mode}'.")
+
+    # pixel centers sit at (i + 0.5) / size
+    fx = uvs[:, 0] * width - 0.5
+    fy = uvs[:, 1] * height - 0.5
+    x_floor = np.floor(fx)
+    y_floor = np.floor(fy)
+    tx = fx - x_floor
+    ty = fy - y_floor
+    x0 = np.clip(x_floor, 0, width - 1).astype(np.int64)
+    x1 = np.clip(x_floor + 1, 0, width - 1).astype(np.int64)
+    y0 = np.clip(y_floor, 0, height - 1).astype(np.int64)
+    y1 = np.clip(y_floor + 1, 0, height - 1).astype(np.int64)
+
+    rows = np.stack([y0, y0, y1, y1], axis=1)
+    columns = np.stack([x0, x1, x0, x1], axis=1)
+    blend = np.stack([(1 - tx) * (1 - ty), tx * (1 - ty), (1 - tx) * ty, tx * ty], axis=1)
+    return rows, columns, blend.astype(np.float32)
+
+
+def blend_sample_taps(tap_values, blend):
+    # (N, taps, channels) pixel values and (N, taps) weights to (N, channels) samples
+    if blend.shape[1] == 1:
+        return tap_values[:, 0]
+    return np.einsum('ntc,nt->nc', tap_values, blend)
+
+
+def sample_image_at_uvs(pixels, uvs, mode='NEAREST'):
+    """
+    Samples an image buffer at many UV coordinates at once.
+
+    :param pixels: (height, width, channels) array, row 0 is v = 0.
+    :param uvs: (N, 2) array of UV coordinates, clamped to 0.0 - 1.0.
+    :param mode: 'NEAREST' or 'BILINEAR'.
+    :return: (N, channels) array of sampled values.
+    """
+    height, width = pixels.shape[:2]
+    rows, columns, blend = get_sample_taps(uvs, width, height, mode)
+    return blend_sample_taps(pixels[rows, columns], blend)
+
+
+def average_per_vertex(loop_vertices, loop_values):
+    # a vertex has one loop per face around it, average their samples
+    vertex_indices, inverse = np.unique(loop_vertices, return_inverse=True)
+    sums = np.bincount(inverse, weights=loop_values, minlength=len(vertex_indices))
+    counts = np.bincount(inverse, minlength=len(vertex_indices))
+    return vertex_indices, (sums / np.maximum(counts, 1)).astype(np.float32)
+
+
+def decode_sticker_samples(colors, metadata, weight_decoder):
+    """
+    :param colors: (N, channels) colors sampled from a sticker.
+    :param metadata: Sticker header from read_sticker_metadata(), colormap when None.
+    :param weight_decoder: RgbWeightDecoder for colormap stickers.
+    :return: (N,) float32 weights.
+    """
+    # WEIGHT stickers hold the weight itself, colormap stickers convert all RGB values in one call
+    if metadata is not None and metadata["encoding"] == "WEIGHT":
+        return np.clip(colors[:, metadata["channel"]], 0.0, 1.0).astype(np.float32)
+    return weight_decoder.decode(colors)
+
+
+GRADIENT_FALLOFFS = {
+    'LINEAR': lambda t: t,
+    'SMOOTH': lambda t: t * t * (3.0 - 2.0 * t),
+    'SPHERE': lambda t: np.sqrt(1.0 - (1.0 - t) ** 2),
+    'ROOT': np.sqrt,
+    'SHARP': lambda t: t * t,
+}
+
+
+GRADIENT_MIX_MODES = {
+    'REPLACE': lambda old, new: new,
+    'ADD': lambda old, new: old + new,
+    'SUBTRACT': lambda old, new: old - new,
+    'MULTIPLY': lambda old, new: old * new,
+    'MAX': np.maximum,
+    'MIN': np.minimum,
+}
+
+
+def gradient_weights(positions, start, end, shape='LINEAR', falloff='LINEAR'):
+    """
+    :param positions: (N, D) array of points, D matching start and end.
+    :return: (N,) float64 weights, 0.0 at start rising to 1.0 at end.
+    """
+    gradient_vec = end - start
+    gradient_length = np.linalg.norm(gradient_vec)
+
+    if gradient_length == 0:
+        raise ValueError("Start and end points of the gradient are the same.")
+
+    offsets = positions - start
+    if shape == 'RADIAL':
+        t = np.linalg.norm(offsets, axis=1) / gradient_length
+    elif shape in ('LINEAR', 'UV'):
+        # Project vertex positions onto the gradient line
+        t = offsets @ gradient_vec / (gradient_length * gradient_length)
+    else:
+        raise ValueError(f"Unknown gradient shape '{shape}'.")
+    t = np.clip(t, 0.0, 1.0)
+
+    if isinstance(falloff, str):
+        return GRADIENT_FALLOFFS[falloff](t)
+    if callable(falloff):
+        return np.clip(falloff(t), 0.0, 1.0)
+    curve = np.asarray(falloff, dtype=np.float64)
+    return np.interp(t, curve[:, 0], curve[:, 1])
+
+
+def label_strands(edges, vertex_count):
+    """
+    Union-find over the edge list: every vertex gets the id of the loose part (strand) it belongs to.
+
+    :param edges: (E, 2) array of vertex indices.
+    :param vertex_count: Number of vertices.
+    :return: (vertex_count,) int64 array of strand ids numbered 0 to strand count - 1.
+    """
+    parents = np.arange(vertex_count, dtype=np.int64)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    while True:
+        roots_a = parents[edges[:, 0]]
+        roots_b = parents[edges[:, 1]]
+        joining = roots_a != roots_b
+        if not joining.any():
+            break
+        # hook the larger root under the smaller one, so parents always point down and never cycle
+        np.minimum.at(
+            parents,
+            np.maximum(roots_a[joining], roots_b[joining]),
+            np.minimum(roots_a[joining], roots_b[joining]),
+        )
+        # pointer jumping until every vertex points straight at its root
+        while True:
+            grandparents = parents[parents]
+            if np.array_equal(grandparents, parents):
+                break
+            parents = grandparents
+
+    _, strand_ids = np.unique(parents, return_inverse=True)
+    return strand_ids.astype(np.int64)
+
+
+def strand_gradient_weights(strand_ids, vertex_v, percent_covered):
+    """
+    :param strand_ids: Strand id per vertex from label_strands.
+    :param vertex_v: V coordinate per vertex, -inf for vertices without UVs.
+    :param percent_covered: Part of each strand's UV height the gradient covers.
+    :return: float32 weight per vertex, 1.0 at each strand's root fading to 0.0.
+    """
+    strand_count = int(strand_ids.max()) + 1 if len(strand_ids) else 0
+    has_uv = np.isfinite(vertex_v)
+    max_v = np.full(strand_count, -np.inf, dtype=np.float32)
+    np.maximum.at(max_v, strand_ids[has_uv], vertex_v[has_uv])
+    min_v = np.full(strand_count, np.inf, dtype=np.float32)
+    np.minimum.at(min_v, strand_ids[has_uv], vertex_v[has_uv])
+
+    # strands without any UV give inf - inf here, they are masked out by has_uv below
+    with np.errstate(invalid='ignore'):
+        gradient_length = ((max_v - min_v) * percent_covered)[strand_ids]
+        distance_from_root = max_v[strand_ids] - vertex_v
+
+    weights = np.zeros(len(strand_ids), dtype=np.float32)
+    sloped = has_uv & (gradient_length > 0)
+    weights[sloped] = np.clip(1.0 - distance_from_root[sloped] / gradient_length[sloped], 0.0, 1.0)
+    # a strand without UV height (or percent_covered 0) only marks its root
+    flat = has_uv & ~(gradient_length > 0)
+    weights[flat] = (distance_from_root[flat] <= 0).astype(np.float32)
+    return weights
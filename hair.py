@@ -1,109 +1,100 @@
 import bpy
-import bmesh
-import mathutils
-import math
-
-def paint_hair_top(object_name, percent_covered):
-
-    # Ensure you're in Object Mode
-    if bpy.context.object.mode != 'OBJECT':
-        bpy.ops.object.mode_set(mode='OBJECT')
+from mathutils import kdtree
+from bpy_extras.mesh_utils import mesh_linked_uv_islands
+import numpy as np
+import sys
+from collections import OrderedDict
+from pathlib import Path
+
+# the shared Blender helpers live in blender/, which is not on sys.path inside Blender
+sys.path.append(str(Path(__file__).resolve().parent / "blender"))
+from mesh_io import read_vertex_group_weights, write_vertex_group_weights, foreach_get
+from weight_core import GRADIENT_MIX_MODES, gradient_weights, label_strands, strand_gradient_weights
+
+def paint_hair_top(object_name, percent_covered, vertex_group_name=None):
+    """
+    Paints a root to tip gradient on every hair strand in one pass, without separating the mesh.
+    Each strand starts at weight 1.0 at its highest V (the root, see get_hair_root_position) and
+    fades to 0.0 after percent_covered of its UV height (see get_uv_height).
 
-    # Example usage:
+    :param object_name: Name of the hair mesh object.
+    :param percent_covered: Part of each strand's UV height the gradient covers, 0.0 - 1.0.
+    :param vertex_group_name: Group to write to, defaults to the active group or "HairTop".
+    """
     obj = bpy.data.objects.get(object_name)
 
     if not obj or obj.type != 'MESH':
         print("Please select a mesh object.")
-    else:
-        # Deselect all objects
-        bpy.ops.object.select_all(action='DESELECT')
-
-        # Select the active object
-        obj.select_set(True)
+        return
 
-        # Separate the object by loose parts
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.separate(type='LOOSE')
+    # Ensure you're in Object Mode so the mesh data is current
+    if bpy.context.object and bpy.context.object.mode != 'OBJECT':
         bpy.ops.object.mode_set(mode='OBJECT')
 
-        # Get the new objects (all loose parts)
-        loose_parts = bpy.context.selected_objects
-        
-        #each hair strand all have the same uvs so you should be able to do the next few lines once and apply it to all parts
-        uv_height, min_v, max_v = get_uv_height(obj)
-        gradient_length = uv_height * percent_covered
-        v_start = max_v
-        v_end = max_v - gradient_length
-
-        closest_uv, closest_index = closest_uv = get_closest_uv(obj, target_uv)
-
-
-        for part in loose_parts:
-
-            bpy.ops.object.mode_set(mode='OBJECT')
-            part.select_set(True)
-            bpy.context.view_layer.objects.active = part
-
-
-            bpy.ops.object.mode_set(mode='WEIGHT_PAINT')
-
-
-            world_coords = get_hair_root_position(part)
-            xstart = world_coords[0]
-            ystart = world_coords[1]
-
-            bpy.ops.paint.weight_gradient(xstart=xstart, xend=957, ystart=ystart, yend=359, flip=False)
-
-        bpy.ops.object.mode_set(mode='OBJECT')
-    
-        #join them all back again 
-        # Select all the loose parts
-        for obj in loose_parts:
-            obj.select_set(True)
+    mesh = obj.data
+    edge_vertices = np.empty(len(mesh.edges) * 2, dtype=np.int64)
+    foreach_get(mesh.edges, "vertices", edge_vertices)
+    strand_ids = label_strands(edge_vertices.reshape(-1, 2), len(mesh.vertices))
 
-        # Set the first loose part as active for joining
-        bpy.context.view_layer.objects.active = loose_parts[0]
+    # only the loop arrays are needed, not the KD-tree of a UVIndex
+    loop_uvs, loop_vertices = read_uv_loops(obj)
+    # a vertex on a UV seam has several loops, keep its highest V like get_hair_root_position
+    vertex_v = np.full(len(mesh.vertices), -np.inf, dtype=np.float32)
+    np.maximum.at(vertex_v, loop_vertices, loop_uvs[:, 1])
 
-        # Join the loose parts back into one object
-        bpy.ops.object.join()
+    weights = strand_gradient_weights(strand_ids, vertex_v, percent_covered)
 
-        # Print the new objeworld_coords
-        #print("New Object Name:", bpy.context.object.name)
-        print("DONE")
+    if vertex_group_name is None:
+        active_group = obj.vertex_groups.active
+        vertex_group_name = active_group.name if active_group else "HairTop"
 
+    # vertices without faces have no UV and are left out
+    has_uv = np.isfinite(vertex_v)
+    write_vertex_group_weights(obj, vertex_group_name, np.flatnonzero(has_uv), weights[has_uv], 'REPLACE')
+    print(f"Painted {strand_ids.max() + 1 if len(strand_ids) else 0} strands into '{vertex_group_name}'.")
 
 
 def get_hair_root_position(obj):
-    # Get the active UV map
-    uv_layer = obj.data.uv_layers.active.data
-
-    # Initialize variables to track the maximum V value and its corresponding UV coordinates
-    max_v = float('-inf')
-    max_uv_coords = None
-    max_loop_index = None
-
-    # Iterate through all UV coordinates
-    for loop_index, uv in enumerate(uv_layer):
-        uv_coords = uv.uv
-        if uv_coords[1] > max_v:  # Compare the V (y) value
-            max_v = uv_coords[1]
-            max_uv_coords = uv_coords
-            max_loop_index = loop_index
-
-    loop = obj.data.loops[max_loop_index]
-    vertex_index = loop.vertex_index
+    # the root is the loop with the highest V
+    uv_index = get_uv_index(obj)
+    max_loop_index = int(np.argmax(uv_index.loop_uvs[:, 1]))
+
+    vertex_index = int(uv_index.loop_vertices[max_loop_index])
     vertex = obj.data.vertices[vertex_index]
     world_coords = obj.matrix_world @ vertex.co
 
     return world_coords
 
 
+def get_hair_root_positions(obj):
+    """
+    Root of every strand at once.
+
+    :return: (strand ids per vertex, (S, 3) array of world space root positions), NaN rows for strands
+        without UV loops.
+    """
+    mesh = obj.data
+    edge_vertices = np.empty(len(mesh.edges) * 2, dtype=np.int64)
+    foreach_get(mesh.edges, "vertices", edge_vertices)
+    strand_ids = label_strands(edge_vertices.reshape(-1, 2), len(mesh.vertices))
+
+    strand_count = int(strand_ids.max()) + 1 if len(strand_ids) else 0
 
-paint_hair_top("LOD_1_Group_0_Sub_1__esf_Hair00")
+    uv_index = get_uv_index(obj)
+    _, root_loops = uv_index.extreme_v_loops(strand_ids[uv_index.loop_vertices], strand_count)
+    has_root = root_loops >= 0
+    root_vertices = uv_index.loop_vertices[root_loops[has_root]]
 
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    foreach_get(mesh.vertices, "co", coords)
+    matrix = np.array(obj.matrix_world, dtype=np.float64)
+    # one row per strand, so row s is always the root of strand s
+    roots = np.full((strand_count, 3), np.nan)
+    roots[has_root] = coords.reshape(-1, 3)[root_vertices] @ matrix[:3, :3].T + matrix[:3, 3]
+    return strand_ids, roots
 
 
-def apply_weight_gradient(obj_name, start, end, vertex_group_name):
+def apply_weight_gradient(obj_name, start, end, vertex_group_name, dry_run=False):
     """
     Mimics the weight gradient operator by applying weights directly.
     
@@ -112,44 +103,108 @@ def apply_weight_gradient(obj_name, start, end, vertex_group_name):
     - start: The start point of the gradient (world coordinates).
     - end: The end point of the gradient (world coordinates).
     - vertex_group_name: The name of the vertex group to modify.
+    - dry_run: Only return the (vertex indices, weights) arrays without writing them.
+    """
+    spec = {"group": vertex_group_name, "start": start, "end": end}
+    result = apply_weight_gradients(obj_name, [spec], dry_run=dry_run)[vertex_group_name]
+    if not dry_run:
+        print(f"Weight gradient applied to '{vertex_group_name}' in object '{obj_name}'.")
+    return result
+
+
+def apply_weight_gradients(obj_name, specs, dry_run=False):
+    """
+    Applies a batch of gradients in one call. Vertex coordinates and UVs are read once with
+    foreach_get, every touched group is written once and only read when its first spec mixes with the
+    current weights, no UI context is needed.
+
+    Each spec is a dict with:
+    - group: The name of the vertex group to modify, created if missing.
+    - start, end: Gradient start and end, world coordinates, or (u, v) for the 'UV' shape.
+    - shape: 'LINEAR' (along start -> end), 'RADIAL' (distance from start, radius |end - start|)
+      or 'UV' (linear in UV space). Default 'LINEAR'.
+    - falloff: A GRADIENT_FALLOFFS name, a callable on 0.0 - 1.0 arrays or a list of (x, y)
+      curve points. Default 'LINEAR'.
+    - mix: A GRADIENT_MIX_MODES name, how the gradient combines with the current weights. Default 'REPLACE'.
+    - flip: Swap the gradient so it runs from 1.0 at start to 0.0 at end. Default False.
+
+    Specs for the same group are applied in order, each on top of the previous one.
+
+    :return: Dict of {group name: (vertex indices, weights)} as written.
     """
-    # Get the object
     obj = bpy.data.objects.get(obj_name)
     if not obj or obj.type != 'MESH':
         raise ValueError(f"Object '{obj_name}' not found or is not a mesh.")
 
-    # Ensure the object has a vertex group
-    if vertex_group_name not in obj.vertex_groups:
-        obj.vertex_groups.new(name=vertex_group_name)
-    vertex_group = obj.vertex_groups[vertex_group_name]
-
-    # Convert start and end points to local space
-    start_local = obj.matrix_world.inverted() @ mathutils.Vector(start)
-    end_local = obj.matrix_world.inverted() @ mathutils.Vector(end)
-
-    # Calculate the gradient direction vector
-    gradient_vec = end_local - start_local
-    gradient_length = gradient_vec.length
-
-    if gradient_length == 0:
-        raise ValueError("Start and end points of the gradient are the same.")
-
-    gradient_vec.normalize()
-
-    # Loop through vertices and assign weights
     mesh = obj.data
-    for vertex in mesh.vertices:
-        # Project vertex position onto the gradient line
-        vertex_pos = vertex.co - start_local
-        projection_length = vertex_pos.dot(gradient_vec)
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    foreach_get(mesh.vertices, "co", coords)
+    coords = coords.reshape(-1, 3).astype(np.float64)
+    # gradients are measured in local space like the weight gradient operator
+    world_to_local = np.array(obj.matrix_world.inverted(), dtype=np.float64)
+
+    vertex_uvs = None
+    if any(spec.get("shape", 'LINEAR') == 'UV' for spec in specs):
+        vertex_uvs = get_vertex_uvs(obj)
+
+    # the current weights are only needed by groups whose first spec mixes with them, the per vertex read is
+    # the slowest part of a REPLACE batch otherwise
+    first_mixes = {}
+    for spec in specs:
+        first_mixes.setdefault(spec["group"], spec.get("mix", 'REPLACE'))
+    group_weights = read_vertex_group_weights(obj, [name for name, mix in first_mixes.items() if mix != 'REPLACE'])
+    unread = np.zeros(len(mesh.vertices), dtype=np.float32)
+
+    for spec in specs:
+        shape = spec.get("shape", 'LINEAR')
+        if shape == 'UV':
+            positions = vertex_uvs
+            start = np.asarray(spec["start"], dtype=np.float64)[:2]
+            end = np.asarray(spec["end"], dtype=np.float64)[:2]
+        else:
+            positions = coords
+            start = world_to_local[:3, :3] @ np.asarray(spec["start"], dtype=np.float64) + world_to_local[:3, 3]
+            end = world_to_local[:3, :3] @ np.asarray(spec["end"], dtype=np.float64) + world_to_local[:3, 3]
+
+        weights = gradient_weights(positions, start, end, shape, spec.get("falloff", 'LINEAR'))
+        if spec.get("flip", False):
+            weights = 1.0 - weights
+
+        group_name = spec["group"]
+        mixed = GRADIENT_MIX_MODES[spec.get("mix", 'REPLACE')](group_weights.get(group_name, unread), weights)
+        group_weights[group_name] = np.clip(mixed, 0.0, 1.0).astype(np.float32)
+
+    vertex_indices = np.arange(len(mesh.vertices))
+    return {
+        group_name: write_vertex_group_weights(obj, group_name, vertex_indices, weights, 'REPLACE', dry_run=dry_run)
+        for group_name, weights in group_weights.items()
+    }
+
+
+def read_uv_loops(obj):
+    """
+    :return: (L, 2) UVs of obj's active UV layer and the (L,) vertex index of every loop.
+    """
+    mesh = obj.data
+    uv_layer = mesh.uv_layers.active
+    if not uv_layer:
+        raise ValueError(f"Object '{obj.name}' does not have an active UV layer.")
+    loop_uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+    foreach_get(uv_layer.data, "uv", loop_uvs)
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int64)
+    foreach_get(mesh.loops, "vertex_index", loop_vertices)
+    return loop_uvs.reshape(-1, 2), loop_vertices
 
-        # Calculate weight (clamp between 0 and 1)
-        weight = max(0, min(1, projection_length / gradient_length))
 
-        # Assign the weight to the vertex group
-        vertex_group.add([vertex.index], weight, 'REPLACE')
+def get_vertex_uvs(obj):
+    # average UV of every vertex over its loops, 0.0 for vertices without faces
+    mesh = obj.data
+    loop_uvs, loop_vertices = read_uv_loops(obj)
 
-    print(f"Weight gradient applied to '{vertex_group_name}' in object '{obj_name}'.")
+    counts = np.maximum(np.bincount(loop_vertices, minlength=len(mesh.vertices)), 1)
+    u = np.bincount(loop_vertices, weights=loop_uvs[:, 0], minlength=len(mesh.vertices)) / counts
+    v = np.bincount(loop_vertices, weights=loop_uvs[:, 1], minlength=len(mesh.vertices)) / counts
+    return np.stack([u, v], axis=1)
 
 # Example Usage
 #apply_weight_gradient(
@@ -158,31 +213,18 @@ def apply_weight_gradient(obj_name, start, end, vertex_group_name):
 #    end=(1, 0, 0),         # End of the gradient (world coordinates)
 #    vertex_group_name="GradientWeights"
 #)
+#apply_weight_gradients("YourObjectNameHere", [
+#    {"group": "GradientWeights", "start": (0, 0, 0), "end": (1, 0, 0), "falloff": 'SMOOTH'},
+#    {"group": "GradientWeights", "start": (0, 0, 0), "end": (0, 0, 1), "shape": 'RADIAL', "mix": 'MULTIPLY'},
+#    {"group": "HairTop", "start": (0.5, 1.0), "end": (0.5, 0.6), "shape": 'UV', "falloff": [(0, 0), (0.5, 0.8), (1, 1)]},
+#])
 
 def get_uv_height(obj):
-    if obj.type != 'MESH':
-        raise ValueError(f"Object '{obj.name}' is not a mesh.")
-    
-    # Ensure the object has UV layers
-    uv_layer = obj.data.uv_layers.active
-    if not uv_layer:
-        raise ValueError(f"Object '{obj.name}' does not have an active UV layer.")
-
-    # Initialize variables for min and max V values
-    min_v = float('inf')
-    max_v = float('-inf')
-
-    # Iterate through UV coordinates to find min and max V
-    for uv_loop in uv_layer.data:
-        v = uv_loop.uv[1]  # Get the V (y) coordinate
-        if v < min_v:
-            min_v = v
-        if v > max_v:
-            max_v = v
+    uv_index = get_uv_index(obj)
 
-    # Calculate the height
-    uv_height = max_v - min_v
-    return uv_height, min_v, max_v
+    # Calculate the height from the cached min and max V values
+    uv_height = uv_index.max_v - uv_index.min_v
+    return uv_height, uv_index.min_v, uv_index.max_v
 
 
 def get_closest_uv(obj, target_uv):
@@ -196,28 +238,124 @@ def get_closest_uv(obj, target_uv):
     Returns:
         The closest UV coordinate as a tuple (u, v) and its index in the UV loop.
     """
+    uv_index = get_uv_index(obj)
+    _, loop_indices = uv_index.nearest([target_uv])
+    closest_index = int(loop_indices[0])
+    closest_uv = obj.data.uv_layers.active.data[closest_index].uv
+
+    return closest_uv, closest_index
+
+
+class UVIndex:
+    """
+    Spatial index over the loop UVs of a mesh: a KD-tree for nearest and range queries plus the
+    cached V extent. Use get_uv_index() to get one, it is rebuilt only when the UVs change.
+
+    :param loop_uvs: (L, 2) UV per loop.
+    :param loop_vertices: (L,) vertex index per loop.
+    """
+
+    def __init__(self, loop_uvs, loop_vertices):
+        self.loop_uvs = loop_uvs
+        self.loop_vertices = loop_vertices
+        self.min_v = float(loop_uvs[:, 1].min()) if len(loop_uvs) else float('inf')
+        self.max_v = float(loop_uvs[:, 1].max()) if len(loop_uvs) else float('-inf')
+
+        self.kd = kdtree.KDTree(len(loop_uvs))
+        for loop_index, (u, v) in enumerate(loop_uvs.tolist()):
+            self.kd.insert((u, v, 0.0), loop_index)
+        self.kd.balance()
+
+    def nearest(self, target_uvs):
+        """
+        Not batched: mathutils' KD-tree answers one query per call, so this runs kd.find() once per target
+        UV in a Python loop. Fine for a handful of queries, use a vectorized search for many.
+
+        :param target_uvs: (N, 2) UV coordinates.
+        :return: (N, 2) closest loop UVs and the (N,) loop indices they belong to.
+        """
+        loop_indices = np.array(
+            [self.kd.find((u, v, 0.0))[1] for u, v in np.asarray(target_uvs, dtype=np.float64).reshape(-1, 2).tolist()],
+            dtype=np.int64,
+        )
+        return self.loop_uvs[loop_indices], loop_indices
+
+    def in_range(self, target_uv, radius):
+        # loop indices within radius of target_uv, closest first
+        return np.array([index for _, index, _ in self.kd.find_range((target_uv[0], target_uv[1], 0.0), radius)], dtype=np.int64)
+
+    def extreme_v_loops(self, loop_labels, label_count=None):
+        """
+        Lowest and highest V loop of every label, e.g. a strand id or UV island id per loop.
+
+        :param loop_labels: (L,) non negative int label per loop.
+        :param label_count: Number of labels, by default the largest label + 1. Pass it when the last
+            labels may have no loops.
+        :return: (lowest V loop per label, highest V loop per label), -1 for labels without loops.
+        """
+        loop_labels = np.asarray(loop_labels, dtype=np.int64)
+        if label_count is None:
+            label_count = int(loop_labels.max()) + 1 if len(loop_labels) else 0
+        # sorted by label, then V: the first loop of a label has its lowest V, the last its highest
+        order = np.lexsort((self.loop_uvs[:, 1], loop_labels))
+        sorted_labels = loop_labels[order]
+        lowest = np.full(label_count, -1, dtype=np.int64)
+        highest = np.full(label_count, -1, dtype=np.int64)
+        if len(order):
+            run_starts = np.flatnonzero(np.concatenate(([True], sorted_labels[1:] != sorted_labels[:-1])))
+            run_ends = np.concatenate((run_starts[1:], [len(order)])) - 1
+            lowest[sorted_labels[run_starts]] = order[run_starts]
+            highest[sorted_labels[run_ends]] = order[run_ends]
+        return lowest, highest
+
+    def island_labels(self, mesh):
+        # UV island id per loop
+        loop_starts = np.empty(len(mesh.polygons), dtype=np.int64)
+        foreach_get(mesh.polygons, "loop_start", loop_starts)
+        loop_totals = np.empty(len(mesh.polygons), dtype=np.int64)
+        foreach_get(mesh.polygons, "loop_total", loop_totals)
+        face_islands = np.zeros(len(mesh.polygons), dtype=np.int64)
+        for island_index, faces in enumerate(mesh_linked_uv_islands(mesh)):
+            face_islands[faces] = island_index
+        return np.repeat(face_islands, loop_totals)
+
+
+# {(mesh pointer, UV layer name): (fingerprint, UVIndex)}, least recently used first
+_uv_index_cache = OrderedDict()
+UV_INDEX_CACHE_SIZE = 8
+
+
+def get_uv_index(obj):
+    """
+    Returns the UVIndex of obj's active UV layer. Indexes are cached per mesh and UV layer and
+    reused until the UVs or loops change. Indexes of deleted meshes are dropped, and only the
+    UV_INDEX_CACHE_SIZE most recently used are kept.
+    """
     if obj.type != 'MESH':
         raise ValueError(f"Object '{obj.name}' is not a mesh.")
 
     # Ensure the object has UV layers
-    uv_layer = obj.data.uv_layers.active
-    if not uv_layer:
-        raise ValueError(f"Object '{obj.name}' does not have an active UV layer.")
-    
-    closest_uv = None
-    closest_distance = float('inf')
-    closest_index = None
-
-    # Iterate through UV coordinates to find the closest one
-    for index, uv_loop in enumerate(uv_layer.data):
-        uv = uv_loop.uv
-        distance = math.sqrt((uv[0] - target_uv[0])**2 + (uv[1] - target_uv[1])**2)
-        if distance < closest_distance:
-            closest_distance = distance
-            closest_uv = uv
-            closest_index = index
+    mesh = obj.data
+    uv_layer = mesh.uv_layers.active
+    loop_uvs, loop_vertices = read_uv_loops(obj)
+    # reading the arrays is cheap, the python side KD-tree build is what the cache saves
+    fingerprint = hash((loop_uvs.tobytes(), loop_vertices.tobytes()))
+
+    # a deleted mesh's pointer can be reused by a new mesh, forget it as soon as it is gone
+    live_meshes = {live_mesh.as_pointer() for live_mesh in bpy.data.meshes}
+    for stale_key in [cache_key for cache_key in _uv_index_cache if cache_key[0] not in live_meshes]:
+        del _uv_index_cache[stale_key]
+
+    key = (mesh.as_pointer(), uv_layer.name)
+    cached = _uv_index_cache.get(key)
+    if cached is None or cached[0] != fingerprint:
+        cached = (fingerprint, UVIndex(loop_uvs, loop_vertices))
+        _uv_index_cache[key] = cached
+    _uv_index_cache.move_to_end(key)
+    while len(_uv_index_cache) > UV_INDEX_CACHE_SIZE:
+        _uv_index_cache.popitem(last=False)
+    return cached[1]
 
-    return closest_uv, closest_index
 
 # Example usage
 #obj = bpy.context.object  # Use the active object
@@ -232,3 +370,5 @@ def get_closest_uv(obj, target_uv):
 #else:
 #    print("No active object selected.")
 
+if __name__ == "__main__":
+    paint_hair_top("LOD_1_Group_0_Sub_1__esf_Hair00", 0.5)
@@ -1,39 +1,98 @@
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
+import numpy as np
 import json
 
-directory = Path("path/to/your/images")
-pixel_dict = {}
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.gif'}
 
-for file_path in directory.iterdir():
-    if file_path.suffix.lower() in {'.png', '.jpg', '.jpeg', '.gif'}:
-        print("Processing:", file_path)
 
-        # Open the image
-        image = Image.open(str(file_path))
+def get_layer_mask(pixels):
+    """
+    :param pixels: (height, width, 3) uint8 RGB array.
+    :return: (height, width) bool array, True where the pixel is neither black nor blue.
+    """
+    black = np.all(pixels == 0, axis=2)
+    blue = (pixels[:, :, 0] == 0) & (pixels[:, :, 1] == 0) & (pixels[:, :, 2] == 255)
+    return ~(black | blue)
 
+
+def process_image(file_path):
+    # runs in a worker process, returns the mask packed to 1 bit per pixel to keep the transfer small
+    print("Processing:", file_path)
+    with Image.open(str(file_path)) as image:
         # Convert the image to RGB if it's not already
-        image = image.convert("RGB")
+        pixels = np.asarray(image.convert("RGB"))
+    mask = get_layer_mask(pixels)
+    return file_path.stem, mask.shape, np.packbits(mask, axis=1)
+
+
+def save_layer_masks(path, layer_masks):
+    """
+    Writes every layer as a bitmask (8 pixels per byte, rows padded to whole bytes) into one .npz.
+
+    :param layer_masks: Dict of {layer name: ((height, width), packed bits)}.
+    """
+    names = list(layer_masks)
+    arrays = {f"mask_{i}": layer_masks[name][1] for i, name in enumerate(names)}
+    np.savez_compressed(
+        path,
+        names=np.array(names),
+        shapes=np.array([layer_masks[name][0] for name in names], dtype=np.int64).reshape(-1, 2),
+        **arrays
+    )
+
+
+def load_layer_masks(path):
+    """
+    :return: Dict of {layer name: (height, width) bool mask}.
+    """
+    with np.load(path) as data:
+        return {
+            str(name): np.unpackbits(data[f"mask_{i}"], axis=1, count=int(shape[1])).astype(bool)
+            for i, (name, shape) in enumerate(zip(data["names"], data["shapes"]))
+        }
+
+
+def export_layer_json(path, layer_masks):
+    # the old layer_pixels.json layout: {layer name: [[x, y], ...]}
+    pixel_dict = {}
+    for name, (shape, bits) in layer_masks.items():
+        ys, xs = np.nonzero(np.unpackbits(bits, axis=1, count=shape[1]))
+        pixel_dict[name] = np.stack([xs, ys], axis=1).tolist()
+    with open(path, "w") as file:
+        json.dump(pixel_dict, file)
+
+
+def main(directory, export_json=False, delete_processed=False, workers=None):
+    """
+    Adds the masks of every image in directory to its layer_pixels.npz, layers of earlier runs are kept and
+    layers of the same name are replaced.
 
-        # Get image dimensions
-        width, height = image.size
+    :param delete_processed: Remove the source images once their masks are written.
+    """
+    file_paths = [path for path in directory.iterdir() if path.suffix.lower() in IMAGE_SUFFIXES]
 
-        # Initialize list for coordinates
-        non_black_or_blue_coords = []
+    npz_path = directory / "layer_pixels.npz"
+    layer_masks = {}
+    if npz_path.exists():
+        # back to the packed layout save_layer_masks expects
+        for name, mask in load_layer_masks(npz_path).items():
+            layer_masks[name] = (mask.shape, np.packbits(mask, axis=1))
 
-        # Iterate through each pixel
-        for y in range(height):
-            for x in range(width):
-                pixel = image.getpixel((x, y))
-                # Check if pixel is not black or blue
-                if pixel != (0, 0, 0) and pixel != (0, 0, 255):
-                    non_black_or_blue_coords.append((x, y))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for name, shape, bits in executor.map(process_image, file_paths):
+            layer_masks[name] = (shape, bits)
 
-        pixel_dict[file_path.stem()] = non_black_or_blue_coords
-        file_path.unlink()
+    save_layer_masks(npz_path, layer_masks)
+    if export_json:
+        export_layer_json(directory / "layer_pixels.json", layer_masks)
 
+    # only remove the source images once their masks are safely written
+    if delete_processed:
+        for file_path in file_paths:
+            file_path.unlink()
 
-json_path = directory / "layer_pixels.json"
-with open(f"{json_path}", "a+") as file:
-    json.dump(pixel_dict, file, indent=4)
 
+if __name__ == "__main__":
+    main(Path("path/to/your/images"))
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# the modules under test import each other as siblings, like they do inside Blender
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR / "blender"))
@@ -0,0 +1,114 @@
+import json
+
+from bake_cache import BakeManifest, MANIFEST_NAME, merge_shard_manifests
+
+
+def write_sticker(output_dir, file_name):
+    # a sticker and its format header
+    path = output_dir / file_name
+    path.write_bytes(b"sticker")
+    path.with_suffix(".json").write_text("{}")
+    return path
+
+
+def test_is_fresh(tmp_path):
+    manifest = BakeManifest(tmp_path)
+    path = write_sticker(tmp_path, "A.exr")
+    manifest.record("A", "key", path)
+
+    assert manifest.is_fresh("A", "key", path)
+    assert not manifest.is_fresh("A", "other key", path)
+    assert not manifest.is_fresh("B", "key", path)
+    # a deleted sticker is re-baked even when the key matches
+    path.unlink()
+    assert not manifest.is_fresh("A", "key", path)
+
+
+def test_manifest_is_saved_and_read_back(tmp_path):
+    manifest = BakeManifest(tmp_path)
+    path = write_sticker(tmp_path, "A.exr")
+    manifest.record("A", "key", path)
+    manifest.save()
+
+    assert BakeManifest(tmp_path).is_fresh("A", "key", path)
+    assert not (tmp_path / (MANIFEST_NAME + ".tmp")).exists()
+
+
+def test_invalidate_removes_sticker_and_header(tmp_path):
+    manifest = BakeManifest(tmp_path)
+    path = write_sticker(tmp_path, "A.exr")
+    manifest.record("A", "key", path)
+
+    manifest.invalidate("A")
+
+    assert "A" not in manifest.entries and manifest.changes == {"A": None}
+    assert not path.exists() and not path.with_suffix(".json").exists()
+    # unknown groups are ignored
+    manifest.invalidate("missing")
+
+
+def test_invalidate_keeps_shared_pack(tmp_path):
+    manifest = BakeManifest(tmp_path)
+    pack = write_sticker(tmp_path, "pack_000.exr")
+    manifest.record("A", "key a", pack)
+    manifest.record("B", "key b", pack)
+
+    manifest.invalidate("A")
+    assert pack.exists() and pack.with_suffix(".json").exists()
+
+    # the last group of the pack takes the file with it
+    manifest.invalidate("B")
+    assert not pack.exists() and not pack.with_suffix(".json").exists()
+
+
+def test_invalidate_keep_file_leaves_it_to_remove_unreferenced(tmp_path):
+    manifest = BakeManifest(tmp_path)
+    old_pack = write_sticker(tmp_path, "pack_000.exr")
+    new_pack = write_sticker(tmp_path, "pack_001.exr")
+    manifest.record("A", "key", old_pack)
+
+    manifest.invalidate("A", keep_file=True)
+    assert old_pack.exists()
+
+    manifest.record("A", "new key", new_pack)
+    manifest.remove_unreferenced("pack_*")
+    assert not old_pack.exists() and not old_pack.with_suffix(".json").exists()
+    assert new_pack.exists() and new_pack.with_suffix(".json").exists()
+
+
+def test_remove_stale(tmp_path):
+    manifest = BakeManifest(tmp_path)
+    kept = write_sticker(tmp_path, "A.exr")
+    stale = write_sticker(tmp_path, "B.exr")
+    manifest.record("A", "key", kept)
+    manifest.record("B", "key", stale)
+
+    manifest.remove_stale(["A"])
+
+    assert list(manifest.entries) == ["A"]
+    assert kept.exists() and not stale.exists()
+
+
+def test_merge_shard_manifests(tmp_path):
+    base = BakeManifest(tmp_path)
+    for name in ("A", "B", "C"):
+        base.record(name, "old", write_sticker(tmp_path, f"{name}.exr"))
+    base.save()
+
+    # shard 0 re-bakes A and removes B, shard 1 bakes the new group D
+    first = BakeManifest(tmp_path, shard=0)
+    first.record("A", "new", tmp_path / "A.exr")
+    first.invalidate("B")
+    first.save()
+    second = BakeManifest(tmp_path, shard=1)
+    second.record("D", "new", write_sticker(tmp_path, "D.exr"))
+    second.save()
+    # shards never touch the main manifest
+    assert json.loads((tmp_path / MANIFEST_NAME).read_text())["A"]["key"] == "old"
+
+    merged = merge_shard_manifests(tmp_path)
+
+    assert {name: entry["key"] for name, entry in merged.entries.items()} == {"A": "new", "C": "old", "D": "new"}
+    assert BakeManifest(tmp_path).entries == merged.entries
+    assert not list(tmp_path.glob("sticker_manifest.*.json"))
+
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import image_io
+import sticker_reader
+from sticker_format import read_sticker_metadata
+
+
+def smooth_pixels(height, width):
+    # (height, width, 4) RGBA sticker pixels with the weight in every color channel
+    v, u = np.meshgrid(np.linspace(0.0, 1.0, height), np.linspace(0.0, 1.0, width), indexing='ij')
+    weights = ((np.sin(3 * u) * np.cos(2 * v) + 1) / 2).astype(np.float32)
+    pixels = np.repeat(weights[:, :, None], 4, axis=2)
+    pixels[:, :, 3] = 1.0
+    return pixels
+
+
+def grid_uvs(count):
+    # UVs in the middle of every pixel of a count x count image, so every row and chunk is read
+    centers = (np.arange(count) + 0.5) / count
+    u, v = np.meshgrid(centers, centers)
+    return np.stack([u.ravel(), v.ravel()], axis=1)
+
+
+def write_sticker(tmp_path, sticker_format, pixels, exr_codec=None):
+    path = tmp_path / f"sticker{image_io.STICKER_FORMATS[sticker_format]['extension']}"
+    image_io.write_sticker_file(path, pixels, sticker_format, exr_codec)
+    return path
+
+
+def test_png_with_missing_rows_raises_eof_error(tmp_path):
+    path = write_sticker(tmp_path, "WEIGHT_PNG16", smooth_pixels(8, 8))
+    data = bytearray(path.read_bytes())
+    # claim twice the rows the IDAT stream holds, the reader does not check the IHDR CRC
+    data[20:24] = (16).to_bytes(4, "big")
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(EOFError):
+        sticker_reader.sample_sticker_file(path, grid_uvs(16))
+
+
+@pytest.mark.parametrize("sticker_format", ["WEIGHT_EXR_FLOAT", "COLORMAP_EXR"])
+def test_exr_with_truncated_header_raises_read_error(tmp_path, sticker_format):
+    path = write_sticker(tmp_path, sticker_format, smooth_pixels(8, 8))
+    data = path.read_bytes()
+    header_end = data.index(b"\0\0", data.index(b"dataWindow")) + 1
+    for cut in range(9, header_end, 7):
+        path.write_bytes(data[:cut])
+        with pytest.raises(sticker_reader.READ_ERRORS):
+            sticker_reader.sample_sticker_file(path, grid_uvs(8))
+
+
+@pytest.mark.parametrize("sticker_format, exr_codec", [
+    ("WEIGHT_PNG16", None),
+    ("WEIGHT_EXR_FLOAT", "NONE"),
+    ("WEIGHT_EXR_FLOAT", "ZIPS"),
+    ("WEIGHT_EXR_FLOAT", "ZIP"),
+])
+def test_truncated_files_raise_read_errors(tmp_path, sticker_format, exr_codec):
+    path = write_sticker(tmp_path, sticker_format, smooth_pixels(64, 64), exr_codec)
+    data = path.read_bytes()
+    for cut in (4, 30, len(data) // 3, len(data) // 2, len(data) - 40):
+        path.write_bytes(data[:cut])
+        with pytest.raises(sticker_reader.READ_ERRORS):
+            sticker_reader.sample_sticker_file(path, grid_uvs(64))
+
+
+@pytest.mark.parametrize("sticker_format, exr_codec, tolerance", [
+    ("WEIGHT_EXR_FLOAT", "NONE", 0.0),
+    ("WEIGHT_EXR_FLOAT", "ZIPS", 0.0),
+    ("WEIGHT_EXR_FLOAT", "ZIP", 0.0),
+    ("WEIGHT_EXR_HALF", "ZIP", 1e-3),
+    ("COLORMAP_EXR_HALF", None, 1e-3),
+    ("WEIGHT_PNG16", None, 0.5 / 65535),
+])
+def test_sticker_round_trip(tmp_path, sticker_format, exr_codec, tolerance):
+    # 40 rows end halfway through a 16 row ZIP chunk
+    pixels = smooth_pixels(40, 40)
+    path = write_sticker(tmp_path, sticker_format, pixels, exr_codec)
+
+    samples = sticker_reader.sample_sticker_file(path, grid_uvs(40))
+
+    # row 0 of the pixels is v = 0, like grid_uvs
+    channels = 1 if image_io.STICKER_FORMATS[sticker_format]["color_mode"] == 'BW' else 3
+    expected = pixels.reshape(-1, 4)[:, :channels]
+    np.testing.assert_allclose(samples[:, :channels], expected, atol=tolerance, rtol=0)
+    metadata = read_sticker_metadata(path)
+    assert metadata["format"] == sticker_format and metadata["resolution"] == 40
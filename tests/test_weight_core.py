@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+
+import weight_core
+
+
+def colormap_decoder(lut_size=None):
+    # decoder over the linear ramp encode_weights() uses, a few samples are exact since it is piecewise linear
+    ramp_weights = np.linspace(0.0, 1.0, 65, dtype=np.float32)
+    ramp_colors = weight_core.encode_weights(ramp_weights, "COLORMAP")[:, :3]
+    return weight_core.RgbWeightDecoder(ramp_weights, ramp_colors, weight_core.OFF_RAMP_COLORS, lut_size=lut_size)
+
+
+def unit_square():
+    # two triangles over the whole UV square, loops at the corners
+    loop_uvs = np.array([[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0]])
+    triangles = np.array([[0, 1, 2], [0, 2, 3]])
+    return loop_uvs, triangles
+
+
+def group_weights_of(names, group_ids, vertex_ids, weights, world):
+    offsets, indices, csr_weights = weight_core.build_group_csr(group_ids, vertex_ids, weights, len(names))
+    return {"names": names, "offsets": offsets, "indices": indices, "weights": csr_weights, "world": world}
+
+
+def test_colormap_round_trip():
+    weights = np.random.default_rng(0).random(1000, dtype=np.float32)
+    colors = weight_core.encode_weights(weights, "COLORMAP")
+
+    np.testing.assert_allclose(colormap_decoder().decode(colors), weights, atol=1e-5)
+    # the lookup table trades a little precision for speed
+    np.testing.assert_allclose(colormap_decoder(lut_size=32).decode(colors), weights, atol=5e-3)
+
+
+def test_colormap_ends_and_background():
+    assert weight_core.weight_to_rgb(0.0) == (0.0, 0.0, 1.0, 1.0)
+    assert weight_core.weight_to_rgb(1.0) == (1.0, 0.0, 0.0, 1.0)
+    # out of range weights are clamped, the black background decodes to 0.0
+    np.testing.assert_array_equal(weight_core.encode_weights([-1.0, 2.0], "COLORMAP")[:, :3], [[0, 0, 1], [1, 0, 0]])
+    assert colormap_decoder().decode([[0.0, 0.0, 0.0]])[0] == 0.0
+
+
+def test_weight_encoding_is_grey():
+    rgba = weight_core.encode_weights([0.25, 1.5], "WEIGHT")
+    np.testing.assert_array_equal(rgba, [[0.25, 0.25, 0.25, 1.0], [1.0, 1.0, 1.0, 1.0]])
+
+
+def test_rasterizer_interpolates_loop_weights():
+    loop_uvs, triangles = unit_square()
+    # weight = u, so every pixel holds the u of its center
+    image, covered = weight_core.rasterize_uv_weights(loop_uvs, triangles, loop_uvs[:, 0], 16)
+
+    centers = (np.arange(16) + 0.5) / 16
+    assert covered.all()
+    np.testing.assert_allclose(image, np.tile(centers, (16, 1)), atol=1e-6)
+
+
+def test_rasterizer_fills_pixel_centers_only():
+    # lower left triangle: pixel centers on or below the diagonal are inside
+    loop_uvs = np.array([[0.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
+    loop_weights = np.array([[1.0, 0.0], [1.0, 0.5], [1.0, 1.0]])
+    image, covered = weight_core.rasterize_uv_weights(loop_uvs, np.array([[0, 1, 2]]), loop_weights, 8,
+                                                      max_candidates=5)
+
+    rows, columns = np.indices((8, 8))
+    np.testing.assert_array_equal(covered, rows + columns <= 7)
+    # K groups come out as (H, W, K)
+    assert image.shape == (8, 8, 2)
+    np.testing.assert_array_equal(image[covered, 0], 1.0)
+    np.testing.assert_array_equal(image[~covered], 0.0)
+
+
+def test_rasterizer_without_triangles():
+    image, covered = weight_core.rasterize_uv_weights(np.zeros((0, 2)), np.zeros((0, 3), dtype=np.int64),
+                                                      np.zeros(0), 4)
+    assert image.shape == (4, 4) and not covered.any()
+
+
+def test_choose_bake_resolution():
+    loop_uvs, triangles = unit_square()
+    # 1024 vertices * 64 texels over the whole square is exactly 256 x 256
+    assert weight_core.choose_bake_resolution(loop_uvs, triangles, 1024) == 256
+    assert weight_core.choose_bake_resolution(loop_uvs, triangles, 1025) == 512
+    # a quarter of the square needs twice the side for the same texels per vertex
+    assert weight_core.choose_bake_resolution(loop_uvs / 2, triangles, 1024) == 512
+    assert weight_core.choose_bake_resolution(loop_uvs, triangles, 10 ** 7) == 2048
+    assert weight_core.choose_bake_resolution(loop_uvs, triangles, 1) == 256
+
+
+def test_choose_bake_resolution_without_area():
+    loop_uvs, triangles = unit_square()
+    assert weight_core.choose_bake_resolution(loop_uvs, triangles[:0], 1000, min_resolution=128) == 128
+    # every loop on one UV point covers nothing
+    assert weight_core.choose_bake_resolution(np.zeros((4, 2)), triangles, 1000, min_resolution=128) == 128
+
+
+def test_label_strands():
+    # two chains given out of order, and vertex 6 on its own
+    edges = np.array([[4, 5], [0, 1], [3, 4], [1, 2]])
+    strand_ids = weight_core.label_strands(edges, 7)
+    np.testing.assert_array_equal(strand_ids, [0, 0, 0, 1, 1, 1, 2])
+
+
+def test_label_strands_long_chain():
+    # a reversed chain needs the pointer jumping to reach the root
+    vertices = np.arange(1000)[::-1]
+    edges = np.stack([vertices[:-1], vertices[1:]], axis=1)
+    np.testing.assert_array_equal(weight_core.label_strands(edges, 1001), [0] * 1000 + [1])
+
+
+def test_get_group_statistics():
+    world = np.array([[0.0, 0.0, 0.0], [2.0, 0.0, 0.0], [0.0, 4.0, 0.0], [1.0, 1.0, 1.0]])
+    group_weights = group_weights_of(
+        ["A", "Empty", "B"], [0, 0, 2, 0], [0, 1, 3, 2], [1.0, 1.0, 0.5, 2.0], world
+    )
+    statistics = weight_core.get_group_statistics(group_weights, principal_axes=True)
+
+    assert statistics["names"] == ["A", "Empty", "B"]
+    np.testing.assert_allclose(statistics["total_weights"], [4.0, 0.0, 0.5])
+    np.testing.assert_allclose(statistics["centroids"][0], [0.5, 2.0, 0.0])
+    np.testing.assert_allclose(statistics["centroids"][2], [1.0, 1.0, 1.0])
+    np.testing.assert_allclose(statistics["bbox_min"][0], [0.0, 0.0, 0.0])
+    np.testing.assert_allclose(statistics["bbox_max"][0], [2.0, 4.0, 0.0])
+    # groups without weights are NaN throughout
+    for key in ("centroids", "bbox_min", "bbox_max", "variances"):
+        assert np.isnan(statistics[key][1]).all()
+    # A spreads along y most, and not at all along z
+    np.testing.assert_allclose(np.abs(statistics["axes"][0, 2]), [0.0, 0.0, 1.0], atol=1e-9)
+    assert statistics["variances"][0, 0] >= statistics["variances"][0, 1] > statistics["variances"][0, 2]
+
+
+@pytest.mark.parametrize("coordinates", [None, "override"])
+def test_get_group_statistics_coordinates(coordinates):
+    world = np.zeros((2, 3))
+    moved = np.array([[1.0, 2.0, 3.0], [3.0, 2.0, 1.0]])
+    group_weights = group_weights_of(["A"], [0, 0], [0, 1], [1.0, 1.0], world)
+    statistics = weight_core.get_group_statistics(group_weights, moved if coordinates else None)
+    np.testing.assert_allclose(statistics["centroids"][0], [2.0, 2.0, 2.0] if coordinates else [0.0, 0.0, 0.0])